@@ -0,0 +1,19 @@
+// 服务端到模型的路径：把请求转发给本地生成网关（scripts/gateway.py）
+const GATEWAY_URL = process.env.GEMINI_GATEWAY_URL ?? 'http://127.0.0.1:8787';
+
+export async function POST(request: Request): Promise<Response> {
+  try {
+    const res = await fetch(`${GATEWAY_URL}/generate`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: await request.text(),
+    });
+    // 网关过载时的 503 和 Retry-After 原样交给调用方
+    const headers = new Headers({ 'Content-Type': 'application/json; charset=utf-8' });
+    const retryAfter = res.headers.get('Retry-After');
+    if (retryAfter) headers.set('Retry-After', retryAfter);
+    return new Response(res.body, { status: res.status, headers });
+  } catch {
+    return Response.json({ error: { code: 502, message: '生成网关不可用' } }, { status: 502 });
+  }
+}
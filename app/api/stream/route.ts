@@ -0,0 +1,22 @@
+// 流式生成：把本地生成网关（scripts/gateway.py）的 SSE 响应原样转发
+const GATEWAY_URL = process.env.GEMINI_GATEWAY_URL ?? 'http://127.0.0.1:8787';
+
+export async function POST(request: Request): Promise<Response> {
+  try {
+    const res = await fetch(`${GATEWAY_URL}/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: await request.text(),
+      signal: request.signal,
+    });
+    const headers = new Headers({
+      'Content-Type': res.headers.get('Content-Type') ?? 'text/event-stream; charset=utf-8',
+      'Cache-Control': 'no-cache',
+    });
+    const retryAfter = res.headers.get('Retry-After');
+    if (retryAfter) headers.set('Retry-After', retryAfter);
+    return new Response(res.body, { status: res.status, headers });
+  } catch {
+    return Response.json({ error: { code: 502, message: '生成网关不可用' } }, { status: 502 });
+  }
+}
@@ -2,15 +2,34 @@
 
 import { useSearchParams } from 'next/navigation';
 import Link from 'next/link';
-import { Suspense } from 'react';
+import { Suspense, useEffect, useState } from 'react';
 import { archetypes } from '@/content/archetypes';
+import { loadPrecomputedResult } from '@/content/precomputed';
 
 function ResultContent() {
   const searchParams = useSearchParams();
   const archetypeId = searchParams.get('archetype') || 'overload';
+  const moduleId = searchParams.get('module');
+  const answers = searchParams.get('answers');
 
   const archetype = archetypes[archetypeId];
 
+  // 预生成的个性化文案（按答题路径查表，没有时只显示原型文案）
+  const [personalized, setPersonalized] = useState<string | null>(null);
+
+  useEffect(() => {
+    if (!moduleId || !answers) return;
+    let cancelled = false;
+    loadPrecomputedResult(moduleId, answers.split(',')).then(result => {
+      if (!cancelled && result && result.archetype === archetypeId) {
+        setPersonalized(result.text);
+      }
+    });
+    return () => {
+      cancelled = true;
+    };
+  }, [moduleId, answers, archetypeId]);
+
   if (!archetype) {
     return (
       <div className="bg-cyber min-h-screen flex items-center justify-center">
@@ -39,6 +58,15 @@ function ResultContent() {
             </p>
           </div>
 
+          {/* 个性化文案 - 离线预生成，对应用户的具体回答 */}
+          {personalized && (
+            <div className="animate-fade-in-delay mb-16">
+              <p className="result-allow">
+                {personalized}
+              </p>
+            </div>
+          )}
+
           {/* 允许句 - 给身体发通行证 */}
           <div className="animate-fade-in-delay mb-16">
             <p className="result-allow">
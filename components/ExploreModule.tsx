@@ -46,8 +46,10 @@ export default function ExploreModule({ moduleId }: ExploreModuleProps) {
       const archetypeId = calculateArchetype(moduleId, newAnswers);
       setIsTransitioning(true);
 
+      const optionIds = newAnswers.map(a => a.optionId).join(',');
+
       setTimeout(() => {
-        router.push(`/result?module=${moduleId}&archetype=${archetypeId}`);
+        router.push(`/result?module=${moduleId}&archetype=${archetypeId}&answers=${optionIds}`);
       }, 800);
     } else {
       // 下一题
@@ -0,0 +1,38 @@
+// 离线预生成的结果页文案（scripts/precompute_results.py 生成 public/precomputed/results.json）
+export interface PrecomputedResult {
+  archetype: string;
+  text: string;
+}
+
+export interface PrecomputedResults {
+  version: number;
+  model: string;
+  results: Record<string, PrecomputedResult>;
+}
+
+export const PRECOMPUTED_URL = '/precomputed/results.json';
+
+// 查表用的键，与 precompute_results.py 中 result_key 一致
+export function resultKey(moduleId: string, optionIds: string[]): string {
+  return `${moduleId}:${optionIds.join(',')}`;
+}
+
+let cache: Promise<PrecomputedResults | null> | null = null;
+
+// 整个文件只加载一次；文件不存在或加载失败时返回 null，结果页退回到原型的固定文案
+function loadPrecomputedResults(): Promise<PrecomputedResults | null> {
+  if (!cache) {
+    cache = fetch(PRECOMPUTED_URL)
+      .then(res => (res.ok ? (res.json() as Promise<PrecomputedResults>) : null))
+      .catch(() => null);
+  }
+  return cache;
+}
+
+export async function loadPrecomputedResult(
+  moduleId: string,
+  optionIds: string[]
+): Promise<PrecomputedResult | null> {
+  const data = await loadPrecomputedResults();
+  return data?.results[resultKey(moduleId, optionIds)] ?? null;
+}
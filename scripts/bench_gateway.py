@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+网关压测 - 在本地模拟上游上验证准入控制
+
+启动模拟服务器和网关（都在本进程内），按不同的并发客户端数持续请求 POST /generate：
+1. 低于网关并发上限：全部成功，延迟接近上游延迟
+2. 超过并发上限但在队列容量内：全部成功，多出的部分在队列中等待
+3. 远超并发上限 + 队列：超出部分快速得到 503 + Retry-After，已受理请求的延迟保持有界
+
+使用方法：
+    python scripts/bench_gateway.py --concurrency 8 --max-queue 16 --latency 0.05 --duration 3
+"""
+
+import time
+import argparse
+import threading
+
+import requests
+
+from gemini_http import GeminiHttpClient
+from gateway import Gateway, AdmissionController, start_gateway
+from mock_gemini_server import MockConfig, start_mock_server
+from retry_policy import percentile
+
+
+def smoke_test(base_url: str):
+    """检查 /healthz、/generate、/stream 和 /metrics 都能正常返回"""
+    health = requests.get(f"{base_url}/healthz", timeout=5)
+    health.raise_for_status()
+    result = requests.post(f"{base_url}/generate", json={"prompt": "你好"}, timeout=10)
+    result.raise_for_status()
+    events = []
+    with requests.post(f"{base_url}/stream", json={"prompt": "你好"}, stream=True, timeout=10) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line.startswith(b'data: '):
+                events.append(line)
+    if not events or b'"done": true' not in events[-1]:
+        raise RuntimeError(f"流式响应没有结束事件: {events[-1:]}")
+    metrics = requests.get(f"{base_url}/metrics", timeout=5)
+    metrics.raise_for_status()
+    print(f"✓ 接口检查通过（/stream 收到 {len(events)} 个事件）")
+
+
+def run_phase(base_url: str, clients: int, duration: float) -> dict:
+    """clients 个客户端线程持续请求 duration 秒，返回状态码计数和延迟分位"""
+    ok_latencies, rejected_latencies, retry_afters, errors = [], [], [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(index: int):
+        session = requests.Session()
+        sequence = 0
+        while time.perf_counter() < deadline:
+            sequence += 1
+            start = time.perf_counter()
+            try:
+                response = session.post(
+                    f"{base_url}/generate", json={"prompt": f"客户端 {index} 请求 {sequence}"}, timeout=30
+                )
+            except requests.exceptions.RequestException as e:
+                with lock:
+                    errors.append(e)
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                if response.status_code == 200:
+                    ok_latencies.append(elapsed)
+                elif response.status_code == 503:
+                    rejected_latencies.append(elapsed)
+                    retry_afters.append(int(response.headers.get('Retry-After', 0)))
+                else:
+                    errors.append(response.status_code)
+            if response.status_code == 503:
+                # 压测中不按 Retry-After 等待，只稍作退避，保持对网关的压力
+                time.sleep(0.05)
+        session.close()
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return {
+        'ok': len(ok_latencies),
+        'rejected': len(rejected_latencies),
+        'errors': len(errors),
+        'throughput': len(ok_latencies) / duration,
+        'p50': percentile(ok_latencies, 50) if ok_latencies else 0.0,
+        'p99': percentile(ok_latencies, 99) if ok_latencies else 0.0,
+        'reject_p99': percentile(rejected_latencies, 99) if rejected_latencies else 0.0,
+        'retry_after': max(retry_afters) if retry_afters else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="网关准入控制压测")
+    parser.add_argument('--concurrency', type=int, default=8, help="网关的并发上限")
+    parser.add_argument('--max-queue', type=int, default=16, help="网关的等待队列长度")
+    parser.add_argument('--queue-timeout', type=float, default=2.0, help="网关的最长排队秒数")
+    parser.add_argument('--latency', type=float, default=0.05, help="模拟上游的延迟（秒）")
+    parser.add_argument('--duration', type=float, default=3.0, help="每个阶段的持续秒数")
+    args = parser.parse_args()
+
+    mock, mock_url = start_mock_server(config=MockConfig(latency=args.latency))
+    client = GeminiHttpClient(base_url=mock_url, pool_maxsize=args.concurrency)
+    admission = AdmissionController(args.concurrency, args.max_queue, args.queue_timeout)
+    gateway = Gateway(client, admission, api_key="mock-key")
+    server, base_url = start_gateway(gateway)
+    print(f"✓ 网关: {base_url}  上游: {mock_url}（延迟 {args.latency * 1000:.0f}ms）")
+    print(f"  并发上限: {args.concurrency}  队列: {args.max_queue}  排队超时: {args.queue_timeout}s")
+
+    smoke_test(base_url)
+
+    capacity = args.concurrency + args.max_queue
+    phases = [
+        ("低于并发上限", max(1, args.concurrency // 2)),
+        ("队列容量内", capacity),
+        ("过载", capacity * 4),
+    ]
+    results = []
+    for name, clients in phases:
+        handled_before = mock.counters['handled']
+        result = run_phase(base_url, clients, args.duration)
+        result['upstream'] = mock.counters['handled'] - handled_before
+        results.append((name, clients, result))
+
+    stats = admission.stats()
+    server.shutdown()
+    mock.shutdown()
+
+    print("\n" + "=" * 60)
+    print("📊 网关压测结果")
+    print("=" * 60)
+    print(f"{'阶段':<10}{'客户端':>6}{'成功':>8}{'503':>8}{'其他错误':>8}{'吞吐/s':>9}"
+          f"{'p50(ms)':>10}{'p99(ms)':>10}{'503 p99':>10}{'Retry-After':>12}{'上游请求':>8}")
+    for name, clients, r in results:
+        print(f"{name:<10}{clients:>6}{r['ok']:>8}{r['rejected']:>8}{r['errors']:>8}{r['throughput']:>9.1f}"
+              f"{r['p50']:>10.1f}{r['p99']:>10.1f}{r['reject_p99']:>10.1f}{r['retry_after']:>12}{r['upstream']:>8}")
+    print("-" * 60)
+    print(f"最大在途: {stats['max_active']}（上限 {args.concurrency}）  最大排队: {stats['max_queued']}"
+          f"（上限 {args.max_queue}）")
+    print(f"拒绝: 队列满 {stats['rejected_queue_full']}  排队超时 {stats['rejected_queue_timeout']}")
+    theoretical = args.concurrency / args.latency
+    print(f"上游理论吞吐: {theoretical:.0f}/s")
+
+
+if __name__ == "__main__":
+    main()
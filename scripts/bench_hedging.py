@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+重试与对冲基准测试 - 在注入慢响应和 503 的模拟服务器上对比尾延迟与成功率
+
+对比三种配置：
+1. 不重试、不对冲
+2. 只重试（指数退避 + 抖动）
+3. 重试 + 对冲（超过 p95 仍未返回时再发一份）
+
+使用方法：
+    python scripts/bench_hedging.py --requests 600 --slow-fraction 0.03 --error-rate 0.02
+"""
+
+import time
+import argparse
+import threading
+
+from gemini_http import GeminiHttpClient, build_payload
+from mock_gemini_server import MockConfig, start_mock_server
+from retry_policy import RetryPolicy, HedgePolicy, percentile
+
+
+def run(client: GeminiHttpClient, server, count: int, concurrency: int) -> dict:
+    """用 concurrency 个线程发送 count 个请求，返回延迟分位与成功率"""
+    latencies, failures = [], []
+    lock = threading.Lock()
+    remaining = iter(range(count))
+    handled_before = server.counters['handled']
+
+    def worker():
+        while True:
+            with lock:
+                index = next(remaining, None)
+            if index is None:
+                return
+            start = time.perf_counter()
+            try:
+                client.generate_content("gemini-2.5-flash", build_payload(f"提示 {index}"), api_key="mock-key")
+                with lock:
+                    latencies.append((time.perf_counter() - start) * 1000)
+            except Exception as e:
+                with lock:
+                    failures.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 等待被丢弃的对冲请求结束，让服务端计数完整
+    time.sleep(0.5)
+
+    return {
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'max': max(latencies),
+        'success': len(latencies) / count * 100,
+        'upstream': server.counters['handled'] - handled_before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重试与对冲基准测试")
+    parser.add_argument('--requests', type=int, default=600)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.02, help="正常响应延迟（秒）")
+    parser.add_argument('--slow-fraction', type=float, default=0.03, help="慢响应比例")
+    parser.add_argument('--slow-latency', type=float, default=1.0, help="慢响应延迟（秒）")
+    parser.add_argument('--error-rate', type=float, default=0.02, help="返回 503 的比例")
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(config=MockConfig(
+        latency=args.latency,
+        slow_fraction=args.slow_fraction,
+        slow_latency=args.slow_latency,
+        error_rate=args.error_rate
+    ))
+
+    print("=" * 72)
+    print("🧪 重试与对冲基准测试")
+    print("=" * 72)
+    print(f"请求数: {args.requests}  并发: {args.concurrency}  "
+          f"慢响应: {args.slow_fraction * 100:.0f}% × {args.slow_latency * 1000:.0f}ms  "
+          f"503: {args.error_rate * 100:.0f}%")
+
+    configs = [
+        ("无重试 / 无对冲", None, None),
+        ("重试", RetryPolicy(max_attempts=4, base_delay=0.05), None),
+        ("重试 + 对冲 p95", RetryPolicy(max_attempts=4, base_delay=0.05), HedgePolicy(percentile=95)),
+    ]
+    results = []
+    try:
+        for label, retry_policy, hedge_policy in configs:
+            client = GeminiHttpClient(base_url=base_url, pool_maxsize=args.concurrency * 2)
+            client.retry_policy = retry_policy
+            client.hedge_policy = hedge_policy
+            results.append((label, run(client, server, args.requests, args.concurrency)))
+            client.close()
+    finally:
+        server.shutdown()
+
+    print(f"\n{'配置':<18}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'成功率':>9}{'上游请求':>10}")
+    print("-" * 73)
+    for label, r in results:
+        print(f"{label:<18}{r['p50']:>9.1f}{r['p95']:>9.1f}{r['p99']:>9.1f}{r['max']:>9.1f}"
+              f"{r['success']:>8.1f}%{r['upstream']:>10}")
+    print("（延迟单位 ms，只统计成功的请求）")
+
+    baseline_p99, hedged_p99 = results[1][1]['p99'], results[2][1]['p99']
+    print(f"\n✅ 对冲使 p99 从 {baseline_p99:.0f}ms 降到 {hedged_p99:.0f}ms "
+          f"（-{(1 - hedged_p99 / baseline_p99) * 100:.0f}%），"
+          f"多发请求 {results[2][1]['upstream'] - results[1][1]['upstream']} 个")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+连接池基准测试 - 对比模块级 requests.post 与共享连接池的单请求延迟
+
+在本地启动一个 HTTPS 模拟服务器（自签名证书），
+分别用两种方式发送相同数量的 generateContent 请求：
+1. requests.post(...)：每次新建 TCP + TLS 连接
+2. GeminiHttpClient：复用连接池中的 keep-alive 连接
+
+使用方法：
+    python scripts/bench_http_pool.py --requests 200
+"""
+
+import time
+import argparse
+import statistics
+
+import requests
+
+from gemini_http import GeminiHttpClient, API_VERSION, auth_headers, build_payload
+from mock_gemini_server import MockConfig, start_mock_server
+from retry_policy import percentile
+
+
+def run(label: str, send, count: int) -> dict:
+    """发送 count 个请求并统计单请求延迟（毫秒）"""
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = send()
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        'label': label,
+        'mean': statistics.mean(latencies),
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="连接池基准测试")
+    parser.add_argument('--requests', type=int, default=200, help="每种方式发送的请求数")
+    parser.add_argument('--latency', type=float, default=0.0, help="模拟服务器的固定延迟（秒）")
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(config=MockConfig(latency=args.latency), tls=True)
+    url = f"{base_url}/{API_VERSION}/models/gemini-2.5-flash:generateContent"
+    payload = build_payload("请用一句话解释什么是人工智能。")
+    headers = auth_headers("mock-token")
+
+    print("=" * 60)
+    print("🧪 连接池基准测试（本地 HTTPS 模拟服务器）")
+    print("=" * 60)
+    print(f"服务器: {base_url}")
+    print(f"请求数: {args.requests}")
+
+    try:
+        without_pool = run(
+            "requests.post（无连接池）",
+            lambda: requests.post(url, headers=headers, json=payload, verify=server.cert_path, timeout=10),
+            args.requests
+        )
+
+        client = GeminiHttpClient(base_url=base_url, verify=server.cert_path)
+        # 预热：建立第一条连接
+        client.post(url, headers=headers, json=payload).raise_for_status()
+        with_pool = run(
+            "GeminiHttpClient（连接池）",
+            lambda: client.post(url, headers=headers, json=payload),
+            args.requests
+        )
+        client.close()
+    finally:
+        server.shutdown()
+
+    print(f"\n{'方式':<28}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}  (ms)")
+    print("-" * 64)
+    for result in (without_pool, with_pool):
+        print(
+            f"{result['label']:<28}{result['mean']:>9.2f}{result['p50']:>9.2f}"
+            f"{result['p95']:>9.2f}{result['p99']:>9.2f}"
+        )
+    print(f"\n✅ 平均延迟降低: {(1 - with_pool['mean'] / without_pool['mean']) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+导入耗时基准 - 检查每个 CLI 入口的启动代价是否在预算之内
+
+对每个入口执行 `python -X importtime -c "import <模块>"`，重复多次取中位数，报告：
+- 入口模块的累计导入耗时
+- 耗时最多的几个依赖
+- 是否在模块加载时就导入了应当按需加载的重型依赖（google.generativeai、google.auth、requests）
+
+预算保存在 import_budget.json，超出预算或提前导入重型依赖时以退出码 1 结束（可用于 CI）。
+
+使用方法：
+    python scripts/bench_imports.py                  # 报告并检查预算
+    python scripts/bench_imports.py --repeat 9       # 重复更多次，结果更稳定
+    python scripts/bench_imports.py --write-budget   # 按本机结果重新生成预算
+"""
+
+import os
+import sys
+import json
+import math
+import argparse
+import statistics
+import subprocess
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BUDGET = os.path.join(SCRIPT_DIR, 'import_budget.json')
+
+ENTRY_POINTS = [
+    'gemini_api_example',
+    'gemini_service_account',
+    'gemini_simple_example',
+    'gemini_with_dotenv',
+    'list_models',
+    'diagnose_and_fix',
+    'test_and_run',
+    'batch_generate',
+    'gemini_async',
+    'precompute_results',
+    'generate_content',
+    'batch_jobs',
+    'gateway',
+]
+
+# 入口模块加载时不应导入的重型依赖（按需导入）
+LAZY_MODULES = ['google.generativeai', 'google.auth', 'requests']
+
+
+def parse_importtime(stderr: str) -> list:
+    """
+    解析 -X importtime 输出
+
+    Returns:
+        list: [(模块名, 自身耗时 us, 累计耗时 us, 嵌套深度)]
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        self_us, cumulative_us, raw_name = int(parts[0]), int(parts[1]), parts[2]
+        stripped = raw_name.lstrip(' ')
+        depth = (len(raw_name) - len(stripped) - 1) // 2
+        entries.append((stripped, self_us, cumulative_us, depth))
+    return entries
+
+
+def measure(module: str) -> dict:
+    """导入一次模块，返回累计耗时与依赖明细"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=SCRIPT_DIR,
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, PYTHONDONTWRITEBYTECODE='')
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{result.stderr[-2000:]}")
+    entries = parse_importtime(result.stderr)
+    total = next(cumulative for name, _, cumulative, depth in reversed(entries)
+                 if name == module and depth == 0)
+    # 入口模块直接导入的依赖（深度 1），按累计耗时排序
+    children = []
+    found = False
+    # importtime 先打印子模块再打印父模块，倒序遍历时入口模块之后紧跟它的依赖
+    for name, _, cumulative, depth in reversed(entries):
+        if not found:
+            found = depth == 0 and name == module
+            continue
+        if depth == 0:
+            break
+        if depth == 1:
+            children.append((name, cumulative))
+    loaded = {name for name, _, _, _ in entries}
+    return {
+        'total_us': total,
+        'heaviest': sorted(children, key=lambda item: item[1], reverse=True)[:3],
+        'eager_heavy': [
+            lazy for lazy in LAZY_MODULES
+            if any(name == lazy or name.startswith(lazy + '.') for name in loaded)
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CLI 入口导入耗时基准")
+    parser.add_argument('--repeat', type=int, default=5, help="每个入口重复测量的次数")
+    parser.add_argument('--budget', default=DEFAULT_BUDGET, help="预算 JSON 路径")
+    parser.add_argument('--write-budget', action='store_true', help="按本次结果生成预算（中位数 × 1.5 + 20ms）")
+    parser.add_argument('--output', help="把结果写入 JSON 文件")
+    parser.add_argument('entry_points', nargs='*', help="只测量这些入口模块")
+    args = parser.parse_args()
+
+    modules = args.entry_points or ENTRY_POINTS
+    budget = {}
+    if os.path.exists(args.budget) and not args.write_budget:
+        with open(args.budget, 'r', encoding='utf-8') as f:
+            budget = json.load(f).get('budget_ms', {})
+
+    print("=" * 78)
+    print(f"⏱  CLI 入口导入耗时（-X importtime，{args.repeat} 次中位数）")
+    print("=" * 78)
+    print(f"{'入口':<26}{'耗时(ms)':>10}{'预算(ms)':>10}  {'最重的依赖'}")
+    print("-" * 78)
+
+    results, failures = {}, []
+    for module in modules:
+        # 第一次运行会写入 __pycache__，不计入结果
+        measure(module)
+        runs = [measure(module) for _ in range(args.repeat)]
+        median_ms = statistics.median(run['total_us'] for run in runs) / 1000
+        heaviest = runs[-1]['heaviest']
+        eager = runs[-1]['eager_heavy']
+        limit = budget.get(module)
+        results[module] = {
+            'median_ms': round(median_ms, 2),
+            'budget_ms': limit,
+            'heaviest': [{'module': name, 'ms': round(us / 1000, 2)} for name, us in heaviest],
+            'eager_heavy': eager,
+        }
+
+        status = ""
+        if limit is not None and median_ms > limit:
+            status = "  ❌ 超出预算"
+            failures.append(f"{module}: {median_ms:.1f}ms > {limit}ms")
+        if eager:
+            status += f"  ❌ 提前导入 {', '.join(eager)}"
+            failures.append(f"{module}: 模块加载时导入了 {', '.join(eager)}")
+        heavy_text = ', '.join(f"{name} {us / 1000:.0f}" for name, us in heaviest)
+        limit_text = f"{limit:.0f}" if limit is not None else "-"
+        print(f"{module:<26}{median_ms:>10.1f}{limit_text:>10}  {heavy_text}{status}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n✓ 结果已写入: {args.output}")
+
+    if args.write_budget:
+        new_budget = {
+            module: int(math.ceil((result['median_ms'] * 1.5 + 20) / 10) * 10)
+            for module, result in results.items()
+        }
+        with open(args.budget, 'w', encoding='utf-8') as f:
+            json.dump({'budget_ms': new_budget}, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f"\n✓ 预算已写入: {args.budget}")
+        return
+
+    if failures:
+        print("\n❌ 导入耗时检查未通过：")
+        for failure in failures:
+            print(f"   - {failure}")
+        sys.exit(1)
+    print("\n✅ 所有入口都在预算之内")
+
+
+if __name__ == "__main__":
+    main()
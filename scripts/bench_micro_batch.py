@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+微批处理压测 - 在本地模拟上游上对比逐条请求和合并请求
+
+启动模拟服务器（本进程内），--clients 个调用方线程各自逐条生成短提示，
+上游同时在途的请求数都限制为 --concurrency：
+1. 逐条：每条提示一个请求
+2. 合并：经过 MicroBatcher，窗口内的提示合并成一个结构化输出请求
+3. 合并 + 损坏：随机把合并回答中的部分元素清空，验证这些条目退回单独请求后仍然拿到结果
+
+报告上游请求数、耗时、每条的端到端延迟以及合并带来的窗口等待。
+模拟上游的延迟与请求大小无关，真实模型的输出时间随合并后的总 token 数增长，收益会小一些。
+
+使用方法：
+    python scripts/bench_micro_batch.py --items 400 --clients 32 --pack 8 --latency 0.05
+"""
+
+import json
+import time
+import random
+import argparse
+import threading
+
+from content_pipeline import Generator
+from gemini_http import GeminiHttpClient, build_payload
+from micro_batch import MicroBatcher
+from mock_gemini_server import MockConfig, start_mock_server
+from retry_policy import percentile
+
+
+class LimitedGenerator:
+    """限制同时在途的上游请求数，逐条模式和合并模式用同一个上限"""
+
+    def __init__(self, generator, concurrency: int, corrupt_rate: float = 0.0):
+        self.generator = generator
+        self.semaphore = threading.Semaphore(concurrency)
+        self.corrupt_rate = corrupt_rate
+
+    def generate(self, payload: dict) -> str:
+        with self.semaphore:
+            text = self.generator.generate(payload)
+        if self.corrupt_rate and 'responseSchema' in payload.get('generationConfig', {}):
+            answers = json.loads(text)
+            text = json.dumps([
+                "" if random.random() < self.corrupt_rate else answer for answer in answers
+            ], ensure_ascii=False)
+        return text
+
+
+def run_mode(generate, items: int, clients: int) -> dict:
+    """clients 个线程分摊 items 条提示，逐条同步生成"""
+    latencies, errors = [], []
+    lock = threading.Lock()
+    counter = iter(range(items))
+
+    def worker():
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            start = time.perf_counter()
+            try:
+                text = generate(f"请用一句话回答第 {index} 个问题。")
+                if not text:
+                    raise ValueError("空回答")
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+                continue
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        'ok': len(latencies),
+        'errors': len(errors),
+        'elapsed': elapsed,
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="微批处理压测")
+    parser.add_argument('--items', type=int, default=400, help="每种模式生成的条数")
+    parser.add_argument('--clients', type=int, default=32, help="调用方线程数")
+    parser.add_argument('--concurrency', type=int, default=4, help="上游同时在途的请求数")
+    parser.add_argument('--pack', type=int, default=8, help="每个合并请求最多的条数")
+    parser.add_argument('--pack-wait', type=float, default=0.02, help="合并窗口的最长等待秒数")
+    parser.add_argument('--latency', type=float, default=0.05, help="模拟上游的延迟（秒）")
+    parser.add_argument('--corrupt-rate', type=float, default=0.1, help="第 3 种模式中被清空的回答比例")
+    args = parser.parse_args()
+
+    mock, mock_url = start_mock_server(config=MockConfig(latency=args.latency))
+    generator = Generator(api_key="mock-key", tag='bench_micro_batch')
+    generator.client = GeminiHttpClient(base_url=mock_url, pool_maxsize=args.concurrency)
+    print(f"✓ 上游: {mock_url}（延迟 {args.latency * 1000:.0f}ms，在途上限 {args.concurrency}）")
+    print(f"  {args.items} 条 / {args.clients} 个调用方  每批最多 {args.pack} 条  窗口 {args.pack_wait * 1000:.0f}ms")
+
+    results = []
+
+    direct = LimitedGenerator(generator, args.concurrency)
+    handled_before = mock.counters['handled']
+    result = run_mode(lambda prompt: direct.generate(build_payload(prompt)), args.items, args.clients)
+    result['upstream'] = mock.counters['handled'] - handled_before
+    result['stats'] = None
+    results.append(("逐条", result))
+
+    for name, corrupt_rate in (("合并", 0.0), ("合并 + 损坏", args.corrupt_rate)):
+        limited = LimitedGenerator(generator, args.concurrency, corrupt_rate)
+        handled_before = mock.counters['handled']
+        with MicroBatcher(limited, max_items=args.pack, max_wait=args.pack_wait,
+                          concurrency=args.concurrency) as batcher:
+            result = run_mode(batcher.generate, args.items, args.clients)
+        result['upstream'] = mock.counters['handled'] - handled_before
+        result['stats'] = batcher.stats()
+        results.append((name, result))
+
+    mock.shutdown()
+
+    print("\n" + "=" * 60)
+    print("📊 微批处理压测结果")
+    print("=" * 60)
+    print(f"{'模式':<12}{'成功':>6}{'失败':>6}{'上游请求':>9}{'减少':>8}{'吞吐/s':>9}"
+          f"{'p50(ms)':>10}{'p99(ms)':>10}{'平均批':>8}{'退回':>6}{'等待p50':>9}{'等待p99':>9}")
+    for name, r in results:
+        reduction = 1 - r['upstream'] / args.items
+        throughput = r['ok'] / r['elapsed'] if r['elapsed'] else 0.0
+        line = (f"{name:<12}{r['ok']:>6}{r['errors']:>6}{r['upstream']:>9}{reduction:>8.0%}{throughput:>9.1f}"
+                f"{r['p50']:>10.1f}{r['p99']:>10.1f}")
+        stats = r['stats']
+        if stats:
+            delay = stats['queue_delay_ms']
+            line += (f"{stats['mean_batch_size']:>8.1f}{stats['fallback_items']:>6}"
+                     f"{delay['p50']:>9.1f}{delay['p99']:>9.1f}")
+        print(line)
+    print("-" * 60)
+    print("减少 = 1 - 上游请求数 / 条数；等待 = 提示在合并窗口中停留的时间（ms）")
+
+
+if __name__ == "__main__":
+    main()
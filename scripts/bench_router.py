@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+模型路由演练 - 在本地模拟上游上验证路由策略和故障转移
+
+启动模拟服务器（本进程内），用 model="auto" 发送混合流量，依次经历四个阶段：
+1. 正常：短提示走快速模型，长提示和 high 优先级走高质量模型
+2. 高质量模型变慢（延迟超过 SLO）：high 优先级请求改走快速模型（slo_exceeded）
+3. 快速模型全部返回 503：请求内改用高质量模型，随后快速模型被标记为降级（failover_degraded），请求仍全部成功
+4. 恢复：冷却结束后快速模型重新得到请求
+
+每个阶段结束时打印各模型的请求数、决策原因和 EWMA，最后输出 /metrics 中的路由指标。
+
+使用方法：
+    python scripts/bench_router.py --requests 120 --slo 0.2 --cooldown 1
+"""
+
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from gemini_http import GeminiHttpClient, build_payload
+from model_router import ModelRouter, AUTO_MODEL, FAST_MODEL, QUALITY_MODEL, routed_model
+from mock_gemini_server import MockConfig, start_mock_server
+from retry_policy import RetryPolicy
+
+LONG_PROMPT = "请总结下面的材料。" + "材料内容。" * 2000
+
+
+def run_phase(client: GeminiHttpClient, requests: int, concurrency: int) -> dict:
+    """按 6:2:1:1 的比例发送普通短提示、长提示、high 和 low 优先级请求"""
+    counts, errors = {}, []
+    lock = threading.Lock()
+    kinds = ['short'] * 6 + ['long'] * 2 + ['high', 'low']
+
+    def send(index: int):
+        kind = random.choice(kinds)
+        prompt = LONG_PROMPT if kind == 'long' else f"第 {index} 个问题"
+        priority = kind if kind in ('high', 'low') else None
+        try:
+            result = client.generate_content(
+                AUTO_MODEL, build_payload(prompt), api_key="mock-key", use_cache=False, priority=priority
+            )
+        except Exception as e:
+            with lock:
+                errors.append(e)
+            return
+        model = routed_model(AUTO_MODEL, result)
+        with lock:
+            counts[model] = counts.get(model, 0) + 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, range(requests)))
+    return {'models': counts, 'errors': len(errors)}
+
+
+def diff(after: dict, before: dict) -> dict:
+    return {key: value - before.get(key, 0) for key, value in after.items() if value - before.get(key, 0)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模型路由演练")
+    parser.add_argument('--requests', type=int, default=120, help="每个阶段的请求数")
+    parser.add_argument('--concurrency', type=int, default=4, help="并发请求数")
+    parser.add_argument('--latency', type=float, default=0.02, help="模拟上游的正常延迟（秒）")
+    parser.add_argument('--slo', type=float, default=0.2, help="路由的延迟 SLO（秒）")
+    parser.add_argument('--cooldown', type=float, default=1.0, help="降级后的冷却秒数")
+    args = parser.parse_args()
+
+    config = MockConfig(latency=args.latency)
+    mock, mock_url = start_mock_server(config=config)
+    client = GeminiHttpClient(base_url=mock_url, pool_maxsize=args.concurrency)
+    client.retry_policy = RetryPolicy(max_attempts=2, base_delay=0.01)
+    client.model_router = ModelRouter(
+        (FAST_MODEL, QUALITY_MODEL), latency_slo=args.slo, cooldown=args.cooldown, long_prompt_tokens=2000
+    )
+    router = client.model_router
+    print(f"✓ 上游: {mock_url}  SLO: {args.slo * 1000:.0f}ms  冷却: {args.cooldown}s")
+
+    phases = [
+        ("正常", lambda: None),
+        (f"{QUALITY_MODEL} 变慢", lambda: config.model_latency.update({QUALITY_MODEL: args.slo * 2})),
+        (f"{FAST_MODEL} 故障", lambda: (
+            config.model_latency.clear(), config.model_error_rate.update({FAST_MODEL: 1.0})
+        )),
+        ("恢复", lambda: (config.model_error_rate.clear(), time.sleep(args.cooldown * 1.5))),
+    ]
+    results = []
+    for name, setup in phases:
+        setup()
+        before = router.stats()
+        result = run_phase(client, args.requests, args.concurrency)
+        after = router.stats()
+        result['decisions'] = diff(after['decisions'], before['decisions'])
+        result['failovers'] = diff(after['failovers'], before['failovers'])
+        result['health'] = after['models']
+        results.append((name, result))
+
+    mock.shutdown()
+
+    print("\n" + "=" * 60)
+    print("📊 模型路由演练结果")
+    print("=" * 60)
+    for name, r in results:
+        served = "  ".join(f"{model} {count}" for model, count in sorted(r['models'].items()))
+        print(f"\n▶ {name}：成功 {sum(r['models'].values())}  失败 {r['errors']}  （{served}）")
+        for decision, count in sorted(r['decisions'].items(), key=lambda item: -item[1]):
+            print(f"  决策 {decision}: {count}")
+        for failover, count in r['failovers'].items():
+            print(f"  请求内改用 {failover}: {count}")
+        for model, health in r['health'].items():
+            latency = f"{health['latency_ewma'] * 1000:.0f}ms" if health['latency_ewma'] is not None else "-"
+            state = "✓" if health['healthy'] else f"⚠️  冷却 {health['cooldown_remaining']}s"
+            print(f"  {model}: 延迟 EWMA {latency}  错误率 EWMA {health['error_rate_ewma']:.2f}  {state}")
+    print("-" * 60)
+    print("📋 /metrics 中的路由指标：")
+    for line in router.to_prometheus().splitlines():
+        if not line.startswith('#'):
+            print(f"  {line}")
+
+
+if __name__ == "__main__":
+    main()
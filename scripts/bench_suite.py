@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+离线基准测试套件 - 在本地模拟服务器上测量每条调用路径的性能
+
+覆盖的调用路径：
+- call_gemini（gemini_simple_example）
+- call_gemini_with_rest_api（gemini_service_account）
+- call_gemini_api_with_service_account（gemini_api_example）
+- list_models（list_models）
+
+每条路径测量：
+1. 冷启动：清空凭证与令牌缓存后的第一次调用（多次取中位数）
+2. 分阶段延迟：凭证加载 / 令牌 / HTTP / 解析 / 其他（来自 tracing 的 span）
+3. 不同并发下的吞吐量（请求/秒）
+4. 峰值内存（tracemalloc，Python 分配）
+
+每条路径重复测量 --repeat 轮，每个指标取各轮的中位数，单轮的抖动不会被当成退化。
+结果写成 JSON，并可与保存的基线对比，超出容差的退化会被标出。
+
+使用方法：
+    python scripts/bench_suite.py                              # 运行并与 bench_baseline.json 对比
+    python scripts/bench_suite.py --latency-dist lognormal:0.02,0.5 --error-rate 0.01
+    python scripts/bench_suite.py --save-baseline              # 把本次结果保存为新基线
+    python scripts/bench_suite.py --fail-on-regression         # 有退化时退出码为 1（用于 CI）
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import threading
+import statistics
+import tracemalloc
+import contextlib
+from datetime import datetime
+
+import tracing
+from mock_gemini_server import MockConfig, start_mock_server, make_fake_service_account
+from retry_policy import percentile
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+PROMPT = "请用一句话解释什么是人工智能。"
+MODEL = "gemini-2.5-flash"
+STAGES = ('credentials', 'token', 'http', 'parse', 'other')
+# span 名称 -> 阶段
+STAGE_SPANS = {
+    'load_credentials': 'credentials',
+    'get_access_token': 'token',
+    'http.request': 'http',
+    'parse_response': 'parse',
+}
+
+# 会影响调用路径行为的环境变量，基准测试期间统一清除
+ISOLATED_ENV = (
+    'GOOGLE_SERVICE_ACCOUNT_KEY',
+    'GOOGLE_SERVICE_ACCOUNT_JSON',
+    'GEMINI_TOKEN_CACHE_FILE',
+    'GEMINI_RESPONSE_CACHE',
+    'GEMINI_HEDGE_PERCENTILE',
+    'GEMINI_CA_BUNDLE',
+    'GEMINI_MODEL',
+    'GEMINI_SEMANTIC_CACHE',
+    'GEMINI_ROUTER',
+    'GEMINI_MODEL_CATALOG',
+    'GEMINI_MODEL_CATALOG_FILE',
+)
+
+
+class StageCollector:
+    """
+    追踪导出器：按 trace 汇总各阶段 span 的耗时
+
+    每次测量的调用包在一个根 span 里，结束后按 trace_id 取出该次调用的阶段耗时。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._traces = {}
+
+    def export(self, span):
+        stage = STAGE_SPANS.get(span.name)
+        if stage is None:
+            return
+        with self._lock:
+            # 只记录 measure() 中的调用
+            stages = self._traces.get(span.trace_id)
+            if stages is not None:
+                stages[stage] = stages.get(stage, 0.0) + span.duration
+
+    def shutdown(self):
+        pass
+
+    def measure(self, fn):
+        """执行 fn()，返回 (总耗时, {阶段: 耗时})"""
+        with tracing.span('bench.call') as root:
+            with self._lock:
+                self._traces[root.trace_id] = {}
+            started = time.perf_counter()
+            try:
+                fn()
+            finally:
+                total = time.perf_counter() - started
+        with self._lock:
+            stages = self._traces.pop(root.trace_id, {})
+        stages['other'] = max(0.0, total - sum(stages.values()))
+        return total, stages
+
+
+def load_call_paths() -> dict:
+    """在环境变量就绪后导入调用路径，返回 {名称: 无参调用}"""
+    import gemini_simple_example
+    import gemini_service_account
+    import gemini_api_example
+    import list_models
+    # 按需导入的依赖在这里预先加载，冷启动只反映凭证解析和令牌签发（导入耗时见 bench_imports.py）
+    import requests
+    import google.oauth2.service_account
+    import google.auth.transport.requests
+
+    def rest_api():
+        credentials = gemini_simple_example.get_credentials()
+        return gemini_service_account.call_gemini_with_rest_api(PROMPT, credentials)
+
+    def list_all_models():
+        # 有效期内的目录直接从内存返回；有效期设为 0，测量每次都发条件请求（304）的路径。
+        # 目录在这里才挂到共享客户端上，不影响前面几条路径的测量
+        list_models.get_catalog().ttl = 0
+        return list_models.list_models()
+
+    return {
+        'call_gemini': lambda: gemini_simple_example.call_gemini(PROMPT, model=MODEL),
+        'call_gemini_with_rest_api': rest_api,
+        'call_gemini_api_with_service_account': (
+            lambda: gemini_api_example.call_gemini_api_with_service_account(PROMPT, model_name=MODEL)
+        ),
+        'list_models': list_all_models,
+    }
+
+
+def summarize(values) -> dict:
+    """毫秒统计"""
+    values = [v * 1000 for v in values]
+    return {
+        'mean': round(statistics.mean(values), 3),
+        'p50': round(percentile(values, 50), 3),
+        'p95': round(percentile(values, 95), 3),
+        'p99': round(percentile(values, 99), 3),
+    }
+
+
+def run_throughput(fn, requests: int, concurrency: int) -> dict:
+    """concurrency 个线程共发送 requests 个请求"""
+    counter = iter(range(requests))
+    lock = threading.Lock()
+    errors = []
+
+    def worker():
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            try:
+                fn()
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'rps': round(requests / elapsed, 2),
+        'errors': len(errors),
+    }
+
+
+def bench_path(name: str, fn, timer: StageCollector, args) -> dict:
+    """测量单条调用路径"""
+    from token_cache import reset_token_caches
+    from credentials_provider import reset_credentials
+
+    # 只在延迟测量期间启用追踪，吞吐量和内存数字不包含 span 的开销
+    previous = tracing.set_exporter(timer)
+    try:
+        colds = []
+        for _ in range(args.cold_runs):
+            reset_credentials()
+            reset_token_caches()
+            colds.append(timer.measure(fn))
+        cold, cold_stages = sorted(colds, key=lambda item: item[0])[len(colds) // 2]
+
+        totals, stages = [], {stage: [] for stage in STAGES}
+        for _ in range(args.requests):
+            total, call_stages = timer.measure(fn)
+            totals.append(total)
+            for stage in STAGES:
+                stages[stage].append(call_stages.get(stage, 0.0))
+    finally:
+        tracing.set_exporter(previous)
+
+    throughput = {
+        str(level): run_throughput(fn, args.requests, level)
+        for level in args.concurrency
+    }
+
+    tracemalloc.start()
+    for _ in range(args.memory_requests):
+        fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'cold_ms': round(cold * 1000, 3),
+        'cold_stages_ms': {stage: round(cold_stages.get(stage, 0.0) * 1000, 3) for stage in STAGES},
+        'latency_ms': summarize(totals),
+        'stages_ms': {stage: summarize(values) for stage, values in stages.items()},
+        'throughput': throughput,
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def median_result(runs: list):
+    """多轮测量结果逐个数值取中位数（结构与单轮相同）"""
+    first = runs[0]
+    if isinstance(first, dict):
+        return {key: median_result([run[key] for run in runs]) for key in first}
+    if isinstance(first, (int, float)) and not isinstance(first, bool):
+        value = statistics.median(runs)
+        return round(value, 3) if isinstance(value, float) else value
+    return first
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    与基线对比
+
+    Returns:
+        list: [(路径, 指标, 基线值, 当前值, 变化比例, 是否退化)]
+    """
+    rows = []
+    for name, current in results['paths'].items():
+        previous = baseline.get('paths', {}).get(name)
+        if previous is None:
+            continue
+        # (指标名, 取值函数, 越大越好)
+        metrics = [
+            ('cold_ms', lambda r: r['cold_ms'], False),
+            ('p50_ms', lambda r: r['latency_ms']['p50'], False),
+            ('p95_ms', lambda r: r['latency_ms']['p95'], False),
+            ('peak_memory_kb', lambda r: r['peak_memory_kb'], False),
+        ]
+        for level in current['throughput']:
+            metrics.append((f'rps@{level}', lambda r, level=level: r['throughput'][level]['rps'], True))
+        for metric, get, higher_is_better in metrics:
+            try:
+                old, new = get(previous), get(current)
+            except KeyError:
+                continue
+            if not old:
+                continue
+            change = (new - old) / old
+            regressed = -change > tolerance if higher_is_better else change > tolerance
+            rows.append((name, metric, old, new, change, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线基准测试套件")
+    parser.add_argument('--requests', type=int, default=100, help="每条路径、每个并发级别的请求数")
+    parser.add_argument('--concurrency', default='1,4,16', help="并发级别，逗号分隔")
+    parser.add_argument('--cold-runs', type=int, default=3, help="冷启动测量次数（取中位数）")
+    parser.add_argument('--repeat', type=int, default=5, help="每条路径重复测量的轮数，各指标取中位数")
+    parser.add_argument('--memory-requests', type=int, default=20, help="测量峰值内存时的请求数")
+    parser.add_argument('--paths', help="只运行这些调用路径，逗号分隔")
+    parser.add_argument('--latency', type=float, default=0.005, help="模拟服务器固定延迟（秒）")
+    parser.add_argument('--latency-dist', help="模拟服务器延迟分布，例如 lognormal:0.02,0.5")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="返回 503 的比例")
+    parser.add_argument('--response-bytes', type=int, default=0, help="响应文本大小")
+    parser.add_argument('--output', default='bench_results.json', help="结果 JSON 路径")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="基线 JSON 路径")
+    parser.add_argument('--save-baseline', action='store_true', help="把本次结果保存为基线")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="判定退化的相对变化阈值")
+    parser.add_argument('--fail-on-regression', action='store_true', help="有退化时以退出码 1 结束")
+    args = parser.parse_args()
+    args.concurrency = [int(x) for x in args.concurrency.split(',')]
+
+    config = MockConfig(
+        latency=args.latency,
+        latency_dist=args.latency_dist,
+        error_rate=args.error_rate,
+        response_bytes=args.response_bytes
+    )
+    server, base_url = start_mock_server(config=config)
+    key_file = make_fake_service_account(tempfile.mkdtemp(prefix='mock-gemini-'), base_url)
+
+    for name in ISOLATED_ENV:
+        os.environ.pop(name, None)
+    os.environ['GEMINI_API_BASE'] = base_url
+    os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = key_file
+    # 限流器会把吞吐量压在配额附近，测量调用路径本身时关闭
+    os.environ['GEMINI_RATE_LIMIT_RPM'] = '0'
+    # 所有请求使用同一个提示，请求合并会让并发请求只发一次上游调用，测量时关闭
+    os.environ['GEMINI_SINGLE_FLIGHT'] = '0'
+    os.environ['GEMINI_HTTP_POOL_SIZE'] = str(max(args.concurrency))
+
+    print("=" * 72)
+    print("🧪 离线基准测试套件")
+    print("=" * 72)
+    print(f"模拟服务器: {base_url}  延迟: {args.latency_dist or f'{args.latency * 1000:.0f}ms'}  "
+          f"503: {args.error_rate * 100:.1f}%")
+    print(f"每级请求数: {args.requests}  并发级别: {args.concurrency}  重复: {args.repeat} 轮（取中位数）")
+
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        call_paths = load_call_paths()
+    if args.paths:
+        selected = args.paths.split(',')
+        call_paths = {name: fn for name, fn in call_paths.items() if name in selected}
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'mock': {
+                'latency': args.latency,
+                'latency_dist': args.latency_dist,
+                'error_rate': args.error_rate,
+                'response_bytes': args.response_bytes,
+            },
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'repeat': args.repeat,
+        },
+        'paths': {},
+    }
+
+    timer = StageCollector()
+    try:
+        for name, fn in call_paths.items():
+            print(f"\n▶ {name} ...", flush=True)
+            # 调用路径会打印提示信息，测量期间丢弃
+            with contextlib.redirect_stdout(io.StringIO()):
+                runs = [bench_path(name, fn, timer, args) for _ in range(max(1, args.repeat))]
+            results['paths'][name] = median_result(runs)
+    finally:
+        server.shutdown()
+
+    for name, result in results['paths'].items():
+        latency, stages = result['latency_ms'], result['stages_ms']
+        print(f"\n📌 {name}")
+        print(f"   冷启动: {result['cold_ms']:.1f}ms  "
+              f"(令牌 {result['cold_stages_ms']['token']:.1f}ms)")
+        print(f"   延迟: mean {latency['mean']:.2f}  p50 {latency['p50']:.2f}  "
+              f"p95 {latency['p95']:.2f}  p99 {latency['p99']:.2f}  (ms)")
+        print("   阶段均值: " + "  ".join(f"{stage} {stages[stage]['mean']:.2f}" for stage in STAGES))
+        print("   吞吐量: " + "  ".join(
+            f"{level}并发 {t['rps']:.0f}/s" + (f"（{t['errors']} 失败）" if t['errors'] else "")
+            for level, t in result['throughput'].items()
+        ))
+        print(f"   峰值内存: {result['peak_memory_kb']:.0f} KB")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n✓ 结果已写入: {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"✓ 已保存为基线: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"⚠️  未找到基线 {args.baseline}，使用 --save-baseline 创建")
+        return
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('meta', {}).get('mock') != results['meta']['mock']:
+        print("⚠️  基线使用的模拟服务器配置与本次不同，对比结果仅供参考")
+
+    rows = compare(results, baseline, args.tolerance)
+    print(f"\n📊 与基线对比（{baseline['meta'].get('timestamp')}，容差 ±{args.tolerance * 100:.0f}%）")
+    print(f"{'路径':<38}{'指标':<16}{'基线':>10}{'本次':>10}{'变化':>9}")
+    print("-" * 84)
+    for name, metric, old, new, change, regressed in rows:
+        flag = "  ⚠️ 退化" if regressed else ""
+        print(f"{name:<38}{metric:<16}{old:>10.1f}{new:>10.1f}{change * 100:>+8.1f}%{flag}")
+
+    regressions = [row for row in rows if row[5]]
+    if regressions:
+        print(f"\n❌ {len(regressions)} 项指标退化超过 {args.tolerance * 100:.0f}%")
+        if args.fail_on_regression:
+            sys.exit(1)
+    else:
+        print("\n✅ 没有超出容差的退化")
+
+
+if __name__ == "__main__":
+    main()
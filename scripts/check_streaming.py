@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+流式输出自检 - 用本地 SSE 模拟服务器验证 streamGenerateContent 的解析
+
+覆盖以下情况：
+1. 正常的多事件流
+2. 网络分块落在事件中间、落在中文 UTF-8 字符中间（按 1 / 7 字节切分）
+3. 服务端在流中途发送错误事件
+4. 服务端在流中途断开连接
+5. 异步版本
+
+使用方法：
+    python scripts/check_streaming.py
+"""
+
+import sys
+import asyncio
+
+from gemini_http import GeminiHttpClient, GeminiStreamError, build_payload
+from gemini_async import AsyncGeminiClient
+from mock_gemini_server import MockConfig, start_mock_server
+
+PROMPT = "请用一句话解释什么是人工智能。你此刻的沉重，不是因为你做错了什么。"
+MODEL = "gemini-2.5-flash"
+EXPECTED = f"[{MODEL}] {PROMPT}"
+
+
+def check(name: str, passed: bool, detail: str = "") -> bool:
+    print(f"{'✓' if passed else '❌'} {name}" + (f"  {detail}" if detail else ""))
+    return passed
+
+
+def run_stream(client: GeminiHttpClient):
+    stream = client.stream_generate_content(MODEL, build_payload(PROMPT), api_key="mock-key")
+    chunks = []
+    try:
+        for chunk in stream:
+            chunks.append(chunk)
+    except GeminiStreamError as e:
+        return stream, chunks, e
+    return stream, chunks, None
+
+
+def main():
+    config = MockConfig(stream_chunks=6, stream_interval=0.01)
+    server, base_url = start_mock_server(config=config)
+    client = GeminiHttpClient(base_url=base_url)
+    results = []
+
+    print("=" * 60)
+    print("🧪 流式输出自检")
+    print("=" * 60)
+
+    stream, chunks, error = run_stream(client)
+    results.append(check(
+        "正常流",
+        error is None and ''.join(chunks) == EXPECTED and stream.finish_reason == 'STOP',
+        f"{len(chunks)} 个片段，首片段 {stream.time_to_first_chunk * 1000:.1f}ms，总计 {stream.total_time * 1000:.1f}ms"
+    ))
+
+    for split in (1, 7):
+        config.stream_split_bytes = split
+        stream, chunks, error = run_stream(client)
+        results.append(check(
+            f"按 {split} 字节切分的网络分块",
+            error is None and ''.join(chunks) == EXPECTED,
+            f"{len(chunks)} 个片段"
+        ))
+    config.stream_split_bytes = 0
+
+    config.stream_error_after = 2
+    stream, chunks, error = run_stream(client)
+    results.append(check(
+        "中途错误事件",
+        isinstance(error, GeminiStreamError) and len(chunks) == 2 and EXPECTED.startswith(''.join(chunks)),
+        str(error)
+    ))
+    config.stream_error_after = None
+
+    config.stream_drop_after = 3
+    stream, chunks, error = run_stream(client)
+    results.append(check(
+        "中途断开连接",
+        isinstance(error, GeminiStreamError) and len(chunks) == 3,
+        str(error)[:80]
+    ))
+    config.stream_drop_after = None
+
+    async def run_async():
+        async with AsyncGeminiClient(api_key="mock-key", client=client, model=MODEL) as gemini:
+            stream = gemini.stream(PROMPT)
+            text = await stream.text()
+            return stream, text
+
+    config.stream_split_bytes = 3
+    stream, text = asyncio.run(run_async())
+    results.append(check(
+        "异步流",
+        text == EXPECTED and stream.time_to_first_chunk is not None,
+        f"首片段 {stream.time_to_first_chunk * 1000:.1f}ms"
+    ))
+
+    client.close()
+    server.shutdown()
+
+    print("=" * 60)
+    if all(results):
+        print("✅ 全部通过")
+    else:
+        print(f"❌ {results.count(False)} 项失败")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
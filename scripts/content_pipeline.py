@@ -0,0 +1,207 @@
+"""
+离线内容生成的公共部分 - 增量清单、并发生成、原子写文件
+
+precompute_results.py 等离线管线都按同样的步骤工作：
+1. 从 content/*.ts 构造每个条目的请求体
+2. 用「模型 + 请求体」的哈希判断条目的输入是否变化（与 response_cache 的缓存键相同）
+3. 只为哈希变化或缺失的条目调用 Gemini，并发数有上限
+4. 把结果和新的哈希清单原子写回磁盘
+
+清单（manifest）记录每个条目上次成功生成时的输入哈希；生成失败的条目不更新哈希，下次运行会重试。
+
+使用方法：
+    from content_pipeline import Manifest, Generator, resolve_auth
+    manifest = Manifest.load("content/precomputed/manifest.json")
+    generator = Generator(model="gemini-2.5-flash", concurrency=8, **resolve_auth())
+    for key, text, error in generator.run(jobs):
+        ...
+"""
+
+import os
+import sys
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterable, Iterator, Optional, Sequence, Tuple
+
+import credentials_provider
+from credential_pool import get_default_pool
+from token_cache import get_token_cache
+from response_cache import make_key
+from gemini_http import get_default_client, extract_text
+from model_router import DEFAULT_MODEL
+
+DEFAULT_CONCURRENCY = 8
+
+
+def input_hash(model: str, payload: dict) -> str:
+    """条目输入的哈希：模型名 + 规范化请求体（提示模板、内容或生成参数任一变化都会改变哈希）"""
+    return make_key(model, payload)
+
+
+def write_json_atomic(path: str, data, compact: bool = False):
+    """
+    原子写入 JSON 文件（先写临时文件再替换）
+
+    Args:
+        path: 目标路径
+        data: 要写入的数据
+        compact: 为 True 时不缩进、不留空格（前端加载的静态文件）
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        if compact:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+        else:
+            json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write('\n')
+    os.replace(tmp_path, path)
+
+
+def read_json(path: str, default=None):
+    """读取 JSON 文件，不存在时返回 default"""
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class Manifest:
+    """
+    条目 -> 上次成功生成时的输入哈希
+
+    Args:
+        path: 清单文件路径
+        entries: {条目键: {'hash': ..., 'model': ..., 'updated': ...}}
+    """
+
+    def __init__(self, path: str, entries: Optional[dict] = None):
+        self.path = path
+        self.entries = dict(entries or {})
+
+    @classmethod
+    def load(cls, path: str) -> 'Manifest':
+        data = read_json(path, {})
+        return cls(path, data.get('entries', {}))
+
+    def is_current(self, key: str, digest: str) -> bool:
+        entry = self.entries.get(key)
+        return entry is not None and entry.get('hash') == digest
+
+    def record(self, key: str, digest: str, model: str):
+        self.entries[key] = {'hash': digest, 'model': model, 'updated': int(time.time())}
+
+    def prune(self, keys: Iterable[str]) -> list:
+        """删除不在 keys 中的条目（内容被删除的条目），返回被删除的键"""
+        keep = set(keys)
+        removed = [key for key in self.entries if key not in keep]
+        for key in removed:
+            del self.entries[key]
+        return removed
+
+    def save(self):
+        write_json_atomic(self.path, {'version': 1, 'entries': self.entries})
+
+
+def resolve_auth() -> dict:
+    """
+    按 batch_generate 相同的顺序选择凭证：凭证池 > 服务账号 > GEMINI_API_KEY
+
+    Returns:
+        dict: 可直接传给 Generator 的 credentials / api_key / pool
+    """
+    pool = get_default_pool()
+    if pool is not None:
+        print(f"✓ 凭证池: {len(pool.members)} 个凭证（{pool.strategy}）")
+        return {'pool': pool}
+    try:
+        credentials = credentials_provider.get_credentials()
+        print(f"✓ 凭证来源: {credentials_provider.credentials_source()}")
+        return {'credentials': credentials}
+    except credentials_provider.CredentialsNotFoundError:
+        api_key = os.getenv('GEMINI_API_KEY')
+        if not api_key:
+            print("❌ 未找到服务账号凭证，也未设置 GEMINI_API_KEY")
+            sys.exit(1)
+        print("✓ 使用 GEMINI_API_KEY")
+        return {'api_key': api_key}
+
+
+class Generator:
+    """
+    有并发上限的批量生成
+
+    Args:
+        model: 模型名称
+        concurrency: 同时进行的请求数
+        credentials: 服务账号凭证
+        api_key: API Key
+        pool: 凭证池（设置后忽略 credentials 和 api_key）
+        tag: 用量统计的调用方标签
+    """
+
+    def __init__(
+        self,
+        model: str = DEFAULT_MODEL,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        credentials=None,
+        api_key: Optional[str] = None,
+        pool=None,
+        tag: Optional[str] = None
+    ):
+        self.model = model
+        self.concurrency = concurrency
+        self.credentials = credentials
+        self.api_key = api_key
+        self.pool = pool
+        self.tag = tag
+        self.client = get_default_client()
+
+    def generate(self, payload: dict, use_cache: bool = True) -> str:
+        """
+        同步生成一个条目，返回文本
+
+        Args:
+            payload: 请求体
+            use_cache: 为 False 时不查询响应缓存和语义缓存（重试被拒绝的结果时使用）
+        """
+        if self.pool is not None:
+            result = self.pool.generate_content(
+                self.model, payload, client=self.client, tag=self.tag, use_cache=use_cache
+            )
+        else:
+            access_token = get_token_cache(self.credentials).get_token() if self.credentials else None
+            result = self.client.generate_content(
+                self.model, payload, access_token, api_key=self.api_key, tag=self.tag, use_cache=use_cache
+            )
+        return extract_text(result)
+
+    def invalidate(self, payload: dict):
+        """从缓存中删除该请求的结果（调用方拒绝了生成的文本时使用）"""
+        self.client.invalidate(self.model, payload)
+
+    def run(
+        self,
+        jobs: Sequence[Tuple[str, dict]],
+        use_cache: bool = True
+    ) -> Iterator[Tuple[str, Optional[str], Optional[BaseException]]]:
+        """
+        并发生成所有条目，按完成顺序产出结果
+
+        Args:
+            jobs: [(条目键, 请求体), ...]
+            use_cache: 为 False 时绕过缓存直接请求上游
+
+        Yields:
+            (条目键, 文本, 异常)：成功时异常为 None，失败时文本为 None
+        """
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {executor.submit(self.generate, payload, use_cache): key for key, payload in jobs}
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    yield key, future.result(), None
+                except Exception as e:
+                    yield key, None, e
@@ -0,0 +1,373 @@
+"""
+凭证池 - 在多个服务账号 / API Key 之间分摊请求，突破单个项目的配额
+
+所有调用路径原先只使用一个服务账号或一个 GEMINI_API_KEY，吞吐量受限于一个项目的配额。
+CredentialPool 持有多个凭证，每次请求从中挑选一个：
+- round_robin：依次轮换
+- least_loaded：选在途请求最少的（并列时按轮换顺序）
+
+每个凭证单独记录健康状况：连续收到 max_failures 次 429 / 403 后暂时移出轮换，
+冷却 cooldown 秒（或服务端 Retry-After 指定的更长时间）后自动恢复。
+所有凭证都在冷却时仍然返回最早恢复的那一个，不会阻塞调用方。
+
+每个服务账号有自己的令牌缓存（token_cache 按服务账号邮箱区分），
+限流器也按「凭证|模型」分组，每个项目的配额单独计算。
+
+使用方法：
+    from credential_pool import CredentialPool
+    pool = CredentialPool.from_sources(key_files=["a.json", "b.json"], api_keys=["AIza..."])
+    result = pool.generate_content("gemini-2.5-flash", build_payload("你好"))
+    print(pool.stats())
+
+也可以通过环境变量配置，get_default_pool() 返回进程内共享的凭证池：
+    GEMINI_CREDENTIAL_FILES=/keys/a.json,/keys/b.json
+    GEMINI_API_KEYS=key1,key2
+    GEMINI_POOL_STRATEGY=least_loaded
+    GEMINI_POOL_COOLDOWN=60
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import List, Optional, Sequence, Tuple
+
+import tracing
+import credentials_provider
+from token_cache import get_token_cache
+from rate_limiter import parse_retry_after
+from model_router import AUTO_MODEL
+
+STRATEGIES = ('round_robin', 'least_loaded')
+DEFAULT_STRATEGY = 'round_robin'
+DEFAULT_MAX_FAILURES = 3
+DEFAULT_COOLDOWN = 60.0
+
+# 说明凭证本身（配额用尽 / 没有权限）有问题的状态码，换一个凭证可能成功
+UNHEALTHY_STATUS = frozenset({403, 429})
+
+
+def _status_of(error: Optional[BaseException]) -> Optional[int]:
+    """异常（或其 __cause__）对应的 HTTP 状态码；流中途的错误事件带有 status_code"""
+    while error is not None:
+        response = getattr(error, 'response', None)
+        if response is not None and getattr(response, 'status_code', None) is not None:
+            return response.status_code
+        if isinstance(getattr(error, 'status_code', None), int):
+            return error.status_code
+        error = error.__cause__
+    return None
+
+
+def _retry_after_of(error: BaseException) -> Optional[float]:
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    return parse_retry_after(headers.get('Retry-After'))
+
+
+class PooledCredential:
+    """
+    池中的一个凭证及其健康状况（状态字段由 CredentialPool 在锁内维护）
+
+    Args:
+        name: 显示名称（服务账号邮箱或 API Key 的末尾几位）
+        credentials: 服务账号凭证（与 api_key 二选一）
+        api_key: API Key
+    """
+
+    def __init__(self, name: str, credentials=None, api_key: Optional[str] = None):
+        if (credentials is None) == (api_key is None):
+            raise ValueError("PooledCredential 需要 credentials 或 api_key 之一")
+        self.name = name
+        self.credentials = credentials
+        self.api_key = api_key
+
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.last_error: Optional[str] = None
+        self.stats = {'requests': 0, 'ok': 0, 'failed': 0, 'throttled': 0, 'forbidden': 0, 'cooldowns': 0}
+
+    @property
+    def kind(self) -> str:
+        return 'service_account' if self.credentials is not None else 'api_key'
+
+    def auth(self) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Returns:
+            (access_token, api_key)：服务账号从自己的令牌缓存取令牌
+        """
+        if self.credentials is not None:
+            return get_token_cache(self.credentials).get_token(), None
+        return None, self.api_key
+
+    def rate_limit_key(self, model: str) -> str:
+        return f"{self.name}|{model}"
+
+    def available(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+
+class CredentialPool:
+    """
+    线程安全的凭证池
+
+    Args:
+        members: PooledCredential 列表
+        strategy: round_robin 或 least_loaded
+        max_failures: 连续多少次 429 / 403 后移出轮换
+        cooldown: 移出轮换的秒数
+    """
+
+    def __init__(
+        self,
+        members: Sequence[PooledCredential],
+        strategy: str = DEFAULT_STRATEGY,
+        max_failures: int = DEFAULT_MAX_FAILURES,
+        cooldown: float = DEFAULT_COOLDOWN
+    ):
+        if not members:
+            raise ValueError("凭证池至少需要一个凭证")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"未知的选择策略: {strategy}（可选 {', '.join(STRATEGIES)}）")
+        names = [member.name for member in members]
+        if len(set(names)) != len(names):
+            raise ValueError("凭证池中的凭证名称重复")
+        self.members: List[PooledCredential] = list(members)
+        self.strategy = strategy
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+
+        self._lock = threading.Lock()
+        self._next = 0
+        self._stats = {'acquired': 0, 'failovers': 0, 'exhausted': 0}
+
+    @classmethod
+    def from_sources(
+        cls,
+        key_files: Sequence[str] = (),
+        api_keys: Sequence[str] = (),
+        scopes: Optional[Sequence[str]] = None,
+        **kwargs
+    ) -> 'CredentialPool':
+        """
+        从密钥文件和 API Key 创建凭证池
+
+        Args:
+            key_files: 服务账号 JSON 密钥文件路径
+            api_keys: API Key
+            scopes: 服务账号的 OAuth scopes
+            **kwargs: 传给 CredentialPool 的其他参数
+
+        Raises:
+            credentials_provider.CredentialsFileNotFoundError: 密钥文件不存在
+        """
+        members = []
+        for path in key_files:
+            credentials = credentials_provider.get_credentials_from_file(path, scopes)
+            name = getattr(credentials, 'service_account_email', None) or os.path.basename(path)
+            members.append(PooledCredential(name, credentials=credentials))
+        members += [PooledCredential(f"key:…{key[-4:]}", api_key=key) for key in api_keys]
+        return cls(members, **kwargs)
+
+    def acquire(self, exclude: Sequence[PooledCredential] = ()) -> PooledCredential:
+        """
+        按策略挑选一个凭证并计入在途请求，用完后必须调用 release()
+
+        Args:
+            exclude: 本次不考虑的凭证（故障转移时排除已经失败的）
+
+        Returns:
+            PooledCredential: 选中的凭证
+        """
+        with self._lock:
+            now = time.monotonic()
+            count = len(self.members)
+            order = [self.members[(self._next + i) % count] for i in range(count)]
+            candidates = [m for m in order if m not in exclude] or order
+            healthy = [m for m in candidates if m.available(now)]
+            if healthy:
+                if self.strategy == 'least_loaded':
+                    member = min(healthy, key=lambda m: m.in_flight)
+                else:
+                    member = healthy[0]
+            else:
+                # 全部在冷却中：不阻塞，使用最早恢复的凭证
+                self._stats['exhausted'] += 1
+                member = min(candidates, key=lambda m: m.cooldown_until)
+            self._next = (self.members.index(member) + 1) % count
+            member.in_flight += 1
+            member.stats['requests'] += 1
+            self._stats['acquired'] += 1
+            return member
+
+    def release(self, member: PooledCredential, error: Optional[BaseException] = None):
+        """
+        归还凭证并记录结果
+
+        Args:
+            member: acquire() 返回的凭证
+            error: 请求失败时的异常；429 / 403 计入健康状况
+        """
+        status = _status_of(error)
+        with self._lock:
+            member.in_flight -= 1
+            if error is None:
+                member.stats['ok'] += 1
+                member.consecutive_failures = 0
+                return
+            member.stats['failed'] += 1
+            member.last_error = f"{type(error).__name__}: {error}"
+            if status not in UNHEALTHY_STATUS:
+                return
+            member.stats['throttled' if status == 429 else 'forbidden'] += 1
+            member.consecutive_failures += 1
+            if member.consecutive_failures >= self.max_failures:
+                cooldown = max(self.cooldown, _retry_after_of(error) or 0.0)
+                member.cooldown_until = time.monotonic() + cooldown
+                member.consecutive_failures = 0
+                member.stats['cooldowns'] += 1
+
+    @contextmanager
+    def lease(self, exclude: Sequence[PooledCredential] = ()):
+        """
+        借用一个凭证（with 语句结束时自动归还并记录异常）
+
+        使用方法：
+            with pool.lease() as member:
+                access_token, api_key = member.auth()
+        """
+        member = self.acquire(exclude)
+        try:
+            yield member
+        except BaseException as e:
+            self.release(member, e)
+            raise
+        self.release(member)
+
+    def generate_content(self, model: str, payload: dict, client=None, **kwargs) -> dict:
+        """
+        用池中的凭证调用 generateContent，429 / 403 时换下一个凭证重试
+
+        Args:
+            model: 模型名称
+            payload: 请求体
+            client: GeminiHttpClient，默认使用共享客户端
+            **kwargs: 传给 client.generate_content 的其他参数
+
+        Returns:
+            dict: 解析后的 JSON 响应
+        """
+        return self._call('generate_content', model, payload, client, kwargs)
+
+    def stream_generate_content(self, model: str, payload: dict, client=None, **kwargs):
+        """
+        用池中的凭证调用 streamGenerateContent（只在建立流时故障转移）
+
+        凭证在流结束时才归还：流持续期间计入在途请求数，流中途的 429 / 403 也计入健康状况。
+
+        Returns:
+            GeminiStream: 文本片段迭代器
+        """
+        return self._call('stream_generate_content', model, payload, client, kwargs)
+
+    def _call(self, method: str, model: str, payload: dict, client, kwargs: dict):
+        if client is None:
+            from gemini_http import get_default_client
+            client = get_default_client()
+        if model == AUTO_MODEL:
+            # 先选模型再在凭证之间故障转移，限流仍按 (凭证, 具体模型) 分组
+            priority = kwargs.pop('priority', None)
+            return client.call_routed(
+                payload, priority, lambda routed: self._call(method, routed, payload, client, dict(kwargs))
+            )
+        tried: List[PooledCredential] = []
+        while True:
+            with tracing.span('credential_pool.acquire') as span:
+                member = self.acquire(tried)
+                span.set_attribute('credential', member.name)
+            tried.append(member)
+            try:
+                access_token, api_key = member.auth()
+                # 还有凭证可换时，429 不在同一个凭证上等 Retry-After 重试，立即换下一个
+                no_retry_status = UNHEALTHY_STATUS if len(tried) < len(self.members) else ()
+                result = getattr(client, method)(
+                    model, payload, access_token, api_key=api_key,
+                    rate_limit_key=member.rate_limit_key(model), no_retry_status=no_retry_status, **kwargs
+                )
+            except Exception as e:
+                self.release(member, e)
+                if _status_of(e) not in UNHEALTHY_STATUS or len(tried) >= len(self.members):
+                    raise
+                with self._lock:
+                    self._stats['failovers'] += 1
+                continue
+            if method == 'stream_generate_content':
+                result.add_finish_callback(lambda stream, member=member: self.release(member, stream.error))
+            else:
+                self.release(member)
+            return result
+
+    def stats(self) -> dict:
+        """池的统计信息，以及每个凭证的在途请求、成功 / 失败次数和冷却状态"""
+        with self._lock:
+            now = time.monotonic()
+            return dict(
+                self._stats,
+                strategy=self.strategy,
+                healthy=sum(1 for m in self.members if m.available(now)),
+                members={
+                    m.name: dict(
+                        m.stats,
+                        kind=m.kind,
+                        in_flight=m.in_flight,
+                        cooldown_remaining=round(max(0.0, m.cooldown_until - now), 1),
+                        last_error=m.last_error,
+                    )
+                    for m in self.members
+                }
+            )
+
+
+def _split(value: Optional[str]) -> List[str]:
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+_default_pool: Optional[CredentialPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool() -> Optional[CredentialPool]:
+    """
+    根据环境变量创建（并缓存）进程内共享的凭证池
+
+    环境变量：
+        GEMINI_CREDENTIAL_FILES: 服务账号密钥文件路径，逗号分隔
+        GEMINI_API_KEYS: API Key，逗号分隔
+        GEMINI_POOL_STRATEGY: round_robin（默认）或 least_loaded
+        GEMINI_POOL_COOLDOWN: 凭证移出轮换的秒数
+
+    Returns:
+        CredentialPool: 两个变量都未设置时返回 None
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            key_files = _split(os.getenv('GEMINI_CREDENTIAL_FILES'))
+            api_keys = _split(os.getenv('GEMINI_API_KEYS'))
+            if not key_files and not api_keys:
+                return None
+            _default_pool = CredentialPool.from_sources(
+                key_files,
+                api_keys,
+                strategy=os.getenv('GEMINI_POOL_STRATEGY', DEFAULT_STRATEGY),
+                cooldown=float(os.getenv('GEMINI_POOL_COOLDOWN', DEFAULT_COOLDOWN))
+            )
+        return _default_pool
+
+
+def set_default_pool(pool: Optional[CredentialPool]):
+    """替换共享的凭证池（测试或切换账号时使用）"""
+    global _default_pool
+    with _default_pool_lock:
+        _default_pool = pool
@@ -0,0 +1,263 @@
+"""
+凭证加载 - 所有脚本共用的服务账号凭证来源，每个进程只解析一次密钥
+
+按以下顺序查找凭证：
+1. GOOGLE_APPLICATION_CREDENTIALS（JSON 密钥文件路径）- 推荐
+2. GOOGLE_SERVICE_ACCOUNT_KEY（JSON 密钥文件路径）
+3. GOOGLE_SERVICE_ACCOUNT_JSON（环境变量中直接包含 JSON 字符串）
+4. 默认凭证 ADC（在 GCP 环境中运行时）
+
+解析密钥（读文件 + 解析 JSON + 加载 RSA 私钥）约 50ms，结果会被缓存：
+- 同一来源、同一组 scopes 始终返回同一个凭证对象，令牌缓存也随之复用
+- 密钥文件的修改时间或大小变化时才重新加载（例如密钥轮换），旧令牌随之丢弃
+- 不同 scopes 由同一个已加载的凭证派生，不会再次解析私钥
+
+使用方法：
+    from credentials_provider import get_credentials
+    credentials = get_credentials()
+    credentials = get_credentials(scopes=[...])
+"""
+
+import os
+import json
+import hashlib
+import threading
+from typing import Optional, Sequence
+
+import tracing
+
+DEFAULT_SCOPES = ('https://www.googleapis.com/auth/generative-language',)
+
+PATH_ENV_VARS = ('GOOGLE_APPLICATION_CREDENTIALS', 'GOOGLE_SERVICE_ACCOUNT_KEY')
+JSON_ENV_VAR = 'GOOGLE_SERVICE_ACCOUNT_JSON'
+
+NOT_FOUND_MESSAGE = (
+    "\n❌ 未找到服务账号凭证。请设置以下环境变量之一：\n\n"
+    "  📁 方式1（推荐）: GOOGLE_APPLICATION_CREDENTIALS\n"
+    "     export GOOGLE_APPLICATION_CREDENTIALS=\"/path/to/service-account-key.json\"\n\n"
+    "  📁 方式2: GOOGLE_SERVICE_ACCOUNT_KEY\n"
+    "     export GOOGLE_SERVICE_ACCOUNT_KEY=\"/path/to/service-account-key.json\"\n\n"
+    "  📄 方式3: GOOGLE_SERVICE_ACCOUNT_JSON\n"
+    "     export GOOGLE_SERVICE_ACCOUNT_JSON='{\"type\":\"service_account\",...}'\n\n"
+    "💡 提示: 也可以使用 .env 文件来管理环境变量"
+)
+
+
+class CredentialsNotFoundError(ValueError):
+    """没有找到任何可用的凭证来源"""
+
+
+class CredentialsFileNotFoundError(CredentialsNotFoundError, FileNotFoundError):
+    """指定的密钥文件不存在（按 CredentialsNotFoundError 处理的调用方会改用 API Key）"""
+
+
+class CredentialsProvider:
+    """
+    线程安全的凭证缓存
+
+    缓存的是「来源 + 版本」对应的基础凭证；版本对文件来说是 (mtime, size)，
+    对 JSON 字符串来说是其摘要。每次调用只做一次 os.stat。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 来源 -> (版本, 基础凭证)
+        self._base = {}
+        # (来源, scopes) -> (版本, 带 scopes 的凭证)
+        self._scoped = {}
+        self._stats = {'loads': 0, 'reloads': 0, 'hits': 0}
+        self.source: Optional[str] = None
+
+    def get(self, scopes: Optional[Sequence[str]] = None):
+        """
+        获取凭证
+
+        Args:
+            scopes: OAuth scopes，默认只有 generative-language
+
+        Returns:
+            google.auth.credentials.Credentials: 凭证对象
+
+        Raises:
+            CredentialsFileNotFoundError: 环境变量指向的密钥文件不存在，且没有设置 JSON 凭证
+            ValueError: 环境变量中的 JSON 格式无效
+            CredentialsNotFoundError: 没有找到任何凭证
+        """
+        source, version, loader = self._resolve()
+        credentials = self._get(source, version, loader, scopes)
+        self.source = source
+        return credentials
+
+    def get_file(self, path: str, scopes: Optional[Sequence[str]] = None):
+        """
+        从指定的密钥文件获取凭证（凭证池使用），缓存规则与环境变量指向的文件相同
+
+        Args:
+            path: JSON 密钥文件路径
+            scopes: OAuth scopes，默认只有 generative-language
+
+        Raises:
+            CredentialsFileNotFoundError: 密钥文件不存在
+        """
+        source, version = _file_version(path, "凭证池中")
+        return self._get(source, version, _file_loader(path), scopes)
+
+    def _get(self, source: str, version, loader, scopes: Optional[Sequence[str]]):
+        scopes = tuple(sorted(scopes or DEFAULT_SCOPES))
+        with self._lock:
+            cached = self._scoped.get((source, scopes))
+            if cached is not None and cached[0] == version:
+                self._stats['hits'] += 1
+                return cached[1]
+
+            base = self._base.get(source)
+            if base is None or base[0] != version:
+                if base is not None:
+                    self._stats['reloads'] += 1
+                    self._discard_locked(source)
+                self._stats['loads'] += 1
+                base = (version, loader(scopes))
+                self._base[source] = base
+
+            credentials = base[1]
+            if tuple(sorted(getattr(credentials, 'scopes', None) or ())) != scopes:
+                # 复用已加载的私钥，只复制出一份带新 scopes 的凭证
+                if hasattr(credentials, 'with_scopes'):
+                    credentials = credentials.with_scopes(list(scopes))
+            self._scoped[(source, scopes)] = (version, credentials)
+            return credentials
+
+    def stats(self) -> dict:
+        """返回加载 / 重新加载 / 命中次数"""
+        with self._lock:
+            return dict(self._stats, source=self.source)
+
+    def reset(self):
+        """丢弃所有缓存的凭证，下次调用会重新加载"""
+        with self._lock:
+            for source in list(self._base):
+                self._discard_locked(source)
+            self._base.clear()
+
+    def _discard_locked(self, source: str):
+        """丢弃某个来源的所有凭证及其令牌缓存（调用方需持有 self._lock）"""
+        from token_cache import discard_token_cache
+
+        for key in [key for key in self._scoped if key[0] == source]:
+            discard_token_cache(self._scoped.pop(key)[1])
+
+    def _resolve(self):
+        """
+        确定凭证来源
+
+        Returns:
+            (来源描述, 版本, 加载函数)
+        """
+        missing = None
+        for name in PATH_ENV_VARS:
+            path = os.getenv(name)
+            if not path:
+                continue
+            try:
+                source, version = _file_version(path, f"环境变量 {name} 中")
+            except CredentialsFileNotFoundError as e:
+                # 与原先一样，路径不存在时继续尝试下一个来源
+                missing = missing or e
+                continue
+            return source, version, _file_loader(path)
+
+        json_str = os.getenv(JSON_ENV_VAR)
+        if json_str:
+            digest = hashlib.sha256(json_str.encode('utf-8')).hexdigest()
+            return f"env:{JSON_ENV_VAR}", digest, _info_loader(json_str)
+
+        if missing is not None:
+            raise missing
+
+        return "adc", None, _default_loader
+
+
+def _file_version(path: str, where: str):
+    """密钥文件的来源描述和版本 (mtime, size)"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise CredentialsFileNotFoundError(
+            f"❌ 密钥文件不存在: {path}\n"
+            f"请检查{where}的路径是否正确。"
+        ) from None
+    return f"file:{os.path.abspath(path)}", (stat.st_mtime_ns, stat.st_size)
+
+
+def _file_loader(path: str):
+    def load(scopes):
+        from google.oauth2 import service_account
+        return service_account.Credentials.from_service_account_file(path, scopes=list(scopes))
+    return load
+
+
+def _info_loader(json_str: str):
+    def load(scopes):
+        from google.oauth2 import service_account
+        try:
+            info = json.loads(json_str)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"环境变量中的 JSON 格式无效: {e}") from e
+        return service_account.Credentials.from_service_account_info(info, scopes=list(scopes))
+    return load
+
+
+def _default_loader(scopes):
+    import google.auth
+    import google.auth.exceptions
+    try:
+        credentials, _ = google.auth.default(scopes=list(scopes))
+    except google.auth.exceptions.DefaultCredentialsError as e:
+        raise CredentialsNotFoundError(NOT_FOUND_MESSAGE) from e
+    return credentials
+
+
+_provider = CredentialsProvider()
+
+
+def get_credentials(scopes: Optional[Sequence[str]] = None):
+    """
+    从进程内共享的 provider 获取凭证（见 CredentialsProvider.get）
+
+    Args:
+        scopes: OAuth scopes，默认只有 generative-language
+
+    Returns:
+        google.auth.credentials.Credentials: 凭证对象
+    """
+    with tracing.span('load_credentials'):
+        return _provider.get(scopes)
+
+
+def get_credentials_from_file(path: str, scopes: Optional[Sequence[str]] = None):
+    """
+    从指定的密钥文件获取凭证（见 CredentialsProvider.get_file）
+
+    Args:
+        path: JSON 密钥文件路径
+        scopes: OAuth scopes，默认只有 generative-language
+
+    Returns:
+        google.oauth2.service_account.Credentials: 凭证对象
+    """
+    with tracing.span('load_credentials', path=path):
+        return _provider.get_file(path, scopes)
+
+
+def credentials_source() -> Optional[str]:
+    """最近一次使用的凭证来源，例如 file:/path/key.json、env:GOOGLE_SERVICE_ACCOUNT_JSON、adc"""
+    return _provider.source
+
+
+def credentials_stats() -> dict:
+    return _provider.stats()
+
+
+def reset_credentials():
+    """丢弃缓存的凭证（测试或切换账号时使用）"""
+    _provider.reset()
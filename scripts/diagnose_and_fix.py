@@ -1,16 +1,55 @@
 #!/usr/bin/env python3
 """
 诊断脚本 - 帮助排查 Gemini API 调用问题
+
+所有端点并发探测，任意一个成功后立即停止，并报告每个端点的
+DNS / 连接 / TLS / 首字节 / 总耗时。
+
+使用方法：
+    python diagnose_and_fix.py
+    python diagnose_and_fix.py --models gemini-2.5-flash,gemini-2.5-pro --regions us-central1,europe-west4
+    python diagnose_and_fix.py --all      # 不提前停止，等所有端点返回
+
+也可以通过环境变量 GEMINI_DIAG_MODELS / GEMINI_DIAG_REGIONS 设置（逗号分隔）。
 """
 
 import os
-import json
-import requests
-from google.oauth2 import service_account
-import google.auth.transport.requests
+import time
+import argparse
+from typing import Optional, Sequence
+import credentials_provider
+from token_cache import get_token_cache
+from gemini_http import get_default_client, auth_headers, API_VERSION
+from endpoint_probe import (
+    DEFAULT_MODELS, DEFAULT_REGIONS, DEFAULT_TIMEOUT, build_endpoints, probe_all, format_report
+)
+
+
+def _split(value: Optional[str]) -> Optional[list]:
+    return [item.strip() for item in value.split(',') if item.strip()] if value else None
 
-def diagnose():
-    """诊断问题"""
+
+def diagnose(
+    models: Optional[Sequence[str]] = None,
+    regions: Optional[Sequence[str]] = None,
+    timeout: float = DEFAULT_TIMEOUT,
+    probe_all_endpoints: bool = False
+):
+    """
+    诊断问题
+    
+    Args:
+        models: 要探测的模型，默认读取 GEMINI_DIAG_MODELS
+        regions: 要探测的 Vertex AI 区域，默认读取 GEMINI_DIAG_REGIONS
+        timeout: 每个端点的超时（秒）
+        probe_all_endpoints: 为 True 时等待所有端点返回，而不是第一个成功就停止
+    
+    Returns:
+        bool: 有端点调用成功时返回 True
+    """
+    models = models or _split(os.getenv('GEMINI_DIAG_MODELS')) or DEFAULT_MODELS
+    regions = regions or _split(os.getenv('GEMINI_DIAG_REGIONS')) or DEFAULT_REGIONS
+    
     print("=" * 60)
     print("🔍 Gemini API 诊断工具")
     print("=" * 60)
@@ -23,37 +62,20 @@ def diagnose():
     print(f"\n✓ 密钥文件: {key_path}")
     
     # 加载凭证
-    credentials = service_account.Credentials.from_service_account_file(
-        key_path,
-        scopes=['https://www.googleapis.com/auth/generative-language']
-    )
+    credentials = credentials_provider.get_credentials()
     
-    request = google.auth.transport.requests.Request()
-    credentials.refresh(request)
-    access_token = credentials.token
+    access_token = get_token_cache(credentials).get_token()
     
     project_id = credentials.project_id if hasattr(credentials, 'project_id') else None
     print(f"✓ 项目ID: {project_id}")
     print(f"✓ 服务账号: {credentials.service_account_email}")
     
-    # 测试不同的端点
-    endpoints = [
-        {
-            "name": "标准端点 (v1beta)",
-            "url": "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-pro:generateContent"
-        },
-        {
-            "name": "Vertex AI 端点",
-            "url": f"https://us-central1-aiplatform.googleapis.com/v1/projects/{project_id}/locations/us-central1/publishers/google/models/gemini-1.5-pro:predict"
-        },
-        {
-            "name": "简化模型名",
-            "url": "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
-        }
-    ]
+    # 并发探测所有 (模型, 区域) 端点，任意一个成功即停止
+    client = get_default_client()
+    endpoints = build_endpoints(models, regions, project_id, base_url=client.base_url, api_version=API_VERSION)
     
     print("\n" + "=" * 60)
-    print("🧪 测试不同的 API 端点...")
+    print(f"🧪 并发测试 {len(endpoints)} 个 API 端点...")
     print("=" * 60)
     
     payload = {
@@ -62,26 +84,35 @@ def diagnose():
         }]
     }
     
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
+    started = time.perf_counter()
+    results = probe_all(
+        endpoints,
+        headers=auth_headers(access_token),
+        body=payload,
+        timeout=timeout,
+        stop_on_success=not probe_all_endpoints,
+        verify=client.verify
+    )
+    elapsed = time.perf_counter() - started
+    
+    print(f"\n耗时（ms，从探测开始累计）:\n")
+    print(format_report(results))
+    print(f"\n总耗时: {elapsed:.2f}s")
     
-    for endpoint in endpoints:
-        print(f"\n测试: {endpoint['name']}")
-        print(f"URL: {endpoint['url']}")
-        try:
-            response = requests.post(endpoint['url'], headers=headers, json=payload, timeout=10)
-            print(f"状态码: {response.status_code}")
-            if response.status_code == 200:
-                print("✅ 成功！")
-                result = response.json()
-                print(f"响应: {json.dumps(result, indent=2, ensure_ascii=False)[:200]}...")
-                return True
-            else:
-                print(f"❌ 失败: {response.text[:200]}")
-        except Exception as e:
-            print(f"❌ 错误: {e}")
+    for result in results:
+        if result.ok or result.cancelled:
+            continue
+        print(f"\n❌ {result.name}")
+        print(f"URL: {result.url}")
+        print(f"失败: {result.error or result.body[:200]}")
+    
+    succeeded = [result for result in results if result.ok]
+    if succeeded:
+        for result in succeeded:
+            print(f"\n✅ 成功！{result.name}")
+            print(f"URL: {result.url}")
+            print(f"响应: {result.body[:200]}...")
+        return True
     
     print("\n" + "=" * 60)
     print("💡 解决建议")
@@ -96,6 +127,17 @@ def diagnose():
     print("   https://aistudio.google.com/apikey")
     print("\n4. 如果是首次使用，可能需要等待几分钟让权限生效")
 
+def main():
+    parser = argparse.ArgumentParser(description="Gemini API 诊断工具")
+    parser.add_argument('--models', help="要探测的模型，逗号分隔")
+    parser.add_argument('--regions', help="要探测的 Vertex AI 区域，逗号分隔")
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help="每个端点的超时（秒）")
+    parser.add_argument('--all', action='store_true', help="等待所有端点返回，不在第一个成功后停止")
+    args = parser.parse_args()
+    
+    diagnose(_split(args.models), _split(args.regions), args.timeout, args.all)
+
+
 if __name__ == "__main__":
-    diagnose()
+    main()
 
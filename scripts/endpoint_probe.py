@@ -0,0 +1,322 @@
+"""
+端点探测 - 并发探测多个 Gemini 端点，并记录每个阶段的耗时
+
+诊断脚本原先依次请求每个端点（每个 10 秒超时），配置有问题时要等 30 秒才出结果。
+这里每个端点一个线程同时探测，任意一个成功后立即返回（其余探测被中止），
+因此几十个端点的总耗时约等于最快成功的那一次探测。
+
+每次探测直接用 socket / ssl 建立连接，分别记录：
+- dns：域名解析
+- connect：TCP 连接
+- tls：TLS 握手（http 端点为空）
+- ttfb：发送请求到收到响应头
+- total：从开始到读完响应体
+
+注意：探测不走 HTTP 代理，测的是本机到端点的直连耗时。
+
+使用方法：
+    from endpoint_probe import build_endpoints, probe_all
+    endpoints = build_endpoints(["gemini-2.5-flash"], ["us-central1"], project_id="my-project")
+    results = probe_all(endpoints, headers=auth_headers(token), body=payload)
+"""
+
+import ssl
+import json
+import time
+import queue
+import socket
+import threading
+import http.client
+import urllib.parse
+from typing import Dict, List, Optional, Sequence, Union
+
+DEFAULT_MODELS = ('gemini-2.5-flash', 'gemini-1.5-pro', 'gemini-pro')
+DEFAULT_REGIONS = ('us-central1',)
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_MAX_WORKERS = 32
+
+PHASES = ('dns', 'connect', 'tls', 'ttfb', 'total')
+
+
+class ProbeResult:
+    """
+    一次探测的结果
+
+    Attributes:
+        name: 端点说明
+        url: 请求地址
+        status: HTTP 状态码（未收到响应时为 None）
+        error: 失败原因（网络错误、超时或被中止）
+        timings: 各阶段耗时（秒），未到达的阶段为 None
+        body: 响应体（截断）
+    """
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url
+        self.status: Optional[int] = None
+        self.error: Optional[str] = None
+        self.timings: Dict[str, Optional[float]] = dict.fromkeys(PHASES)
+        self.body = ''
+        self.cancelled = False
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'url': self.url,
+            'status': self.status,
+            'error': self.error,
+            'timings_ms': {k: round(v * 1000, 1) if v is not None else None for k, v in self.timings.items()},
+        }
+
+
+class _Probe:
+    """一次探测的执行状态，abort() 可以从其他线程中止正在阻塞的读写"""
+
+    def __init__(self, endpoint: dict):
+        self.result = ProbeResult(endpoint['name'], endpoint['url'])
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._aborted = False
+
+    def abort(self):
+        with self._lock:
+            self._aborted = True
+            sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _set_socket(self, sock: socket.socket):
+        with self._lock:
+            self._sock = sock
+            if self._aborted:
+                raise _Aborted()
+
+    def run(
+        self,
+        method: str,
+        headers: dict,
+        body: Optional[bytes],
+        timeout: float,
+        verify: Union[bool, str]
+    ) -> ProbeResult:
+        result = self.result
+        sock = None
+        try:
+            sock = self._run(method, headers, body, timeout, verify)
+        except _Aborted:
+            result.cancelled = True
+            result.error = "已中止（其他端点已成功）"
+        except socket.timeout:
+            result.error = f"超时（{timeout:.0f}s）"
+        except (OSError, http.client.HTTPException) as e:
+            if self._aborted:
+                result.cancelled = True
+                result.error = "已中止（其他端点已成功）"
+            else:
+                result.error = f"{type(e).__name__}: {e}"
+        finally:
+            if sock is not None:
+                sock.close()
+        return result
+
+    def _run(self, method, headers, body, timeout, verify) -> socket.socket:
+        result = self.result
+        with self._lock:
+            if self._aborted:
+                raise _Aborted()
+        parts = urllib.parse.urlsplit(result.url)
+        https = parts.scheme == 'https'
+        host = parts.hostname
+        port = parts.port or (443 if https else 80)
+        path = parts.path + (f"?{parts.query}" if parts.query else '')
+        deadline = time.perf_counter() + timeout
+        started = time.perf_counter()
+
+        def remaining() -> float:
+            left = deadline - time.perf_counter()
+            if left <= 0:
+                raise socket.timeout()
+            return left
+
+        addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        result.timings['dns'] = time.perf_counter() - started
+
+        sock = None
+        last_error: Optional[OSError] = None
+        for family, socktype, proto, _, address in addresses:
+            sock = socket.socket(family, socktype, proto)
+            self._set_socket(sock)
+            try:
+                sock.settimeout(remaining())
+                sock.connect(address)
+                break
+            except OSError as e:
+                sock.close()
+                sock, last_error = None, e
+        if sock is None:
+            raise last_error or OSError(f"无法连接 {host}:{port}")
+        result.timings['connect'] = time.perf_counter() - started
+
+        if https:
+            if verify is False:
+                context = ssl._create_unverified_context()
+            else:
+                context = ssl.create_default_context(cafile=verify if isinstance(verify, str) else None)
+            sock.settimeout(remaining())
+            sock = context.wrap_socket(sock, server_hostname=host)
+            self._set_socket(sock)
+            result.timings['tls'] = time.perf_counter() - started
+
+        connection = http.client.HTTPConnection(host, port, timeout=remaining())
+        connection.sock = sock
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        result.timings['ttfb'] = time.perf_counter() - started
+        result.status = response.status
+
+        sock.settimeout(remaining())
+        data = response.read()
+        result.timings['total'] = time.perf_counter() - started
+        result.body = data[:2000].decode('utf-8', errors='replace')
+        return sock
+
+
+class _Aborted(Exception):
+    pass
+
+
+def build_endpoints(
+    models: Sequence[str] = DEFAULT_MODELS,
+    regions: Sequence[str] = DEFAULT_REGIONS,
+    project_id: Optional[str] = None,
+    base_url: str = "https://generativelanguage.googleapis.com",
+    api_version: str = "v1beta"
+) -> List[dict]:
+    """
+    为每个模型生成 Generative Language 端点，为每个 (区域, 模型) 生成 Vertex AI 端点
+
+    Args:
+        models: 模型名称列表
+        regions: Vertex AI 区域列表（global 使用不带区域前缀的域名）
+        project_id: GCP 项目 ID，为空时不生成 Vertex AI 端点
+        base_url: Generative Language API 根地址
+        api_version: Generative Language API 版本
+
+    Returns:
+        list: [{'name': ..., 'url': ...}, ...]
+    """
+    endpoints = [
+        {
+            'name': f"Generative Language ({model})",
+            'url': f"{base_url.rstrip('/')}/{api_version}/models/{model}:generateContent",
+        }
+        for model in models
+    ]
+    if project_id:
+        for region in regions:
+            host = "aiplatform.googleapis.com" if region == 'global' else f"{region}-aiplatform.googleapis.com"
+            for model in models:
+                endpoints.append({
+                    'name': f"Vertex AI {region} ({model})",
+                    'url': (
+                        f"https://{host}/v1/projects/{project_id}/locations/{region}"
+                        f"/publishers/google/models/{model}:generateContent"
+                    ),
+                })
+    return endpoints
+
+
+def probe_all(
+    endpoints: Sequence[dict],
+    headers: Optional[dict] = None,
+    body: Optional[Union[dict, bytes]] = None,
+    method: str = 'POST',
+    timeout: float = DEFAULT_TIMEOUT,
+    stop_on_success: bool = True,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    verify: Union[bool, str] = True
+) -> List[ProbeResult]:
+    """
+    并发探测所有端点
+
+    Args:
+        endpoints: build_endpoints 的返回值
+        headers: 请求头（例如 auth_headers(token)）
+        body: 请求体，dict 会编码为 JSON
+        method: HTTP 方法
+        timeout: 每次探测的总超时（秒），也是整体等待的上限
+        stop_on_success: 第一个 200 返回后立即中止其余探测
+        max_workers: 同时进行的探测数
+        verify: TLS 校验，True / False 或 CA 证书路径
+
+    Returns:
+        list: 与 endpoints 顺序一致的 ProbeResult
+    """
+    if isinstance(body, dict):
+        body = json.dumps(body).encode('utf-8')
+    headers = dict(headers or {})
+    if body is not None:
+        headers.setdefault('Content-Type', 'application/json')
+    headers.setdefault('Connection', 'close')
+
+    probes = [_Probe(endpoint) for endpoint in endpoints]
+    done: 'queue.Queue[_Probe]' = queue.Queue()
+    slots = threading.Semaphore(max_workers)
+    stop = threading.Event()
+
+    def worker(probe: _Probe):
+        with slots:
+            probe.run(method, headers, body, timeout, verify)
+        done.put(probe)
+
+    # 守护线程：提前返回后，仍卡在 DNS 解析上的探测不会阻止进程退出
+    for probe in probes:
+        threading.Thread(target=worker, args=(probe,), name='endpoint-probe', daemon=True).start()
+
+    deadline = time.monotonic() + timeout * (1 + len(probes) // max(max_workers, 1))
+    finished = 0
+    while finished < len(probes):
+        try:
+            probe = done.get(timeout=max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            break
+        finished += 1
+        if probe.result.ok and stop_on_success:
+            stop.set()
+            for other in probes:
+                other.abort()
+            break
+
+    for probe in probes:
+        result = probe.result
+        if result.status is None and result.error is None:
+            result.cancelled = stop.is_set()
+            result.error = "已中止（其他端点已成功）" if stop.is_set() else f"超时（{timeout:.0f}s）"
+    return [probe.result for probe in probes]
+
+
+def _width(text: str, width: int) -> int:
+    """中文字符在终端中占两列，格式化宽度相应减少"""
+    return width - sum(1 for ch in text if ord(ch) > 0x2e80)
+
+
+def format_report(results: Sequence[ProbeResult]) -> str:
+    """把探测结果格式化为表格（耗时单位 ms，为累计时间）"""
+    lines = [f"{'端点':<{_width('端点', 44)}}{'状态':>{_width('状态', 8)}}" + ''.join(f"{phase:>9}" for phase in PHASES)]
+    for result in results:
+        status = str(result.status) if result.status is not None else ('中止' if result.cancelled else '错误')
+        name = result.name[:43]
+        cells = ''.join(
+            f"{result.timings[phase] * 1000:>9.1f}" if result.timings[phase] is not None else f"{'-':>9}"
+            for phase in PHASES
+        )
+        lines.append(f"{name:<{_width(name, 44)}}{status:>{_width(status, 8)}}{cells}")
+    return '\n'.join(lines)
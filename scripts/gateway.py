@@ -0,0 +1,595 @@
+#!/usr/bin/env python3
+"""
+本地生成网关 - 常驻进程，为 Next.js 服务端提供到模型的 HTTP 接口
+
+一次性的 CLI 每次运行都要重新加载凭证、签发令牌、建立连接。
+网关启动时解析一次凭证并预先取好令牌，之后所有请求共享同一个 GeminiHttpClient
+（连接池、限流、重试、缓存、用量统计都沿用 gemini_http 的环境变量配置）。
+
+接口：
+    POST /generate   {"prompt": "...", "model": "...", "generationConfig": {...}, "tag": "...", "priority": "high"}
+                     也可以直接传 {"contents": [...]}；返回 {"text", "model", "finishReason", "usage", ...}
+                     model 为 auto 时由模型路由按 priority（low / normal / high）等选择模型，返回的 model 是实际使用的模型
+    POST /stream     参数同上，以 SSE 返回 data: {"text": "..."}，最后一个事件是
+                     data: {"done": true, "finishReason": ..., "usage": ...}
+    GET  /healthz    进程状态、在途请求数、排队数
+    GET  /metrics    Prometheus 文本格式的网关计数、用量统计和模型路由决策
+
+准入控制：
+    同时调用上游的请求不超过 --concurrency，其余请求进入最多 --max-queue 个位置的等待队列；
+    队列已满或排队超过 --queue-timeout 秒时立即返回 503 和 Retry-After（按平均处理时间估算），
+    过载时快速失败，而不是让所有请求一起变慢。
+
+使用方法：
+    python scripts/gateway.py                              # 监听 127.0.0.1:8787
+    python scripts/gateway.py --concurrency 16 --max-queue 64
+    python scripts/gateway.py --mock                       # 同时启动本地模拟服务器作为上游
+
+    curl -s localhost:8787/generate -d '{"prompt": "你好"}'
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import time
+import socket
+import argparse
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+import tracing
+from content_pipeline import resolve_auth
+from gemini_http import GeminiHttpClient, get_default_client, build_payload, extract_text
+from token_cache import get_token_cache
+from model_catalog import UnknownModelError
+from model_router import DEFAULT_MODEL
+from rate_limiter import parse_retry_after
+from usage_meter import BudgetExceededError
+from model_router import PRIORITIES, routed_model
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8787
+DEFAULT_CONCURRENCY = 16
+DEFAULT_MAX_QUEUE = 64
+DEFAULT_QUEUE_TIMEOUT = 10.0
+USAGE_TAG = 'gateway'
+
+MAX_BODY_BYTES = 1 << 20
+# 模型名会拼进上游 URL 的路径，只允许常规字符
+MODEL_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*$')
+PAYLOAD_FIELDS = ('contents', 'generationConfig', 'systemInstruction', 'safetySettings')
+
+
+class OverloadedError(Exception):
+    """准入控制拒绝了请求"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    有界队列的准入控制（线程安全）
+
+    Args:
+        max_concurrency: 同时调用上游的请求数
+        max_queue: 等待队列的长度，队列满时直接拒绝
+        queue_timeout: 在队列中最长等待的秒数，超过后拒绝
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = DEFAULT_CONCURRENCY,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        queue_timeout: float = DEFAULT_QUEUE_TIMEOUT
+    ):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency 至少为 1")
+        if max_queue < 0:
+            raise ValueError("max_queue 不能为负数")
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._cond = threading.Condition()
+        self.active = 0
+        self.queued = 0
+        # 处理时间的指数移动平均（秒），用来估算 Retry-After
+        self._service_time: Optional[float] = None
+        self._stats = {
+            'admitted': 0, 'rejected_queue_full': 0, 'rejected_queue_timeout': 0,
+            'queue_wait_seconds': 0.0, 'max_active': 0, 'max_queued': 0,
+        }
+
+    def acquire(self) -> float:
+        """
+        申请一个处理位置
+
+        Returns:
+            float: 在队列中等待的秒数
+
+        Raises:
+            OverloadedError: 队列已满或排队超时
+        """
+        start = time.monotonic()
+        with self._cond:
+            if self.active < self.max_concurrency and not self.queued:
+                return self._admit(0.0)
+            if self.queued >= self.max_queue:
+                self._stats['rejected_queue_full'] += 1
+                raise OverloadedError('queue_full', self.retry_after())
+            self.queued += 1
+            self._stats['max_queued'] = max(self._stats['max_queued'], self.queued)
+            try:
+                admitted = self._cond.wait_for(
+                    lambda: self.active < self.max_concurrency, self.queue_timeout
+                )
+            finally:
+                self.queued -= 1
+            if not admitted:
+                self._stats['rejected_queue_timeout'] += 1
+                raise OverloadedError('queue_timeout', self.retry_after())
+            return self._admit(time.monotonic() - start)
+
+    def release(self, service_time: float):
+        """归还处理位置并更新平均处理时间"""
+        with self._cond:
+            self.active -= 1
+            if self._service_time is None:
+                self._service_time = service_time
+            else:
+                self._service_time += 0.2 * (service_time - self._service_time)
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        """
+        with 语句内占用一个处理位置，产出排队等待的秒数
+
+        Raises:
+            OverloadedError: 未获准入
+        """
+        waited = self.acquire()
+        start = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self.release(time.monotonic() - start)
+
+    def retry_after(self) -> int:
+        """估算排队的请求全部处理完需要的秒数（至少 1 秒，调用时须持有锁）"""
+        service_time = self._service_time or 1.0
+        return max(1, math.ceil((self.queued + 1) * service_time / self.max_concurrency))
+
+    def _admit(self, waited: float) -> float:
+        self.active += 1
+        self._stats['admitted'] += 1
+        self._stats['queue_wait_seconds'] += waited
+        self._stats['max_active'] = max(self._stats['max_active'], self.active)
+        return waited
+
+    def stats(self) -> dict:
+        with self._cond:
+            return dict(
+                self._stats,
+                active=self.active,
+                queued=self.queued,
+                max_concurrency=self.max_concurrency,
+                max_queue=self.max_queue,
+                service_time_ms=round((self._service_time or 0.0) * 1000, 1),
+            )
+
+
+def parse_request(body: dict, default_model: str) -> Tuple[str, dict, Optional[str], Optional[str]]:
+    """
+    从请求体中取出模型、generateContent 请求体、用量标签和优先级
+
+    Returns:
+        (模型, 请求体, 标签, 优先级)
+
+    Raises:
+        ValueError: 请求体不合法
+    """
+    if not isinstance(body, dict):
+        raise ValueError("请求体必须是 JSON 对象")
+    model = body.get('model') or default_model
+    if not isinstance(model, str) or not MODEL_PATTERN.match(model):
+        raise ValueError(f"无效的模型名称: {model!r}")
+    if body.get('contents'):
+        payload = {field: body[field] for field in PAYLOAD_FIELDS if field in body}
+    elif isinstance(body.get('prompt'), str) and body['prompt'].strip():
+        payload = build_payload(body['prompt'], body.get('generationConfig'))
+    else:
+        raise ValueError("请求体需要非空的 prompt 或 contents")
+    tag = body.get('tag')
+    if tag is not None and not isinstance(tag, str):
+        raise ValueError("tag 必须是字符串")
+    priority = body.get('priority')
+    if priority is not None and priority not in PRIORITIES:
+        raise ValueError(f"priority 必须是 {' / '.join(PRIORITIES)} 之一")
+    return model, payload, tag, priority
+
+
+def error_response(error: BaseException) -> Tuple[int, str, dict]:
+    """
+    把调用异常映射为 (状态码, 消息, 额外响应头)
+
+    上游的 429 原样返回并带上 Retry-After；其他上游 4xx 原样返回；
+    上游 5xx 和网络错误返回 502，超时返回 504。
+    """
+    if isinstance(error, OverloadedError):
+        return 503, f"网关繁忙（{error.reason}）", {'Retry-After': str(error.retry_after)}
+    if isinstance(error, UnknownModelError):
+        return 400, str(error), {}
+    if isinstance(error, BudgetExceededError):
+        return 429, str(error), {}
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if status is not None:
+        if status == 429:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            headers = {'Retry-After': str(math.ceil(retry_after))} if retry_after is not None else {}
+            return 429, "上游配额已用尽", headers
+        if 400 <= status < 500:
+            return status, f"上游返回 {status}: {response.text[:200]}", {}
+        return 502, f"上游返回 {status}", {}
+    if 'Timeout' in type(error).__name__:
+        return 504, f"上游超时: {error}", {}
+    return 502, f"{type(error).__name__}: {error}", {}
+
+
+class Gateway:
+    """
+    网关的调用部分：持有共享客户端、凭证和准入控制
+
+    Args:
+        client: GeminiHttpClient
+        admission: 准入控制
+        credentials: 服务账号凭证
+        api_key: API Key
+        pool: 凭证池（设置后忽略 credentials 和 api_key）
+        default_model: 请求未指定模型时使用的模型
+    """
+
+    def __init__(
+        self,
+        client: GeminiHttpClient,
+        admission: AdmissionController,
+        credentials=None,
+        api_key: Optional[str] = None,
+        pool=None,
+        default_model: str = DEFAULT_MODEL
+    ):
+        self.client = client
+        self.admission = admission
+        self.api_key = api_key
+        self.pool = pool
+        self.default_model = default_model
+        self.token_cache = get_token_cache(credentials) if credentials is not None and pool is None else None
+        self.started = time.time()
+
+        self._lock = threading.Lock()
+        self._requests = {}
+
+    def warm_up(self):
+        """启动时先取好访问令牌，第一个请求不需要等待签发"""
+        if self.token_cache is not None:
+            self.token_cache.get_token()
+
+    def generate(self, model: str, payload: dict, tag: Optional[str], priority: Optional[str] = None) -> dict:
+        if self.pool is not None:
+            return self.pool.generate_content(
+                model, payload, client=self.client, tag=tag or USAGE_TAG, priority=priority
+            )
+        return self.client.generate_content(
+            model, payload, self._access_token(), api_key=self.api_key, tag=tag or USAGE_TAG, priority=priority
+        )
+
+    def stream(self, model: str, payload: dict, tag: Optional[str], priority: Optional[str] = None):
+        if self.pool is not None:
+            return self.pool.stream_generate_content(
+                model, payload, client=self.client, tag=tag or USAGE_TAG, priority=priority
+            )
+        return self.client.stream_generate_content(
+            model, payload, self._access_token(), api_key=self.api_key, tag=tag or USAGE_TAG, priority=priority
+        )
+
+    def _access_token(self) -> Optional[str]:
+        return self.token_cache.get_token() if self.token_cache is not None else None
+
+    def count(self, endpoint: str, status: int):
+        with self._lock:
+            key = (endpoint, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def health(self) -> dict:
+        admission = self.admission.stats()
+        return {
+            'status': 'ok',
+            'uptime_s': round(time.time() - self.started, 1),
+            'auth': 'pool' if self.pool is not None else 'service_account' if self.token_cache else 'api_key',
+            'active': admission['active'],
+            'queued': admission['queued'],
+            'saturated': admission['queued'] >= admission['max_queue'],
+        }
+
+    def metrics(self) -> str:
+        """Prometheus 文本格式的网关计数，后面附上用量统计和模型路由决策"""
+        admission = self.admission.stats()
+        lines = [
+            '# HELP gateway_requests_total 网关处理的请求数（按接口和状态码）',
+            '# TYPE gateway_requests_total counter',
+        ]
+        with self._lock:
+            for (endpoint, status), count in sorted(self._requests.items()):
+                lines.append(f'gateway_requests_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+        lines += [
+            '# HELP gateway_rejected_total 准入控制拒绝的请求数',
+            '# TYPE gateway_rejected_total counter',
+            f'gateway_rejected_total{{reason="queue_full"}} {admission["rejected_queue_full"]}',
+            f'gateway_rejected_total{{reason="queue_timeout"}} {admission["rejected_queue_timeout"]}',
+            '# HELP gateway_admitted_total 获准调用上游的请求数',
+            '# TYPE gateway_admitted_total counter',
+            f'gateway_admitted_total {admission["admitted"]}',
+            '# HELP gateway_queue_wait_seconds_total 获准请求在队列中等待的总秒数',
+            '# TYPE gateway_queue_wait_seconds_total counter',
+            f'gateway_queue_wait_seconds_total {admission["queue_wait_seconds"]:.6f}',
+            '# HELP gateway_active 正在调用上游的请求数',
+            '# TYPE gateway_active gauge',
+            f'gateway_active {admission["active"]}',
+            '# HELP gateway_queued 正在排队的请求数',
+            '# TYPE gateway_queued gauge',
+            f'gateway_queued {admission["queued"]}',
+        ]
+        text = '\n'.join(lines) + '\n'
+        if self.client.usage_meter is not None:
+            text += self.client.usage_meter.to_prometheus()
+        if self.client.model_router is not None:
+            text += self.client.model_router.to_prometheus()
+        return text
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 才能保持 keep-alive 连接
+    protocol_version = 'HTTP/1.1'
+    server_version = 'GeminiGateway/1.0'
+
+    def setup(self):
+        super().setup()
+        # 流式响应按片段写出，关闭 Nagle 避免片段被攒在一起
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    @property
+    def gateway(self) -> Gateway:
+        return self.server.gateway
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/healthz':
+            self._send_json(200, self.gateway.health())
+        elif path == '/metrics':
+            body = self.gateway.metrics().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_error(404, f"未知路径: {path}")
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0]
+        if path not in ('/generate', '/stream'):
+            self._send_error(404, f"未知路径: {path}")
+            return
+        endpoint = path[1:]
+        try:
+            model, payload, tag, priority = parse_request(self._read_body(), self.gateway.default_model)
+        except ValueError as e:
+            self._finish(endpoint, 400, str(e))
+            return
+
+        try:
+            with self.gateway.admission.slot() as waited:
+                with tracing.span(f'gateway.{endpoint}', model=model, **{'gateway.queue_ms': waited * 1000}):
+                    if endpoint == 'stream':
+                        # 流式响应占用上游连接直到写完，整个过程都占着处理位置
+                        self._stream(model, payload, tag, priority)
+                        return
+                    response = self._generate(model, payload, tag, priority, waited)
+        except OverloadedError as e:
+            self._finish(endpoint, *error_response(e))
+            return
+        # 先归还处理位置再写响应：调用方收到响应后立即发出的下一个请求不会撞上尚未释放的位置
+        if response[0] == 200:
+            self.gateway.count('generate', 200)
+            self._send_json(200, response[1])
+        else:
+            self._finish('generate', *response)
+
+    def _generate(self, model: str, payload: dict, tag: Optional[str], priority: Optional[str], waited: float) -> tuple:
+        """调用上游，返回 (200, 响应体) 或 error_response() 的 (状态码, 消息, 响应头)"""
+        start = time.perf_counter()
+        try:
+            result = self.gateway.generate(model, payload, tag, priority)
+        except Exception as e:
+            return error_response(e)
+        candidates = result.get('candidates') or [{}]
+        return 200, {
+            'text': extract_text(result),
+            'model': routed_model(model, result),
+            'finishReason': candidates[0].get('finishReason'),
+            'usage': result.get('usageMetadata'),
+            'queue_ms': round(waited * 1000, 1),
+            'latency_ms': round((time.perf_counter() - start) * 1000, 1),
+        }
+
+    def _stream(self, model: str, payload: dict, tag: Optional[str], priority: Optional[str]):
+        try:
+            stream = self.gateway.stream(model, payload, tag, priority)
+        except Exception as e:
+            self._finish('stream', *error_response(e))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self.gateway.count('stream', 200)
+        chunks = iter(stream)
+        try:
+            for text in chunks:
+                self._write_event({'text': text})
+            self._write_event({
+                'done': True,
+                'finishReason': stream.finish_reason,
+                'usage': stream.usage_metadata,
+            })
+        except (ConnectionError, socket.timeout):
+            # 调用方断开：关闭上游的流，不再写响应
+            self.close_connection = True
+            return
+        except Exception as e:
+            # 响应头已经发出，错误以事件的形式告诉调用方
+            self._write_event({'error': {'message': f"{type(e).__name__}: {e}"}})
+        finally:
+            chunks.close()
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_event(self, event: dict):
+        data = f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b'\r\n')
+
+    def _read_body(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            raise ValueError(f"请求体超过 {MAX_BODY_BYTES} 字节")
+        try:
+            return json.loads(self.rfile.read(length)) if length else {}
+        except ValueError:
+            raise ValueError("请求体不是合法的 JSON")
+
+    def _finish(self, endpoint: str, status: int, message: str, headers: Optional[dict] = None):
+        self.gateway.count(endpoint, status)
+        self._send_error(status, message, headers)
+
+    def _send_json(self, status: int, data: dict, headers: Optional[dict] = None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str, headers: Optional[dict] = None):
+        self._send_json(status, {"error": {"code": status, "message": message}}, headers)
+
+
+class GatewayServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 默认的 listen backlog 只有 5，突发连接会在内核里被丢弃，拿不到 503
+    request_queue_size = 1024
+
+    def __init__(self, address, gateway: Gateway, verbose: bool = False):
+        super().__init__(address, GatewayHandler)
+        self.gateway = gateway
+        self.verbose = verbose
+
+    def handle_error(self, request, client_address):
+        # 调用方提前断开是正常情况，不打印堆栈
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+def start_gateway(gateway: Gateway, host: str = DEFAULT_HOST, port: int = 0) -> Tuple[GatewayServer, str]:
+    """
+    在后台线程中启动网关
+
+    Args:
+        gateway: Gateway
+        host: 监听地址
+        port: 端口，0 表示随机可用端口
+
+    Returns:
+        (服务器对象, 根地址)
+    """
+    server = GatewayServer((host, port), gateway)
+    thread = threading.Thread(target=server.serve_forever, name='gateway', daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地生成网关")
+    parser.add_argument('--host', default=DEFAULT_HOST, help="监听地址")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="监听端口")
+    parser.add_argument('--model', default=DEFAULT_MODEL, help="请求未指定模型时使用的模型")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help="同时调用上游的请求数")
+    parser.add_argument('--max-queue', type=int, default=DEFAULT_MAX_QUEUE, help="等待队列长度")
+    parser.add_argument('--queue-timeout', type=float, default=DEFAULT_QUEUE_TIMEOUT, help="最长排队秒数")
+    parser.add_argument('--mock', action='store_true', help="启动本地模拟服务器并以它为上游")
+    parser.add_argument('--mock-latency', type=float, default=0.05, help="模拟服务器的延迟（秒）")
+    parser.add_argument('--verbose', action='store_true', help="打印每个请求的访问日志")
+    args = parser.parse_args()
+
+    if args.mock:
+        import tempfile
+        from mock_gemini_server import MockConfig, start_mock_server, make_fake_service_account
+
+        _, mock_url = start_mock_server(config=MockConfig(latency=args.mock_latency))
+        os.environ['GEMINI_API_BASE'] = mock_url
+        os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = make_fake_service_account(
+            tempfile.mkdtemp(prefix='mock-gemini-'), mock_url
+        )
+        print(f"✓ 模拟服务器: {mock_url}")
+
+    client = get_default_client()
+    # 连接池至少要容纳全部并发，否则多出来的请求每次都新建连接
+    if client.pool_maxsize < args.concurrency:
+        print(f"⚠️  GEMINI_HTTP_POOL_SIZE={client.pool_maxsize} 小于并发数 {args.concurrency}，部分请求会新建连接")
+    admission = AdmissionController(args.concurrency, args.max_queue, args.queue_timeout)
+    gateway = Gateway(client, admission, default_model=args.model, **resolve_auth())
+    try:
+        gateway.warm_up()
+    except Exception as e:
+        print(f"❌ 获取访问令牌失败: {type(e).__name__}: {e}")
+        sys.exit(1)
+
+    server = GatewayServer((args.host, args.port), gateway, verbose=args.verbose)
+    print(f"✓ 网关已启动: http://{args.host}:{server.server_address[1]}")
+    print(f"  上游: {client.base_url}  默认模型: {args.model}")
+    print(f"  并发: {args.concurrency}  队列: {args.max_queue}  排队超时: {args.queue_timeout}s")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        client.close()
+
+    stats = admission.stats()
+    print("\n" + "=" * 60)
+    print("✅ 网关已停止")
+    print("=" * 60)
+    print(f"受理: {stats['admitted']}  拒绝: {stats['rejected_queue_full'] + stats['rejected_queue_timeout']}"
+          f"（队列满 {stats['rejected_queue_full']}，排队超时 {stats['rejected_queue_timeout']}）")
+    print(f"最大在途: {stats['max_active']}  最大排队: {stats['max_queued']}")
+
+
+if __name__ == "__main__":
+    main()
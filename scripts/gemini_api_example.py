@@ -13,11 +13,19 @@
 
 import os
 import json
-from typing import Optional
-from google.oauth2 import service_account
-import google.generativeai as genai
-import google.auth
-import google.auth.transport.requests
+from typing import Iterator, Optional
+import credentials_provider
+from token_cache import get_token_cache
+from tracing import traced
+from gemini_http import get_default_client, build_payload, extract_text
+from rate_limiter import is_quota_error
+from model_router import DEFAULT_MODEL, fixed_model
+
+SCOPES = [
+    'https://www.googleapis.com/auth/generative-language',
+    'https://www.googleapis.com/auth/cloud-platform'
+]
+
 
 def load_credentials():
     """
@@ -27,97 +35,42 @@ def load_credentials():
     1. GOOGLE_APPLICATION_CREDENTIALS (标准环境变量，指向 JSON 文件路径) - 推荐
     2. GOOGLE_SERVICE_ACCOUNT_KEY (自定义环境变量，指向 JSON 文件路径)
     3. GOOGLE_SERVICE_ACCOUNT_JSON (环境变量，直接包含 JSON 字符串)
+    4. 默认凭证（如果在 GCP 环境中运行）
+    
+    凭证由 credentials_provider 缓存，密钥文件只在首次调用或文件变化时解析。
     
     Returns:
         google.oauth2.service_account.Credentials: 服务账号凭证对象
     """
-    # 方法1: 从文件路径加载（推荐）
-    credentials_path = (
-        os.getenv('GOOGLE_APPLICATION_CREDENTIALS') 
-        or os.getenv('GOOGLE_SERVICE_ACCOUNT_KEY')
-    )
-    
-    if credentials_path and os.path.exists(credentials_path):
-        print(f"✓ 从文件加载凭证: {credentials_path}")
-        credentials = service_account.Credentials.from_service_account_file(
-            credentials_path,
-            scopes=[
-                'https://www.googleapis.com/auth/generative-language',
-                'https://www.googleapis.com/auth/cloud-platform'
-            ]
-        )
-        return credentials
-    
-    # 方法2: 从环境变量中的 JSON 字符串加载
-    json_str = os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON')
-    if json_str:
-        print("✓ 从环境变量加载凭证")
-        try:
-            service_account_info = json.loads(json_str)
-            credentials = service_account.Credentials.from_service_account_info(
-                service_account_info,
-                scopes=[
-                    'https://www.googleapis.com/auth/generative-language',
-                    'https://www.googleapis.com/auth/cloud-platform'
-                ]
-            )
-            return credentials
-        except json.JSONDecodeError as e:
-            raise ValueError(f"环境变量中的 JSON 格式无效: {e}")
-    
-    # 方法3: 尝试使用默认凭证（如果在 GCP 环境中运行）
-    try:
-        print("尝试使用默认凭证...")
-        credentials, project = google.auth.default(
-            scopes=[
-                'https://www.googleapis.com/auth/generative-language',
-                'https://www.googleapis.com/auth/cloud-platform'
-            ]
-        )
-        if credentials:
-            print("✓ 使用默认凭证")
-            return credentials
-    except Exception:
-        pass
-    
-    raise ValueError(
-        "\n❌ 未找到服务账号凭证。请设置以下环境变量之一：\n\n"
-        "  📁 方式1（推荐）: GOOGLE_APPLICATION_CREDENTIALS\n"
-        "     export GOOGLE_APPLICATION_CREDENTIALS=\"/path/to/service-account-key.json\"\n\n"
-        "  📁 方式2: GOOGLE_SERVICE_ACCOUNT_KEY\n"
-        "     export GOOGLE_SERVICE_ACCOUNT_KEY=\"/path/to/service-account-key.json\"\n\n"
-        "  📄 方式3: GOOGLE_SERVICE_ACCOUNT_JSON\n"
-        "     export GOOGLE_SERVICE_ACCOUNT_JSON='{\"type\":\"service_account\",...}'\n\n"
-        "💡 提示: 也可以使用 .env 文件来管理环境变量"
-    )
+    return credentials_provider.get_credentials(SCOPES)
 
 
 def get_access_token(credentials) -> str:
     """
     使用服务账号凭证获取访问令牌
     
+    令牌来自共享缓存，只有在临近过期时才会重新签发。
+    
     Args:
         credentials: 服务账号凭证对象
     
     Returns:
         str: 访问令牌
     """
-    # 刷新凭证以获取访问令牌
-    request = google.auth.transport.requests.Request()
-    credentials.refresh(request)
-    return credentials.token
+    return get_token_cache(credentials).get_token()
 
 
+@traced()
 def call_gemini_api_with_service_account(
     prompt: str, 
-    model_name: str = "gemini-1.5-pro"
+    model_name: str = DEFAULT_MODEL
 ) -> str:
     """
     使用服务账号凭证调用 Gemini API
     
     Args:
         prompt: 要发送给模型的提示文本
-        model_name: 使用的模型名称，默认为 "gemini-1.5-pro"
+        model_name: 使用的模型名称，默认为 GEMINI_MODEL 环境变量或 "gemini-2.5-flash"（auto 表示按路由选择）
     
     Returns:
         str: API 响应内容
@@ -126,6 +79,9 @@ def call_gemini_api_with_service_account(
         ValueError: 如果凭证加载失败
         Exception: 如果 API 调用失败
     """
+    # 在 try 之外导入，凭证加载失败时 except 子句中的 requests 才有定义
+    import requests
+
     try:
         # 加载服务账号凭证
         credentials = load_credentials()
@@ -145,8 +101,6 @@ def call_gemini_api_with_service_account(
         # 如果需要使用服务账号，可能需要使用 REST API 直接调用
         
         # 方式2: 使用 REST API 直接调用（更可靠）
-        import requests
-        
         project_id = credentials.project_id if hasattr(credentials, 'project_id') else None
         if not project_id:
             # 尝试从凭证信息中获取项目ID
@@ -156,34 +110,13 @@ def call_gemini_api_with_service_account(
                 if '@' in email:
                     project_id = email.split('@')[1].split('.')[0]
         
-        # Gemini API REST 端点
+        # 通过共享连接池调用 Gemini API REST 端点
         # 注意: 实际端点可能因版本而异，请参考最新文档
-        api_url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent"
-        
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "contents": [{
-                "parts": [{
-                    "text": prompt
-                }]
-            }]
-        }
-        
-        response = requests.post(api_url, headers=headers, json=payload)
-        response.raise_for_status()
-        
-        result = response.json()
+        client = get_default_client()
+        result = client.generate_content(model_name, build_payload(prompt), access_token)
         
         # 提取响应文本
-        if 'candidates' in result and len(result['candidates']) > 0:
-            content = result['candidates'][0]['content']['parts'][0]['text']
-            return content
-        else:
-            raise ValueError(f"API 响应格式异常: {result}")
+        return extract_text(result)
     
     except requests.exceptions.HTTPError as e:
         error_msg = f"HTTP 错误: {e.response.status_code}"
@@ -199,9 +132,35 @@ def call_gemini_api_with_service_account(
         raise
 
 
+def stream_gemini_api_with_service_account(
+    prompt: str, 
+    model_name: str = DEFAULT_MODEL
+) -> Iterator[str]:
+    """
+    使用服务账号凭证流式调用 Gemini API（streamGenerateContent）
+    
+    首个文本片段到达后立即返回，不必等待整个回复生成完毕。
+    
+    Args:
+        prompt: 要发送给模型的提示文本
+        model_name: 使用的模型名称
+    
+    Yields:
+        str: 文本片段
+    """
+    credentials = load_credentials()
+    access_token = get_access_token(credentials)
+    
+    client = get_default_client()
+    stream = client.stream_generate_content(model_name, build_payload(prompt), access_token)
+    yield from stream
+    print(f"\n⏱  首个片段耗时: {stream.time_to_first_chunk or 0:.3f}s，总耗时: {stream.total_time:.3f}s")
+
+
+@traced()
 def call_gemini_api_with_api_key(
     prompt: str, 
-    model_name: str = "gemini-1.5-pro"
+    model_name: str = DEFAULT_MODEL
 ) -> str:
     """
     使用 API Key 调用 Gemini API（备用方式）
@@ -217,8 +176,12 @@ def call_gemini_api_with_api_key(
     if not api_key:
         raise ValueError("未找到 GEMINI_API_KEY 环境变量")
     
+    # google.generativeai 导入约 600ms，只有 API Key 路径需要
+    import google.generativeai as genai
+
     genai.configure(api_key=api_key)
-    model = genai.GenerativeModel(model_name)
+    # SDK 路径不经过共享客户端，无法按请求路由
+    model = genai.GenerativeModel(fixed_model(model_name))
     response = model.generate_content(prompt)
     return response.text
 
@@ -246,6 +209,11 @@ def main():
     except Exception as service_account_error:
         print(f"\n⚠️  服务账号方式失败: {service_account_error}")
         
+        # 429 是配额问题，API Key 方式会撞上同一个配额，换方式重试没有意义
+        if is_quota_error(service_account_error):
+            print("\n⏳ 已达到配额上限（429）。限流器会按 Retry-After 自动放缓后续请求，请稍后再试。")
+            return
+        
         # 如果服务账号失败，尝试使用 API Key（如果有）
         print("\n📋 尝试使用 API Key...")
         try:
@@ -0,0 +1,302 @@
+"""
+asyncio 版 Gemini 客户端 - 有并发上限的异步调用
+
+REST 调用本身是同步的，这里把它放进线程池执行，用信号量限制同时进行的请求数。
+所有请求共享同一个令牌缓存和 HTTP 连接池，不会因为并发而重复签发令牌或建连。
+传入 pool（credential_pool.CredentialPool）时，请求分摊到池中的多个凭证。
+共享客户端开启了请求合并时，同时在途的相同请求在进入线程池之前就合并为一次。
+
+使用方法：
+    import asyncio
+    from gemini_async import AsyncGeminiClient
+
+    async def main():
+        async with AsyncGeminiClient(credentials, concurrency=8) as client:
+            text = await client.generate("你好")
+            texts = await client.gather(["问题1", "问题2", "问题3"])
+
+            stream = client.stream("你好")
+            async for chunk in stream:
+                print(chunk, end="")
+            print(stream.time_to_first_chunk)
+
+    asyncio.run(main())
+"""
+
+import os
+import copy
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, AsyncIterator, List, Optional
+
+from token_cache import get_token_cache
+from response_cache import make_key
+from single_flight import AsyncSingleFlight
+from gemini_http import GeminiHttpClient, GeminiStream, get_default_client, build_payload, extract_text
+from model_router import DEFAULT_MODEL
+
+if TYPE_CHECKING:
+    from credential_pool import CredentialPool
+
+DEFAULT_CONCURRENCY = 8
+
+
+_STREAM_END = object()
+
+
+class _StreamFailure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class AsyncGeminiStream:
+    """
+    GeminiStream 的异步版本：在工作线程中读取 SSE，通过队列把文本片段交给事件循环
+
+    迭代结束后 time_to_first_chunk / total_time / chunks / finish_reason / usage_metadata
+    与同步版含义相同。
+    """
+
+    def __init__(self, client: 'AsyncGeminiClient', model: str, payload: dict):
+        self._client = client
+        self._model = model
+        self._payload = payload
+        self._stream: Optional[GeminiStream] = None
+
+    def __getattr__(self, name):
+        if name in ('time_to_first_chunk', 'total_time', 'chunks', 'finish_reason', 'usage_metadata'):
+            return getattr(self._stream, name) if self._stream is not None else None
+        raise AttributeError(name)
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def produce():
+            try:
+                self._stream = self._client._stream_sync(self._model, self._payload)
+                if cancelled.is_set():
+                    self._stream.close()
+                    return
+                for chunk in self._stream:
+                    if cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
+                loop.call_soon_threadsafe(queue.put_nowait, _STREAM_END)
+            except BaseException as e:
+                loop.call_soon_threadsafe(queue.put_nowait, _StreamFailure(e))
+
+        async with self._client._semaphore():
+            # run_in_executor 不会复制上下文，手动带上当前的追踪 span
+            producer = loop.run_in_executor(self._client._executor, contextvars.copy_context().run, produce)
+            try:
+                while True:
+                    item = await queue.get()
+                    if item is _STREAM_END:
+                        break
+                    if isinstance(item, _StreamFailure):
+                        raise item.error
+                    yield item
+            finally:
+                # 调用方提前退出时通知工作线程停止读取，并关闭连接让阻塞中的读取立即返回，
+                # 否则要等到上游的下一个片段（或读取超时）才能归还并发名额
+                cancelled.set()
+                if self._stream is not None:
+                    self._stream.close()
+                await producer
+
+    async def text(self) -> str:
+        """读完整个流并返回拼接后的文本"""
+        return ''.join([chunk async for chunk in self])
+
+
+class AsyncGeminiClient:
+    """
+    有并发上限的异步 Gemini 客户端
+
+    Args:
+        credentials: 服务账号凭证；为 None 时使用 API Key
+        api_key: API Key，默认读取 GEMINI_API_KEY 环境变量
+        concurrency: 同时进行的最大请求数
+        client: 共享的 HTTP 客户端，默认使用进程内的默认客户端
+        model: 默认模型
+        pool: 凭证池；设置后忽略 credentials 和 api_key
+    """
+
+    def __init__(
+        self,
+        credentials=None,
+        api_key: Optional[str] = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        client: Optional[GeminiHttpClient] = None,
+        model: str = DEFAULT_MODEL,
+        pool: Optional['CredentialPool'] = None
+    ):
+        if concurrency < 1:
+            raise ValueError("concurrency 必须大于 0")
+        self.credentials = credentials
+        self.pool = pool
+        self.api_key = None if credentials or pool else (api_key or os.getenv('GEMINI_API_KEY'))
+        if credentials is None and pool is None and not self.api_key:
+            raise ValueError("未提供服务账号凭证，也未找到 GEMINI_API_KEY 环境变量")
+
+        self.concurrency = concurrency
+        self.client = client or get_default_client()
+        self.model = model
+        self._executor = ThreadPoolExecutor(
+            max_workers=concurrency,
+            thread_name_prefix='gemini-async'
+        )
+        self._semaphores = {}
+        # 跟随 HTTP 客户端的设置：相同请求只占用一个信号量名额和一个线程
+        self.single_flight = AsyncSingleFlight() if self.client.single_flight is not None else None
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        """每个事件循环各自的信号量"""
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    def _generate_content_sync(self, model: str, payload: dict) -> dict:
+        if self.pool is not None:
+            return self.pool.generate_content(model, payload, client=self.client)
+        access_token = get_token_cache(self.credentials).get_token() if self.credentials else None
+        return self.client.generate_content(model, payload, access_token, api_key=self.api_key)
+
+    def _stream_sync(self, model: str, payload: dict) -> GeminiStream:
+        if self.pool is not None:
+            return self.pool.stream_generate_content(model, payload, client=self.client)
+        access_token = get_token_cache(self.credentials).get_token() if self.credentials else None
+        return self.client.stream_generate_content(model, payload, access_token, api_key=self.api_key)
+
+    async def generate_content(self, payload: dict, model: Optional[str] = None) -> dict:
+        """
+        异步调用 generateContent，返回完整的 JSON 响应
+
+        Args:
+            payload: 请求体
+            model: 模型名称，默认使用客户端的默认模型
+
+        Returns:
+            dict: 解析后的 JSON 响应
+        """
+        model = model or self.model
+        if self.single_flight is None:
+            return await self._generate_content(model, payload)
+        result, shared = await self.single_flight.do(
+            make_key(model, payload),
+            lambda: self._generate_content(model, payload)
+        )
+        return copy.deepcopy(result) if shared else result
+
+    async def _generate_content(self, model: str, payload: dict) -> dict:
+        async with self._semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor,
+                contextvars.copy_context().run,
+                self._generate_content_sync,
+                model,
+                payload
+            )
+
+    async def generate(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        generation_config: Optional[dict] = None
+    ) -> str:
+        """
+        异步生成文本
+
+        Args:
+            prompt: 提示文本
+            model: 模型名称
+            generation_config: 生成参数
+
+        Returns:
+            str: 响应文本
+        """
+        result = await self.generate_content(build_payload(prompt, generation_config), model)
+        return extract_text(result)
+
+    def stream(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        generation_config: Optional[dict] = None
+    ) -> AsyncGeminiStream:
+        """
+        流式生成，用 async for 逐个读取文本片段（占用一个并发名额直到流结束）
+
+        Args:
+            prompt: 提示文本
+            model: 模型名称
+            generation_config: 生成参数
+
+        Returns:
+            AsyncGeminiStream: 异步文本片段迭代器
+        """
+        return AsyncGeminiStream(self, model or self.model, build_payload(prompt, generation_config))
+
+    async def gather(
+        self,
+        prompts: List[str],
+        model: Optional[str] = None,
+        generation_config: Optional[dict] = None,
+        return_exceptions: bool = False
+    ) -> list:
+        """
+        并发生成多个提示，结果按输入顺序返回
+
+        Args:
+            prompts: 提示列表
+            model: 模型名称
+            generation_config: 生成参数
+            return_exceptions: 为 True 时失败的提示返回异常对象而不是抛出
+
+        Returns:
+            list: 与 prompts 一一对应的结果
+        """
+        return await asyncio.gather(
+            *(self.generate(prompt, model, generation_config) for prompt in prompts),
+            return_exceptions=return_exceptions
+        )
+
+    async def close(self):
+        """关闭线程池（共享的 HTTP 客户端保持打开）"""
+        self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+async def generate_many(
+    prompts: List[str],
+    credentials=None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    **kwargs
+) -> list:
+    """
+    便捷函数：用临时的 AsyncGeminiClient 并发生成多个提示
+
+    Args:
+        prompts: 提示列表
+        credentials: 服务账号凭证
+        concurrency: 最大并发数
+        **kwargs: 传给 AsyncGeminiClient.gather 的参数
+
+    Returns:
+        list: 按输入顺序排列的结果
+    """
+    async with AsyncGeminiClient(credentials, concurrency=concurrency) as client:
+        return await client.gather(prompts, **kwargs)
@@ -0,0 +1,758 @@
+"""
+Gemini REST 客户端 - 所有调用路径共享的连接池
+
+模块级的 requests.post() 每次都会新建 TCP + TLS 连接。
+GeminiHttpClient 持有一个带连接池的 requests.Session，
+连接保持 keep-alive 并在调用之间复用，所有请求都带显式的连接 / 读取超时。
+
+使用方法：
+    from gemini_http import get_default_client, build_payload, extract_text
+
+    client = get_default_client()
+    result = client.generate_content("gemini-2.5-flash", build_payload(prompt), access_token)
+    print(extract_text(result))
+
+    # 流式输出：边生成边返回文本片段
+    stream = client.stream_generate_content("gemini-2.5-flash", build_payload(prompt), access_token)
+    for chunk in stream:
+        print(chunk, end="", flush=True)
+    print(f"首个片段耗时: {stream.time_to_first_chunk:.3f}s")
+
+环境变量（可选）：
+- GEMINI_API_BASE: API 根地址，默认 https://generativelanguage.googleapis.com
+- GEMINI_HTTP_POOL_SIZE: 每个主机的最大连接数，默认 16
+- GEMINI_CONNECT_TIMEOUT / GEMINI_READ_TIMEOUT: 连接 / 读取超时（秒）
+- GEMINI_CA_BUNDLE: 自定义 CA 证书（例如本地模拟服务器的自签名证书）
+- GEMINI_RESPONSE_CACHE: 响应缓存的 SQLite 文件路径，设置后启用两级响应缓存
+- GEMINI_RESPONSE_CACHE_TTL: 响应缓存有效期（秒）
+- GEMINI_RATE_LIMIT_RPM / GEMINI_RATE_LIMIT_TPM: 每个模型的请求数 / token 数上限（每分钟）；默认没有静态上限，
+  限流器只在收到 429 / 503 后按当时的请求速率降速；RPM 设为 0 完全关闭限流
+- GEMINI_MAX_ATTEMPTS: 每次调用最多尝试次数（含第一次），默认 3，设为 1 关闭重试
+- GEMINI_HEDGE_PERCENTILE: 设置后启用对冲请求，超过该延迟分位仍未返回时再发一份
+- GEMINI_MODEL_CATALOG: 发请求前的模型名检查，默认只在设置了 GEMINI_MODEL_CATALOG_FILE 时启用；1 强制开启，0 关闭
+- GEMINI_MODEL_CATALOG_FILE: 模型目录的持久化文件，CLI 启动时即可校验模型名
+- GEMINI_SINGLE_FLIGHT: 设为 0 关闭请求合并（同时在途的相同 generateContent 只发一次）
+- GEMINI_USAGE_METER: 设为 0 关闭用量统计；预算、价格表等见 usage_meter.py
+- GEMINI_SEMANTIC_CACHE: 语义缓存的索引路径，设置后启用按提示相似度命中的缓存（需要 numpy，见 semantic_cache.py）
+- GEMINI_ROUTER: 设为 0 关闭模型路由；模型名传 auto 时按延迟 / 错误率 / 提示长度 / 优先级选择模型（见 model_router.py）
+"""
+
+import os
+import copy
+import atexit
+import json
+import time
+import codecs
+import hashlib
+import threading
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional
+
+import tracing
+from response_cache import ResponseCache, DEFAULT_TTL, make_key
+from rate_limiter import AdaptiveRateLimiter, estimate_tokens
+from retry_policy import RetryPolicy, HedgePolicy
+from model_catalog import ModelCatalog, DEFAULT_TTL as DEFAULT_CATALOG_TTL
+from single_flight import SingleFlight
+from usage_meter import UsageMeter, current_tag, meter_from_env
+from model_router import ModelRouter, AUTO_MODEL, is_model_failure, router_from_env
+from semantic_cache import (
+    SemanticCache, GeminiEmbedder, HashingEmbedder, DEFAULT_THRESHOLD, DEFAULT_MAX_ENTRIES, DEFAULT_EMBED_MODEL
+)
+
+if TYPE_CHECKING:
+    import requests
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com"
+API_VERSION = "v1beta"
+
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 16
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 60.0
+
+
+def _requests():
+    """按需导入 requests（约 80ms），只 import 本模块的脚本不付这个代价"""
+    import requests
+    return requests
+
+
+def auth_headers(access_token: Optional[str] = None) -> dict:
+    """构造请求头，有访问令牌时带上 Bearer 认证"""
+    headers = {"Content-Type": "application/json"}
+    if access_token:
+        headers["Authorization"] = f"Bearer {access_token}"
+    return headers
+
+
+def build_payload(prompt: str, generation_config: Optional[dict] = None) -> dict:
+    """
+    构造 generateContent 请求体
+
+    Args:
+        prompt: 提示文本
+        generation_config: 生成参数（temperature、maxOutputTokens 等）
+
+    Returns:
+        dict: 请求体
+    """
+    payload = {
+        "contents": [{
+            "parts": [{"text": prompt}]
+        }]
+    }
+    if generation_config:
+        payload["generationConfig"] = dict(generation_config)
+    return payload
+
+
+def flight_key(cache_key: str, access_token: Optional[str], api_key: Optional[str]) -> str:
+    """
+    请求合并的键：请求体相同且凭证相同才合并
+
+    不同凭证的请求计入各自的配额和用量，合并后一个凭证的 429 / 403 会传给使用其他凭证的调用方。
+    键中只放凭证的摘要，不放凭证本身。
+    """
+    credential = hashlib.sha256(f"{access_token or ''}|{api_key or ''}".encode('utf-8')).hexdigest()[:16]
+    return f"{cache_key}|{credential}"
+
+
+def extract_text(result: dict) -> str:
+    """
+    从 generateContent 响应中提取文本
+
+    Raises:
+        ValueError: 响应中没有候选结果
+    """
+    if 'candidates' in result and len(result['candidates']) > 0:
+        return result['candidates'][0]['content']['parts'][0]['text']
+    raise ValueError(f"API 响应格式异常: {result}")
+
+
+class GeminiStreamError(Exception):
+    """流式响应中途出错（服务端错误事件或连接中断）；服务端错误事件的状态码在 status_code 中"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class SSEParser:
+    """
+    增量解析 server-sent events
+
+    网络分块可能落在事件中间，也可能把一个 UTF-8 多字节字符（中文）切成两半，
+    这里用增量解码器处理半个字符，用缓冲区处理半个事件。
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+
+    def feed(self, data: bytes) -> List[str]:
+        """
+        输入一段原始字节，返回其中已经完整的事件的 data 字段
+
+        Returns:
+            list: 每个完整事件的 data（多行 data 用换行连接）
+        """
+        # 在整个缓冲区上规范换行：\r 和 \n 可能落在两个分块里
+        self._buffer = (self._buffer + self._decoder.decode(data)).replace('\r\n', '\n')
+        events = []
+        while '\n\n' in self._buffer:
+            block, self._buffer = self._buffer.split('\n\n', 1)
+            lines = [line[5:].lstrip(' ') for line in block.split('\n') if line.startswith('data:')]
+            if lines:
+                events.append('\n'.join(lines))
+        return events
+
+    def close(self) -> List[str]:
+        """流结束时处理缓冲区中剩余的最后一个事件"""
+        self._buffer += self._decoder.decode(b'', final=True)
+        return self.feed(b'\n\n') if self._buffer.strip() else []
+
+
+class GeminiStream:
+    """
+    streamGenerateContent 的结果：逐个产出文本片段的迭代器
+
+    迭代结束后可以读取：
+    - time_to_first_chunk: 从发出请求到收到第一个文本片段的秒数
+    - total_time: 整个流的耗时
+    - chunks: 收到的文本片段数
+    - finish_reason / usage_metadata: 最后一个事件中的结束原因与用量
+    - error: 流中途出错时的 GeminiStreamError（读完或提前结束时为 None）
+    """
+
+    def __init__(self, response, started: float, on_finish=None):
+        self._response = response
+        self._started = started
+        self._finish_callbacks = [on_finish] if on_finish is not None else []
+        self._finish_lock = threading.Lock()
+        self._finished = False
+        self._closing = False
+        self.error: Optional[GeminiStreamError] = None
+        self.time_to_first_chunk: Optional[float] = None
+        self.total_time: Optional[float] = None
+        self.chunks = 0
+        self.finish_reason: Optional[str] = None
+        self.usage_metadata: Optional[dict] = None
+
+    def __iter__(self) -> Iterator[str]:
+        parser = SSEParser()
+        try:
+            for data in self._response.iter_content(chunk_size=None):
+                for event in parser.feed(data):
+                    text = self._handle_event(event)
+                    if text:
+                        yield text
+            for event in parser.close():
+                text = self._handle_event(event)
+                if text:
+                    yield text
+        except _requests().exceptions.RequestException as e:
+            error = GeminiStreamError(f"流式响应中断（已收到 {self.chunks} 个片段）: {e}")
+            # 调用方主动 close() 造成的中断不算出错
+            if not self._closing:
+                self.error = error
+            raise error from e
+        except GeminiStreamError as e:
+            self.error = e
+            raise
+        finally:
+            self._finish()
+
+    def text(self) -> str:
+        """读完整个流并返回拼接后的文本"""
+        return ''.join(self)
+
+    def close(self):
+        """提前结束流并关闭连接（可以从其他线程调用，正在等待下一个片段的读取随即结束）"""
+        self._closing = True
+        # 另一个线程阻塞在读取上时，关闭响应要等它释放缓冲区的锁；先 shutdown 套接字，让读取立即返回
+        connection = getattr(self._response.raw, '_connection', None)
+        sock = getattr(connection, 'sock', None)
+        if sock is not None:
+            import socket
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._finish()
+
+    def add_finish_callback(self, callback: Callable[['GeminiStream'], None]):
+        """流结束（读完、出错或 close()）时调用 callback(stream)；已经结束时立即调用"""
+        with self._finish_lock:
+            if not self._finished:
+                self._finish_callbacks.append(callback)
+                return
+        callback(self)
+
+    def _finish(self):
+        """记录总耗时、关闭连接并执行结束回调（只执行一次）"""
+        with self._finish_lock:
+            if self._finished:
+                return
+            self._finished = True
+            callbacks, self._finish_callbacks = self._finish_callbacks, []
+        self.total_time = time.perf_counter() - self._started
+        self._response.close()
+        for callback in callbacks:
+            callback(self)
+
+    def _handle_event(self, event: str) -> str:
+        try:
+            data = json.loads(event)
+        except ValueError:
+            raise GeminiStreamError(f"无法解析的事件: {event[:200]}")
+        if 'error' in data:
+            error = data['error']
+            raise GeminiStreamError(
+                f"服务端错误 {error.get('code')}: {error.get('message')}（已收到 {self.chunks} 个片段）",
+                error.get('code')
+            )
+
+        if 'usageMetadata' in data:
+            self.usage_metadata = data['usageMetadata']
+        text = ''
+        candidates = data.get('candidates') or []
+        if candidates:
+            candidate = candidates[0]
+            self.finish_reason = candidate.get('finishReason', self.finish_reason)
+            for part in candidate.get('content', {}).get('parts', []):
+                text += part.get('text', '')
+        if text:
+            if self.time_to_first_chunk is None:
+                self.time_to_first_chunk = time.perf_counter() - self._started
+            self.chunks += 1
+        return text
+
+
+class GeminiHttpClient:
+    """
+    持有连接池的 Gemini REST 客户端，线程安全，可在多个调用路径之间共享
+
+    Args:
+        base_url: API 根地址
+        pool_connections: 连接池缓存的主机数
+        pool_maxsize: 每个主机保持的最大连接数
+        connect_timeout: 连接超时（秒）
+        read_timeout: 读取超时（秒）
+        keep_alive: 是否复用连接，关闭后每个请求结束即断开
+        verify: TLS 校验，True / False 或 CA 证书路径
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        keep_alive: bool = True,
+        verify=True
+    ):
+        self.base_url = (base_url or os.getenv('GEMINI_API_BASE') or DEFAULT_BASE_URL).rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_maxsize = pool_maxsize
+        # 每个请求单独传 verify：requests 会用 REQUESTS_CA_BUNDLE 覆盖 session.verify
+        self.verify = verify
+
+        from requests.adapters import HTTPAdapter
+
+        self.session = _requests().Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+        # 可选的响应缓存（ResponseCache），命中时不发请求
+        self.response_cache: Optional[ResponseCache] = None
+        # 可选的自适应限流器（AdaptiveRateLimiter），发请求前申请额度
+        self.rate_limiter: Optional[AdaptiveRateLimiter] = None
+        # 可选的重试策略（RetryPolicy）与对冲策略（HedgePolicy）
+        self.retry_policy: Optional[RetryPolicy] = None
+        self.hedge_policy: Optional[HedgePolicy] = None
+        self.model_catalog: Optional[ModelCatalog] = None
+        self.single_flight: Optional[SingleFlight] = None
+        # 可选的用量统计（UsageMeter），记录每次上游调用的 usageMetadata，并检查预算
+        self.usage_meter: Optional[UsageMeter] = None
+        # 可选的语义缓存（SemanticCache），精确缓存未命中时按提示相似度查找
+        self.semantic_cache: Optional[SemanticCache] = None
+        # 可选的模型路由（ModelRouter）：记录每个模型的延迟 / 错误率，模型名为 auto 时选择模型
+        self.model_router: Optional[ModelRouter] = None
+
+    def url(self, path: str) -> str:
+        """把相对路径拼接成完整 URL，完整 URL 原样返回"""
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def request(self, method: str, path: str, **kwargs) -> 'requests.Response':
+        """发送请求，未指定超时时使用客户端默认的 (连接, 读取) 超时"""
+        kwargs.setdefault('timeout', self.timeout)
+        kwargs.setdefault('verify', self.verify)
+        url = self.url(path)
+        with tracing.span('http.request', **{'http.method': method, 'http.url': url}) as span:
+            response = self.session.request(method, url, **kwargs)
+            span.set_attribute('http.status_code', response.status_code)
+            return response
+
+    def get(self, path: str, **kwargs) -> 'requests.Response':
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> 'requests.Response':
+        return self.request('POST', path, **kwargs)
+
+    def generate_content(
+        self,
+        model: str,
+        payload: dict,
+        access_token: Optional[str] = None,
+        api_key: Optional[str] = None,
+        timeout=None,
+        use_cache: bool = True,
+        rate_limit_key: Optional[str] = None,
+        tag: Optional[str] = None,
+        priority: Optional[str] = None,
+        no_retry_status=()
+    ) -> dict:
+        """
+        调用 generateContent
+
+        Args:
+            model: 模型名称，例如 "gemini-2.5-flash"；auto 表示由模型路由选择
+            payload: 请求体
+            access_token: 服务账号访问令牌
+            api_key: API Key（与 access_token 二选一）
+            timeout: 覆盖默认超时（配置了重试策略时覆盖每次尝试的超时）
+            use_cache: 为 False 时跳过响应缓存和语义缓存的查询（结果仍会写入缓存）
+            rate_limit_key: 限流器的分组键，默认按模型；凭证池按 (凭证, 模型) 分组，每个项目各有配额
+            tag: 用量统计的调用方标签，默认取 usage_meter.usage_tag() 设置的标签
+            priority: 模型为 auto 时的调用方优先级（low / normal / high）
+            no_retry_status: 本次调用不由重试策略重试的 HTTP 状态码（凭证池用它把 429 留给自己换凭证）
+
+        Returns:
+            dict: 解析后的 JSON 响应
+
+        Raises:
+            requests.exceptions.HTTPError: 非 2xx 响应
+            model_catalog.UnknownModelError: 模型目录中没有该模型
+            usage_meter.BudgetExceededError: 已达到用量预算
+        """
+        if model == AUTO_MODEL:
+            return self.call_routed(payload, priority, lambda routed: self.generate_content(
+                routed, payload, access_token, api_key, timeout, use_cache, rate_limit_key, tag,
+                no_retry_status=no_retry_status
+            ))
+        tag = tag or current_tag()
+        cache_key = None
+        if self.response_cache is not None or self.single_flight is not None:
+            cache_key = make_key(model, payload)
+        if self.response_cache is not None and use_cache:
+            with tracing.span('response_cache.get') as span:
+                cached = self.response_cache.get(cache_key)
+                span.set_attribute('cache.hit', cached is not None)
+            if cached is not None:
+                return cached
+        vector = None
+        if self.semantic_cache is not None and use_cache:
+            with tracing.span('semantic_cache.get') as span:
+                cached, vector = self.semantic_cache.lookup(model, payload, access_token, api_key)
+                span.set_attribute('cache.hit', cached is not None)
+            if cached is not None:
+                return cached
+
+        def generate() -> dict:
+            return self._generate_content(
+                model, payload, access_token, api_key, timeout, rate_limit_key, cache_key, tag, no_retry_status
+            )
+
+        if self.single_flight is None:
+            result = generate()
+        else:
+            # 同时在途的相同请求只发一次；共享的结果复制一份，调用方之间互不影响
+            result, shared = self.single_flight.do(flight_key(cache_key, access_token, api_key), generate)
+            if shared:
+                tracing.current_span().set_attribute('single_flight.shared', True)
+                return copy.deepcopy(result)
+        if self.semantic_cache is not None:
+            self.semantic_cache.put(model, payload, result, vector, access_token, api_key)
+        return result
+
+    def invalidate(self, model: str, payload: dict):
+        """
+        从响应缓存和语义缓存中删除该请求的结果（调用方拒绝了这次响应时使用，否则下次运行还会命中它）
+
+        Args:
+            model: 模型名称；auto 时删除路由中每个模型的结果
+            payload: 请求体
+        """
+        if model == AUTO_MODEL:
+            models = self.model_router.models if self.model_router is not None else []
+        else:
+            models = [model]
+        for name in models:
+            if self.response_cache is not None:
+                self.response_cache.delete(make_key(name, payload))
+            if self.semantic_cache is not None:
+                self.semantic_cache.invalidate(name, payload)
+
+    def _generate_content(
+        self,
+        model: str,
+        payload: dict,
+        access_token: Optional[str],
+        api_key: Optional[str],
+        timeout,
+        rate_limit_key: Optional[str],
+        cache_key: Optional[str],
+        tag: str,
+        no_retry_status=()
+    ) -> dict:
+        """generateContent 的上游调用（检查模型和预算、限流、重试 / 对冲、记录用量、写入缓存）"""
+        self._check_model(model, access_token, api_key)
+        if self.usage_meter is not None:
+            self.usage_meter.check()
+        kwargs = {'headers': auth_headers(access_token), 'json': payload}
+        if api_key:
+            kwargs['params'] = {'key': api_key}
+
+        limit_key = rate_limit_key or model
+
+        def attempt(attempt_timeout) -> dict:
+            estimated = self._acquire(limit_key, payload)
+            started = time.perf_counter()
+            try:
+                response = self.post(
+                    f"{API_VERSION}/models/{model}:generateContent",
+                    timeout=timeout or attempt_timeout or self.timeout,
+                    **kwargs
+                )
+                if not response.ok:
+                    self._report(limit_key, response, estimated)
+                    response.raise_for_status()
+            except Exception as e:
+                self._observe(model, None, e)
+                raise
+            self._observe(model, time.perf_counter() - started)
+            with tracing.span('parse_response', **{'http.response_bytes': len(response.content)}):
+                result = response.json()
+            self._report(limit_key, response, estimated, result.get('usageMetadata'))
+            if self.usage_meter is not None:
+                # 对冲请求的每一份都会计费，所以每次成功的尝试都记录
+                self.usage_meter.record(model, result.get('usageMetadata'), tag)
+            return result
+
+        result = self._execute(attempt, hedge=True, no_retry_status=no_retry_status)
+
+        if self.response_cache is not None:
+            self.response_cache.put(cache_key, result, model)
+        return result
+
+    def stream_generate_content(
+        self,
+        model: str,
+        payload: dict,
+        access_token: Optional[str] = None,
+        api_key: Optional[str] = None,
+        timeout=None,
+        rate_limit_key: Optional[str] = None,
+        tag: Optional[str] = None,
+        priority: Optional[str] = None,
+        no_retry_status=()
+    ) -> GeminiStream:
+        """
+        调用 streamGenerateContent（SSE），返回逐个产出文本片段的 GeminiStream
+
+        Args:
+            model: 模型名称
+            payload: 请求体
+            access_token: 服务账号访问令牌
+            api_key: API Key（与 access_token 二选一）
+            timeout: 覆盖默认超时（读取超时是两个片段之间的最长间隔）
+            rate_limit_key: 限流器的分组键，默认按模型
+            tag: 用量统计的调用方标签（流结束时按最后一个事件的 usageMetadata 记录）
+            priority: 模型为 auto 时的调用方优先级（只在建立流时改用其他模型）
+            no_retry_status: 建立流时不由重试策略重试的 HTTP 状态码
+
+        Returns:
+            GeminiStream: 文本片段迭代器
+
+        Raises:
+            requests.exceptions.HTTPError: 建立流之前返回非 2xx 响应
+            model_catalog.UnknownModelError: 模型目录中没有该模型
+            usage_meter.BudgetExceededError: 已达到用量预算
+        """
+        if model == AUTO_MODEL:
+            return self.call_routed(payload, priority, lambda routed: self.stream_generate_content(
+                routed, payload, access_token, api_key, timeout, rate_limit_key, tag,
+                no_retry_status=no_retry_status
+            ))
+        self._check_model(model, access_token, api_key)
+        on_finish = None
+        if self.usage_meter is not None:
+            self.usage_meter.check()
+            meter, tag = self.usage_meter, tag or current_tag()
+
+            def on_finish(stream: GeminiStream):
+                meter.record(model, stream.usage_metadata, tag)
+        params = {'alt': 'sse'}
+        if api_key:
+            params['key'] = api_key
+        kwargs = {'headers': auth_headers(access_token), 'json': payload, 'params': params, 'stream': True}
+        started = time.perf_counter()
+        limit_key = rate_limit_key or model
+
+        def attempt(attempt_timeout):
+            estimated = self._acquire(limit_key, payload)
+            try:
+                response = self.post(
+                    f"{API_VERSION}/models/{model}:streamGenerateContent",
+                    timeout=timeout or attempt_timeout or self.timeout,
+                    **kwargs
+                )
+                self._report(limit_key, response, estimated)
+                if not response.ok:
+                    # 读出错误正文后再抛出，连接可以归还连接池
+                    response.content
+                    response.raise_for_status()
+            except Exception as e:
+                self._observe(model, None, e)
+                raise
+            # 建立流的耗时与完整生成不可比，只记录成功与否
+            self._observe(model, None)
+            return response
+
+        # 只重试建立流的阶段，已经开始输出的流中途出错不会自动重发
+        return GeminiStream(self._execute(attempt, no_retry_status=no_retry_status), started, on_finish)
+
+    def call_routed(self, payload: dict, priority: Optional[str], call: Callable[[str], object]):
+        """
+        由模型路由选择模型后执行 call(模型)；模型本身不健康导致的失败（429 / 5xx / 超时）改用下一个健康模型
+
+        Args:
+            payload: 请求体（用于估算提示长度）
+            priority: 调用方优先级
+            call: 用具体模型名发起调用的函数
+
+        Raises:
+            ValueError: 未启用模型路由，或优先级无效
+        """
+        if self.model_router is None:
+            raise ValueError(f"模型名 {AUTO_MODEL} 需要启用模型路由（GEMINI_ROUTER 不能为 0）")
+        models, reason = self.model_router.route(payload, priority)
+        with tracing.span('model_router.route', model=models[0], reason=reason):
+            for index, model in enumerate(models):
+                try:
+                    return call(model)
+                except Exception as e:
+                    if index + 1 == len(models) or not is_model_failure(e):
+                        raise
+                    self.model_router.record_failover(model, models[index + 1])
+
+    def _execute(self, attempt, hedge: bool = False, no_retry_status=()):
+        """按重试 / 对冲策略执行 attempt(本次尝试的超时)，no_retry_status 中的状态码直接抛出"""
+        send = attempt
+        if hedge and self.hedge_policy is not None:
+            def send(attempt_timeout):
+                return self.hedge_policy.run(lambda: attempt(attempt_timeout))
+        if self.retry_policy is not None:
+            policy = self.retry_policy
+            if no_retry_status:
+                policy = policy.without_status(no_retry_status)
+            return policy.call(send)
+        return send(None)
+
+    def _check_model(self, model: str, access_token: Optional[str], api_key: Optional[str]):
+        """发请求前用模型目录检查模型名（目录中 streamGenerateContent 归在 generateContent 下）"""
+        if self.model_catalog is not None:
+            self.model_catalog.check_model(model, 'generateContent', access_token, api_key)
+
+    def _acquire(self, model: str, payload: dict) -> int:
+        """向限流器申请额度，返回估算的 token 数"""
+        estimated = estimate_tokens(payload)
+        if self.rate_limiter is not None:
+            with tracing.span('rate_limit.acquire', model=model) as span:
+                span.set_attribute('wait_seconds', self.rate_limiter.acquire(model, estimated))
+        return estimated
+
+    def _observe(self, model: str, latency: Optional[float], error: Optional[BaseException] = None):
+        """把一次上游尝试的结果反馈给模型路由（请求本身有问题的 4xx 不算模型不健康）"""
+        if self.model_router is None:
+            return
+        if error is None:
+            self.model_router.record(model, latency, True)
+        elif is_model_failure(error):
+            self.model_router.record(model, None, False)
+
+    def _report(self, model: str, response, estimated: int, usage: Optional[dict] = None):
+        """把响应状态和实际 token 用量反馈给限流器"""
+        if self.rate_limiter is None:
+            return
+        self.rate_limiter.on_response(
+            model,
+            response.status_code,
+            response.headers.get('Retry-After'),
+            tokens_used=(usage or {}).get('promptTokenCount'),
+            tokens_estimated=estimated
+        )
+
+    def close(self):
+        """关闭连接池（有语义缓存时先写回索引）"""
+        if self.semantic_cache is not None:
+            self.semantic_cache.close()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_default_client: Optional[GeminiHttpClient] = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client() -> GeminiHttpClient:
+    """
+    获取进程内共享的默认客户端（首次调用时按环境变量创建）
+
+    Returns:
+        GeminiHttpClient: 共享客户端
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = GeminiHttpClient(
+                pool_maxsize=int(os.getenv('GEMINI_HTTP_POOL_SIZE', DEFAULT_POOL_MAXSIZE)),
+                connect_timeout=float(os.getenv('GEMINI_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT)),
+                read_timeout=float(os.getenv('GEMINI_READ_TIMEOUT', DEFAULT_READ_TIMEOUT)),
+                verify=os.getenv('GEMINI_CA_BUNDLE') or True
+            )
+            # 默认不设静态上限：没有 429 时不限制，第一次被限流后才按当时的请求速率降速
+            rpm = os.getenv('GEMINI_RATE_LIMIT_RPM')
+            tpm = os.getenv('GEMINI_RATE_LIMIT_TPM')
+            if not rpm or float(rpm) > 0:
+                _default_client.rate_limiter = AdaptiveRateLimiter(
+                    requests_per_minute=float(rpm) if rpm else None,
+                    tokens_per_minute=float(tpm) if tpm else None
+                )
+            max_attempts = int(os.getenv('GEMINI_MAX_ATTEMPTS', 3))
+            if max_attempts > 1:
+                _default_client.retry_policy = RetryPolicy(
+                    max_attempts=max_attempts,
+                    attempt_timeout=_default_client.timeout
+                )
+            hedge_percentile = os.getenv('GEMINI_HEDGE_PERCENTILE')
+            if hedge_percentile:
+                _default_client.hedge_policy = HedgePolicy(percentile=float(hedge_percentile))
+            cache_path = os.getenv('GEMINI_RESPONSE_CACHE')
+            if cache_path:
+                _default_client.response_cache = ResponseCache(
+                    sqlite_path=cache_path,
+                    ttl=float(os.getenv('GEMINI_RESPONSE_CACHE_TTL', DEFAULT_TTL))
+                )
+            if os.getenv('GEMINI_SINGLE_FLIGHT', '1') != '0':
+                _default_client.single_flight = SingleFlight()
+            _default_client.usage_meter = meter_from_env()
+            _default_client.model_router = router_from_env()
+            semantic_path = os.getenv('GEMINI_SEMANTIC_CACHE')
+            if semantic_path:
+                _default_client.semantic_cache = _semantic_cache_from_env(_default_client, semantic_path)
+            # 没有持久化文件时，每个短时运行的 CLI 都要在第一次调用前多拉取一次完整目录，所以默认不开启
+            catalog_file = os.getenv('GEMINI_MODEL_CATALOG_FILE')
+            catalog_enabled = os.getenv('GEMINI_MODEL_CATALOG', '1' if catalog_file else '0')
+            if catalog_enabled != '0':
+                _default_client.model_catalog = ModelCatalog(
+                    client=_default_client,
+                    ttl=DEFAULT_CATALOG_TTL,
+                    cache_file=catalog_file
+                )
+        return _default_client
+
+
+def _semantic_cache_from_env(client: GeminiHttpClient, path: str) -> SemanticCache:
+    """按环境变量创建语义缓存，进程退出时写回索引"""
+    embed_model = os.getenv('GEMINI_EMBED_MODEL', DEFAULT_EMBED_MODEL)
+    embedder = HashingEmbedder() if embed_model == 'hashing' else GeminiEmbedder(client, embed_model)
+    cache = SemanticCache(
+        embedder,
+        threshold=float(os.getenv('GEMINI_SEMANTIC_THRESHOLD', DEFAULT_THRESHOLD)),
+        max_entries=int(os.getenv('GEMINI_SEMANTIC_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)),
+        path=path
+    )
+    atexit.register(cache.save)
+    return cache
+
+
+def set_default_client(client: Optional[GeminiHttpClient]):
+    """替换默认客户端（例如指向本地模拟服务器），传 None 则下次调用时重新创建"""
+    global _default_client
+    with _default_client_lock:
+        _default_client = client
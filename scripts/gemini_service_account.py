@@ -8,9 +8,11 @@
 """
 
 import os
-from google.oauth2 import service_account
-import google.generativeai as genai
-import google.auth.transport.requests
+import credentials_provider
+from token_cache import get_token_cache
+from tracing import traced
+from gemini_http import get_default_client, build_payload, extract_text
+from model_router import DEFAULT_MODEL, fixed_model
 
 def setup_gemini_with_service_account():
     """
@@ -40,15 +42,11 @@ def setup_gemini_with_service_account():
     
     print(f"✓ 找到密钥文件：{credentials_path}")
     
-    # 2. 加载服务账号凭证
-    credentials = service_account.Credentials.from_service_account_file(
-        credentials_path,
-        scopes=['https://www.googleapis.com/auth/generative-language']
-    )
+    # 2. 加载服务账号凭证（进程内缓存，密钥文件只解析一次）
+    credentials = credentials_provider.get_credentials()
     
-    # 3. 刷新凭证以获取访问令牌
-    request = google.auth.transport.requests.Request()
-    credentials.refresh(request)
+    # 3. 获取访问令牌（写入共享缓存，后续调用直接复用）
+    get_token_cache(credentials).get_token()
     
     print("✓ 凭证加载成功")
     
@@ -61,6 +59,8 @@ def setup_gemini_with_service_account():
     try:
         # 注意：这种方法可能不适用于所有版本
         # 如果报错，请使用方法2（见下面的 call_gemini_with_rest_api 函数）
+        # google.generativeai 导入约 600ms，只在走这条路径时才加载
+        import google.generativeai as genai
         genai.configure(credentials=credentials)
         print("✓ 使用服务账号凭证配置 Gemini")
         return credentials
@@ -75,7 +75,8 @@ def call_gemini_simple(prompt: str):
     使用 google.generativeai 库调用 Gemini（如果支持服务账号）
     """
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
+        import google.generativeai as genai
+        model = genai.GenerativeModel(fixed_model(DEFAULT_MODEL))
         response = model.generate_content(prompt)
         return response.text
     except Exception as e:
@@ -87,38 +88,20 @@ def call_gemini_simple(prompt: str):
         )
 
 
+@traced()
 def call_gemini_with_rest_api(prompt: str, credentials):
     """
     使用 REST API 调用 Gemini（推荐用于服务账号）
     
     如果 google.generativeai 库不支持服务账号，可以使用这个函数。
     """
-    import requests
+    # 从共享缓存获取令牌（setup 阶段已签发过，这里直接命中）
+    access_token = get_token_cache(credentials).get_token()
     
-    # 刷新令牌
-    request = google.auth.transport.requests.Request()
-    credentials.refresh(request)
-    access_token = credentials.token
-    
-    # 调用 Gemini API
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
-    
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
-        "contents": [{
-            "parts": [{"text": prompt}]
-        }]
-    }
-    
-    response = requests.post(url, headers=headers, json=payload)
-    response.raise_for_status()
-    
-    result = response.json()
-    return result['candidates'][0]['content']['parts'][0]['text']
+    # 通过共享连接池调用 Gemini API
+    client = get_default_client()
+    result = client.generate_content(DEFAULT_MODEL, build_payload(prompt), access_token)
+    return extract_text(result)
 
 
 def main():
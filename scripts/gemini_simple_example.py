@@ -8,81 +8,44 @@
 2. 运行: python scripts/gemini_simple_example.py
 """
 
-import os
-import json
-import requests
-from google.oauth2 import service_account
-import google.auth.transport.requests
+import credentials_provider
+from token_cache import get_token_cache
+from tracing import traced
+from gemini_http import get_default_client, build_payload, extract_text
+from model_router import DEFAULT_MODEL
 
 def get_credentials():
     """
-    从环境变量加载服务账号凭证
+    从环境变量加载服务账号凭证（由 credentials_provider 缓存，每个进程只解析一次密钥）
     
     支持的环境变量：
     - GOOGLE_APPLICATION_CREDENTIALS: JSON 密钥文件路径（推荐）
     - GOOGLE_SERVICE_ACCOUNT_KEY: JSON 密钥文件路径（备选）
+    - GOOGLE_SERVICE_ACCOUNT_JSON: JSON 字符串
     """
-    # 方式1: 从文件路径加载
-    key_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS') or os.getenv('GOOGLE_SERVICE_ACCOUNT_KEY')
-    
-    if key_path and os.path.exists(key_path):
-        print(f"✓ 加载凭证文件: {key_path}")
-        return service_account.Credentials.from_service_account_file(
-            key_path,
-            scopes=['https://www.googleapis.com/auth/generative-language']
-        )
-    
-    # 方式2: 从环境变量中的 JSON 字符串加载
-    json_str = os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON')
-    if json_str:
-        print("✓ 从环境变量加载凭证")
-        return service_account.Credentials.from_service_account_info(
-            json.loads(json_str),
-            scopes=['https://www.googleapis.com/auth/generative-language']
-        )
-    
-    raise ValueError(
-        "❌ 未找到服务账号凭证。请设置环境变量：\n"
-        "export GOOGLE_APPLICATION_CREDENTIALS=\"/path/to/key.json\""
-    )
+    return credentials_provider.get_credentials()
 
 
-def call_gemini(prompt: str, model: str = "gemini-1.5-pro") -> str:
+@traced()
+def call_gemini(prompt: str, model: str = DEFAULT_MODEL) -> str:
     """
     调用 Gemini API
     
     Args:
         prompt: 提示文本
-        model: 模型名称，默认为 gemini-1.5-pro
+        model: 模型名称，默认为 GEMINI_MODEL 环境变量或 gemini-2.5-flash（auto 表示按路由选择）
     
     Returns:
         API 响应文本
     """
     # 加载凭证并获取访问令牌
     credentials = get_credentials()
-    request = google.auth.transport.requests.Request()
-    credentials.refresh(request)
-    access_token = credentials.token
-    
-    # 调用 Gemini API
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
-    
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
-        "contents": [{
-            "parts": [{"text": prompt}]
-        }]
-    }
-    
-    response = requests.post(url, headers=headers, json=payload)
-    response.raise_for_status()
+    access_token = get_token_cache(credentials).get_token()
     
-    result = response.json()
-    return result['candidates'][0]['content']['parts'][0]['text']
+    # 通过共享连接池调用 Gemini API
+    client = get_default_client()
+    result = client.generate_content(model, build_payload(prompt), access_token)
+    return extract_text(result)
 
 
 if __name__ == "__main__":
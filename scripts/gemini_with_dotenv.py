@@ -9,58 +9,30 @@
 3. 运行: python scripts/gemini_with_dotenv.py
 """
 
-import os
 from dotenv import load_dotenv
-import requests
-from google.oauth2 import service_account
-import google.auth.transport.requests
+import credentials_provider
+from token_cache import get_token_cache
+from tracing import traced
+from gemini_http import get_default_client, build_payload, extract_text
+from model_router import DEFAULT_MODEL
 
 # 加载 .env 文件中的环境变量
 load_dotenv()
 
 def get_credentials():
-    """从环境变量加载服务账号凭证"""
-    key_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-    
-    if not key_path:
-        raise ValueError(
-            "❌ 未找到 GOOGLE_APPLICATION_CREDENTIALS 环境变量。\n"
-            "请确保 .env 文件已正确配置。"
-        )
-    
-    if not os.path.exists(key_path):
-        raise FileNotFoundError(
-            f"❌ 密钥文件不存在: {key_path}\n"
-            "请检查 .env 文件中的路径是否正确。"
-        )
-    
-    print(f"✓ 加载凭证文件: {key_path}")
-    return service_account.Credentials.from_service_account_file(
-        key_path,
-        scopes=['https://www.googleapis.com/auth/generative-language']
-    )
+    """从环境变量加载服务账号凭证（由 credentials_provider 缓存）"""
+    return credentials_provider.get_credentials()
 
 
-def call_gemini(prompt: str, model: str = "gemini-1.5-pro") -> str:
+@traced()
+def call_gemini(prompt: str, model: str = DEFAULT_MODEL) -> str:
     """调用 Gemini API"""
     credentials = get_credentials()
-    request = google.auth.transport.requests.Request()
-    credentials.refresh(request)
-    
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
-    headers = {
-        "Authorization": f"Bearer {credentials.token}",
-        "Content-Type": "application/json"
-    }
-    
-    response = requests.post(
-        url,
-        headers=headers,
-        json={"contents": [{"parts": [{"text": prompt}]}]}
-    )
-    response.raise_for_status()
+    access_token = get_token_cache(credentials).get_token()
     
-    return response.json()['candidates'][0]['content']['parts'][0]['text']
+    client = get_default_client()
+    result = client.generate_content(model, build_payload(prompt), access_token)
+    return extract_text(result)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+批量改写内容 - 为原型和临在之锚情境生成新版本的文案
+
+从 content/*.ts 读取现有内容，为每个条目构造提示，并发调用 Gemini（结构化 JSON 输出），
+检查结果中是否出现禁用说法，再写出与原文件同样结构的 TS 文件供审阅：
+- 原型（content/archetypes.ts）：改写 meme / identify / core / allowStatement，
+  不得出现该原型 forbidden 中的说法；旧 ID 的兼容条目跟随对应的原型，不单独生成
+- 情境（content/anchor.ts 的 anchorContents）：改写 cognitiveSteps / oldNarrative / newCognition，
+  不得出现任何原型的 forbidden 说法
+
+输出（默认 content/generated/）：
+    archetypes.ts   export const archetypes，可直接替换 content/archetypes.ts 中的同名导出
+    anchor.ts       export const anchorContents
+    manifest.json   每个条目的输入哈希
+
+增量生成：
+    清单记录每个条目上次被采用时的输入哈希（提示 + 模型 + 生成参数）。
+    只修改了一个原型时，再次运行只会重新生成这个原型；其余条目沿用上一次的输出。
+    出现禁用说法的结果会带着提醒重试（--max-attempts），仍不通过时保留上一版，下次运行再试。
+
+使用方法：
+    python scripts/generate_content.py                      # 增量生成全部条目
+    python scripts/generate_content.py --only archetypes    # 只处理原型
+    python scripts/generate_content.py --ids shrink,bracing # 只处理指定条目
+    python scripts/generate_content.py --dry-run            # 只列出需要生成的条目
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Dict, List, Optional, Sequence
+
+from ts_content import CONTENT_DIR, content_path, load_export, to_ts_literal
+from content_pipeline import (
+    DEFAULT_MODEL, DEFAULT_CONCURRENCY, Manifest, Generator,
+    input_hash, resolve_auth
+)
+from gemini_http import build_payload
+from usage_meter import format_summary
+
+DEFAULT_OUTPUT_DIR = os.path.join(CONTENT_DIR, 'generated')
+DEFAULT_MAX_ATTEMPTS = 3
+
+KINDS = ('archetypes', 'anchors')
+USAGE_TAG = 'generate_content'
+
+ARCHETYPE_FIELDS = ('meme', 'identify', 'core', 'allowStatement')
+
+ARCHETYPE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {field: {"type": "STRING"} for field in ARCHETYPE_FIELDS},
+    "required": list(ARCHETYPE_FIELDS),
+}
+
+ANCHOR_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "cognitiveSteps": {"type": "ARRAY", "items": {"type": "STRING"}, "minItems": 3, "maxItems": 5},
+        "oldNarrative": {"type": "STRING"},
+        "newCognition": {"type": "STRING"},
+    },
+    "required": ["cognitiveSteps", "oldNarrative", "newCognition"],
+}
+
+ARCHETYPE_PROMPT = """你在为一个帮助用户理解自己情绪反应模式的产品改写「{name}」这个反应原型的文案。
+
+现在的版本：
+- meme（玩梗版，入口层，让人点进来）：{meme}
+- identify（识别版，中间层，让人对号入座）：{identify}
+- core（元人格句，核心层，停住的那一刻）：{core}
+- allowStatement（允许句，给身体发通行证）：{allowStatement}
+
+请写一个新版本，四个字段的作用和长度与现在的版本相近：
+- meme 以「你是不是那种：」开头；identify 和 core 分两行，用换行符分隔
+- 语气温和、克制，只描述，不评判、不鼓励、不给建议
+- 不要使用以下说法：{forbidden}
+
+以 JSON 输出，字段为 meme、identify、core、allowStatement。"""
+
+ANCHOR_PROMPT = """你在为一个帮助用户安顿当下的产品改写「{label}」这个情境的认知拆解文案。
+
+现在的版本：
+- cognitiveSteps（逐条出现的拆解句）：
+{steps}
+- oldNarrative（旧叙事，会被划掉）：{oldNarrative}
+- newCognition（新认知，高亮显示）：{newCognition}
+
+请写一个新版本：
+- cognitiveSteps 3 到 5 句，每句简短，合起来是一段完整的话；较长的句子可以用换行符断开
+- oldNarrative 是用户心里那句很重的话，newCognition 是一句更松动的新说法
+- 语气温和、克制，不评判、不鼓励、不给建议
+- 不要使用以下说法：{forbidden}
+
+以 JSON 输出，字段为 cognitiveSteps（字符串数组）、oldNarrative、newCognition。"""
+
+RETRY_NOTE = "\n\n注意：上一次的结果使用了禁用的说法 {phrases}，这一次请完全避开。"
+
+GENERATION_CONFIG = {"temperature": 0.9, "responseMimeType": "application/json"}
+
+
+def _format_forbidden(phrases: Sequence[str]) -> str:
+    return '、'.join(f"「{phrase}」" for phrase in phrases) or '无'
+
+
+def _one_line(text: str) -> str:
+    return text.replace('\n', '\\n')
+
+
+def find_forbidden(fields, phrases: Sequence[str]) -> List[str]:
+    """
+    找出生成结果中出现的禁用说法
+
+    Args:
+        fields: 生成的字段（dict / list / str，递归检查所有字符串）
+        phrases: 禁用说法
+
+    Returns:
+        list: 出现过的禁用说法
+    """
+    texts = []
+
+    def collect(value):
+        if isinstance(value, str):
+            texts.append(value)
+        elif isinstance(value, dict):
+            for item in value.values():
+                collect(item)
+        elif isinstance(value, list):
+            for item in value:
+                collect(item)
+
+    collect(fields)
+    return [phrase for phrase in phrases if any(phrase in text for text in texts)]
+
+
+class Entry:
+    """
+    一个待生成的条目
+
+    Args:
+        key: 清单中的键（archetype:shrink / anchor:bracing）
+        kind: archetypes 或 anchors
+        item_id: 条目 ID
+        prompt: 提示
+        schema: responseSchema
+        forbidden: 禁用说法
+    """
+
+    def __init__(self, key: str, kind: str, item_id: str, prompt: str, schema: dict, forbidden: Sequence[str]):
+        self.key = key
+        self.kind = kind
+        self.item_id = item_id
+        self.prompt = prompt
+        self.schema = schema
+        self.forbidden = list(forbidden)
+
+    def payload(self, violations: Sequence[str] = ()) -> dict:
+        prompt = self.prompt
+        if violations:
+            prompt += RETRY_NOTE.format(phrases=_format_forbidden(violations))
+        return build_payload(prompt, dict(GENERATION_CONFIG, responseSchema=self.schema))
+
+    def parse(self, text: str) -> dict:
+        """
+        解析生成结果，转换为 content 中的字段结构
+
+        Raises:
+            ValueError: 不是合法的 JSON 或缺少字段
+        """
+        data = json.loads(text)
+        if not isinstance(data, dict):
+            raise ValueError("结果不是 JSON 对象")
+        missing = [name for name in self.schema['required'] if not data.get(name)]
+        if missing:
+            raise ValueError(f"结果缺少字段: {', '.join(missing)}")
+        if self.kind == 'archetypes':
+            return {field: str(data[field]).strip() for field in ARCHETYPE_FIELDS}
+        steps = data['cognitiveSteps']
+        if not isinstance(steps, list):
+            raise ValueError("cognitiveSteps 不是数组")
+        return {
+            'cognitiveSteps': [{'text': str(step).strip()} for step in steps],
+            'oldNarrative': str(data['oldNarrative']).strip(),
+            'newCognition': str(data['newCognition']).strip(),
+        }
+
+
+def build_entries(archetypes: Dict[str, dict], situations: List[dict], anchors: Dict[str, dict]) -> List[Entry]:
+    """为每个原型（不含旧 ID 的兼容条目）和每个情境构造条目"""
+    entries = []
+    for key, archetype in archetypes.items():
+        if archetype['id'] != key:
+            continue
+        prompt = ARCHETYPE_PROMPT.format(
+            name=archetype['name'],
+            forbidden=_format_forbidden(archetype['forbidden']),
+            **{field: _one_line(archetype[field]) for field in ARCHETYPE_FIELDS}
+        )
+        entries.append(Entry(f"archetype:{key}", 'archetypes', key, prompt, ARCHETYPE_SCHEMA, archetype['forbidden']))
+
+    # 情境没有自己的禁用说法，沿用所有原型的禁用说法
+    all_forbidden = sorted({phrase for archetype in archetypes.values() for phrase in archetype['forbidden']})
+    labels = {situation['id']: situation['label'] for situation in situations}
+    for key, anchor in anchors.items():
+        prompt = ANCHOR_PROMPT.format(
+            label=labels.get(anchor['situation'], anchor['situation']),
+            steps='\n'.join(f"  {i}. {_one_line(step['text'])}" for i, step in enumerate(anchor['cognitiveSteps'], 1)),
+            oldNarrative=anchor['oldNarrative'],
+            newCognition=anchor['newCognition'],
+            forbidden=_format_forbidden(all_forbidden),
+        )
+        entries.append(Entry(f"anchor:{key}", 'anchors', key, prompt, ANCHOR_SCHEMA, all_forbidden))
+    return entries
+
+
+def _load_previous(path: str, name: str) -> Dict[str, dict]:
+    """上一次生成的输出，不存在时为空"""
+    if not os.path.exists(path):
+        return {}
+    return load_export(path, name)
+
+
+def render_archetypes(source: Dict[str, dict], generated: Dict[str, dict]) -> str:
+    """以 content/archetypes.ts 为底，替换生成的字段；旧 ID 的兼容条目取对应原型的生成结果"""
+    merged = {key: dict(archetype, **generated.get(archetype['id'], {})) for key, archetype in source.items()}
+    return (
+        "// 由 scripts/generate_content.py 生成，审阅后替换 content/archetypes.ts 中的同名导出\n"
+        "import type { Archetype } from '../archetypes';\n\n"
+        f"export const archetypes: Record<string, Archetype> = {to_ts_literal(merged)};\n"
+    )
+
+
+def render_anchors(source: Dict[str, dict], generated: Dict[str, dict]) -> str:
+    merged = {key: dict(anchor, **generated.get(key, {})) for key, anchor in source.items()}
+    return (
+        "// 由 scripts/generate_content.py 生成，审阅后替换 content/anchor.ts 中的同名导出\n"
+        "import type { AnchorContent } from '../anchor';\n\n"
+        f"export const anchorContents: Record<string, AnchorContent> = {to_ts_literal(merged)};\n"
+    )
+
+
+def _write_text_atomic(path: str, text: str):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def generate(
+    generator: Generator,
+    entries: List[Entry],
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS
+) -> Dict[str, Optional[dict]]:
+    """
+    并发生成所有条目，出现禁用说法或格式错误的条目带着提醒重试
+
+    Args:
+        generator: content_pipeline.Generator
+        entries: 待生成的条目
+        max_attempts: 每个条目最多生成几次
+
+    Returns:
+        dict: {条目键: 字段}，最终仍未通过的条目为 None
+    """
+    by_key = {entry.key: entry for entry in entries}
+    results: Dict[str, Optional[dict]] = {}
+    pending = {entry.key: [] for entry in entries}
+
+    for attempt in range(1, max_attempts + 1):
+        if not pending:
+            break
+        jobs = [(key, by_key[key].payload(violations)) for key, violations in pending.items()]
+        payloads = dict(jobs)
+        pending = {}
+        # 重试的请求体与第一次几乎相同，查缓存只会拿回同一个被拒绝的结果
+        for key, text, error in generator.run(jobs, use_cache=attempt == 1):
+            entry = by_key[key]
+            if error is None:
+                try:
+                    fields = entry.parse(text)
+                except ValueError as e:
+                    error = e
+                    generator.invalidate(payloads[key])
+            if error is not None:
+                print(f"❌ {key}（第 {attempt} 次）: {type(error).__name__}: {error}")
+                pending[key] = []
+                continue
+            violations = find_forbidden(fields, entry.forbidden)
+            if violations:
+                print(f"⚠️  {key}（第 {attempt} 次）: 出现禁用说法 {_format_forbidden(violations)}")
+                # 被拒绝的结果留在缓存里，下次运行第一次尝试还会拿回它
+                generator.invalidate(payloads[key])
+                pending[key] = violations
+                continue
+            results[key] = fields
+            print(f"✓ {key}")
+
+    for key in pending:
+        results[key] = None
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量改写原型和情境文案")
+    parser.add_argument('--model', default=DEFAULT_MODEL, help="模型名称")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help="并发请求数")
+    parser.add_argument('--only', choices=KINDS, help="只处理原型或情境")
+    parser.add_argument('--ids', default='', help="只处理这些条目 ID（逗号分隔）")
+    parser.add_argument('--content-dir', default=None, help="content 目录（默认仓库中的 content/）")
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR, help="生成的 TS 文件和清单的目录")
+    parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS, help="每个条目最多生成几次")
+    parser.add_argument('--force', action='store_true', help="忽略清单，重新生成选中的条目")
+    parser.add_argument('--dry-run', action='store_true', help="只列出需要生成的条目")
+    args = parser.parse_args()
+
+    content_dir = args.content_dir or CONTENT_DIR
+    if os.path.abspath(args.output_dir) == os.path.abspath(content_dir):
+        print("❌ 输出目录不能是 content 目录本身（生成的文件只包含部分导出）")
+        sys.exit(1)
+
+    archetypes = load_export(content_path('archetypes.ts', content_dir), 'archetypes')
+    anchor_file = content_path('anchor.ts', content_dir)
+    situations = load_export(anchor_file, 'situations')
+    anchors = load_export(anchor_file, 'anchorContents')
+
+    archetypes_out = os.path.join(args.output_dir, 'archetypes.ts')
+    anchors_out = os.path.join(args.output_dir, 'anchor.ts')
+    previous = {
+        'archetypes': {
+            key: {field: archetype[field] for field in ARCHETYPE_FIELDS}
+            for key, archetype in _load_previous(archetypes_out, 'archetypes').items()
+            if archetype['id'] == key
+        },
+        'anchors': {
+            key: {field: anchor[field] for field in ('cognitiveSteps', 'oldNarrative', 'newCognition')}
+            for key, anchor in _load_previous(anchors_out, 'anchorContents').items()
+        },
+    }
+
+    entries = build_entries(archetypes, situations, anchors)
+    manifest = Manifest.load(os.path.join(args.output_dir, 'manifest.json'))
+    manifest.prune(entry.key for entry in entries)
+
+    ids = {item.strip() for item in args.ids.split(',') if item.strip()}
+    digests = {entry.key: input_hash(args.model, entry.payload()) for entry in entries}
+    selected = [
+        entry for entry in entries
+        if (not args.only or entry.kind == args.only) and (not ids or entry.item_id in ids)
+    ]
+    stale = [
+        entry for entry in selected
+        if args.force
+        or entry.item_id not in previous[entry.kind]
+        or not manifest.is_current(entry.key, digests[entry.key])
+    ]
+
+    print(f"📋 条目: {len(entries)}  选中: {len(selected)}  需要生成: {len(stale)}")
+    if args.dry_run:
+        for entry in stale:
+            print(f"  · {entry.key}")
+        return
+
+    start = time.perf_counter()
+    failed = []
+    if stale:
+        generator = Generator(args.model, args.concurrency, tag=USAGE_TAG, **resolve_auth())
+        by_key = {entry.key: entry for entry in stale}
+        for key, fields in generate(generator, stale, args.max_attempts).items():
+            entry = by_key[key]
+            if fields is None:
+                failed.append(key)
+                continue
+            previous[entry.kind][entry.item_id] = fields
+            manifest.record(key, digests[key], args.model)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    _write_text_atomic(archetypes_out, render_archetypes(archetypes, previous['archetypes']))
+    _write_text_atomic(anchors_out, render_anchors(anchors, previous['anchors']))
+    manifest.save()
+
+    print("\n" + "=" * 60)
+    print("✅ 生成完成")
+    print("=" * 60)
+    print(f"生成: {len(stale) - len(failed)}  未通过: {len(failed)}  沿用: {len(entries) - len(stale)}")
+    print(f"耗时: {time.perf_counter() - start:.2f}s")
+    if stale and generator.client.usage_meter is not None:
+        print(f"用量: {format_summary(generator.client.usage_meter, USAGE_TAG)}")
+    print(f"输出: {archetypes_out}, {anchors_out}")
+    if failed:
+        print(f"未通过的条目保留上一版，下次运行重试: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
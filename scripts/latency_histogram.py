@@ -0,0 +1,157 @@
+"""
+延迟直方图 - HdrHistogram 风格的对数-线性分桶
+
+按排序列表算百分位（retry_policy.percentile）需要保存每一个样本，压测跑几十万个请求时
+内存和排序开销都会变大。LatencyHistogram 用固定精度的分桶计数：
+- 每个 2 的幂区间再线性分成若干子桶，相对误差不超过 10^-significant_digits
+- 记录一次是 O(1) 的整数运算，内存只和出现过的桶数有关
+- 多个直方图可以 merge()，适合每个工作线程各记一份最后合并
+
+使用方法：
+    from latency_histogram import LatencyHistogram
+
+    histogram = LatencyHistogram()
+    histogram.record(0.0123)                 # 秒
+    print(histogram.value_at_percentile(99)) # 秒
+    for p, value, count in histogram.percentile_table():
+        ...
+"""
+
+import math
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+# 内部以微秒为单位计数
+UNIT = 1_000_000
+DEFAULT_SIGNIFICANT_DIGITS = 2
+DEFAULT_PERCENTILES = (50, 75, 90, 95, 99, 99.9, 99.99, 100)
+
+
+class LatencyHistogram:
+    """
+    对数-线性分桶的延迟直方图（线程安全）
+
+    Args:
+        significant_digits: 有效数字位数（1~5），2 表示相对误差不超过 1%
+    """
+
+    def __init__(self, significant_digits: int = DEFAULT_SIGNIFICANT_DIGITS):
+        if not 1 <= significant_digits <= 5:
+            raise ValueError("significant_digits 必须在 1~5 之间")
+        self.significant_digits = significant_digits
+        # 每个 2 的幂区间的子桶数：能区分 2 * 10^digits 个值的最小 2 的幂
+        self._sub_bits = math.ceil(math.log2(2 * 10 ** significant_digits))
+        self._sub_count = 1 << self._sub_bits
+        self._sub_half = self._sub_count >> 1
+        self._sub_mask = self._sub_count - 1
+
+        self._lock = threading.Lock()
+        self._counts: Dict[int, int] = {}
+        self.total_count = 0
+        self._total_us = 0
+        self._min_us = None
+        self._max_us = 0
+
+    def _index(self, value_us: int) -> int:
+        bucket = (value_us | self._sub_mask).bit_length() - self._sub_bits
+        sub = value_us >> bucket
+        return (bucket + 1) * self._sub_half + sub - self._sub_half
+
+    def _highest_equivalent(self, index: int) -> int:
+        """桶内的最大值（HdrHistogram 报告百分位时使用的值）"""
+        bucket = index // self._sub_half - 1
+        sub = index % self._sub_half + self._sub_half
+        if bucket < 0:
+            bucket, sub = 0, sub - self._sub_half
+        return ((sub + 1) << bucket) - 1
+
+    def record(self, seconds: float, count: int = 1):
+        """记录 count 个延迟为 seconds 秒的样本（负数按 0 记）"""
+        value_us = max(0, int(seconds * UNIT))
+        index = self._index(value_us)
+        with self._lock:
+            self._counts[index] = self._counts.get(index, 0) + count
+            self.total_count += count
+            self._total_us += value_us * count
+            if self._min_us is None or value_us < self._min_us:
+                self._min_us = value_us
+            if value_us > self._max_us:
+                self._max_us = value_us
+
+    def merge(self, other: 'LatencyHistogram'):
+        """把另一个直方图的计数加到本直方图（精度必须相同）"""
+        if other.significant_digits != self.significant_digits:
+            raise ValueError("只能合并精度相同的直方图")
+        with other._lock:
+            counts = dict(other._counts)
+            total, total_us = other.total_count, other._total_us
+            min_us, max_us = other._min_us, other._max_us
+        with self._lock:
+            for index, count in counts.items():
+                self._counts[index] = self._counts.get(index, 0) + count
+            self.total_count += total
+            self._total_us += total_us
+            if min_us is not None and (self._min_us is None or min_us < self._min_us):
+                self._min_us = min_us
+            self._max_us = max(self._max_us, max_us)
+
+    def value_at_percentile(self, p: float) -> float:
+        """
+        百分位对应的延迟（秒），没有样本时返回 0
+
+        Args:
+            p: 0~100
+        """
+        return self.values_at_percentiles([p])[0]
+
+    def values_at_percentiles(self, percentiles: Iterable[float]) -> List[float]:
+        """一次遍历算出多个百分位（秒）"""
+        percentiles = list(percentiles)
+        with self._lock:
+            if not self.total_count:
+                return [0.0] * len(percentiles)
+            items = sorted(self._counts.items())
+            total, max_us = self.total_count, self._max_us
+        results = []
+        for p in percentiles:
+            # 至少落在第 1 个样本上，p=100 取最大值
+            target = max(1, math.ceil(min(100.0, max(0.0, p)) / 100 * total))
+            seen = 0
+            value_us = max_us
+            for index, count in items:
+                seen += count
+                if seen >= target:
+                    value_us = min(self._highest_equivalent(index), max_us)
+                    break
+            results.append(value_us / UNIT)
+        return results
+
+    def percentile_table(self, percentiles: Iterable[float] = DEFAULT_PERCENTILES) -> List[Tuple[float, float, int]]:
+        """
+        百分位表
+
+        Returns:
+            list: [(百分位, 延迟秒数, 小于等于该延迟的样本数), ...]
+        """
+        percentiles = list(percentiles)
+        values = self.values_at_percentiles(percentiles)
+        total = self.total_count
+        return [
+            (p, value, min(total, max(1, math.ceil(p / 100 * total))) if total else 0)
+            for p, value in zip(percentiles, values)
+        ]
+
+    @property
+    def mean(self) -> float:
+        with self._lock:
+            return self._total_us / self.total_count / UNIT if self.total_count else 0.0
+
+    @property
+    def min(self) -> float:
+        with self._lock:
+            return (self._min_us or 0) / UNIT
+
+    @property
+    def max(self) -> float:
+        with self._lock:
+            return self._max_us / UNIT
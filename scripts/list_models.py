@@ -1,60 +1,61 @@
 #!/usr/bin/env python3
 """
 列出可用的 Gemini 模型
+
+模型列表来自共享客户端的模型目录（model_catalog）：跟随所有分页拉取。
+设置 GEMINI_MODEL_CATALOG_FILE 后目录会保存到本地文件，跨进程复用：
+有效期内再次运行不发请求，过期后带 If-None-Match，目录没有变化时服务端只返回 304。
 """
 
 import os
-import json
-import requests
-from google.oauth2 import service_account
-import google.auth.transport.requests
+import tracing
+import credentials_provider
+from token_cache import get_token_cache
+from gemini_http import get_default_client
+from model_catalog import ModelCatalog
+
+
+def get_catalog() -> ModelCatalog:
+    """共享客户端的模型目录（共享客户端没有启用目录时单独创建一个）"""
+    client = get_default_client()
+    if client.model_catalog is None:
+        client.model_catalog = ModelCatalog(client=client, cache_file=os.getenv('GEMINI_MODEL_CATALOG_FILE'))
+    return client.model_catalog
 
+
+@tracing.traced()
 def list_models():
     """列出可用的模型"""
-    key_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-    
-    credentials = service_account.Credentials.from_service_account_file(
-        key_path,
-        scopes=['https://www.googleapis.com/auth/generative-language']
-    )
-    
-    request = google.auth.transport.requests.Request()
-    credentials.refresh(request)
+    credentials = credentials_provider.get_credentials()
     
-    url = "https://generativelanguage.googleapis.com/v1beta/models"
-    headers = {
-        "Authorization": f"Bearer {credentials.token}",
-        "Content-Type": "application/json"
-    }
+    access_token = get_token_cache(credentials).get_token()
     
     print("正在获取可用模型列表...\n")
-    response = requests.get(url, headers=headers)
-    
-    if response.status_code == 200:
-        models = response.json()
-        print("=" * 60)
-        print("✅ 可用模型列表:")
-        print("=" * 60)
-        
-        if 'models' in models:
-            for model in models['models']:
-                name = model.get('name', '')
-                display_name = model.get('displayName', '')
-                description = model.get('description', '')
-                
-                # 只显示支持 generateContent 的模型
-                supported_methods = model.get('supportedGenerationMethods', [])
-                if 'generateContent' in supported_methods:
-                    print(f"\n📌 {display_name or name}")
-                    print(f"   名称: {name}")
-                    if description:
-                        print(f"   说明: {description}")
-        
-        return models
-    else:
+    catalog = get_catalog()
+    try:
+        changed = catalog.ensure_fresh(access_token=access_token)
+    except Exception as e:
+        response = getattr(e, 'response', None)
+        if response is None:
+            raise
         print(f"❌ 错误 {response.status_code}: {response.text}")
         return None
+    
+    print("=" * 60)
+    print("✅ 可用模型列表:" if changed else "✅ 可用模型列表（未变化，使用缓存）:")
+    print("=" * 60)
+    
+    # 只显示支持 generateContent 的模型（按方法建立的索引，不必逐个过滤）
+    for model in catalog.models('generateContent'):
+        name = model.get('name', '')
+        display_name = model.get('displayName', '')
+        description = model.get('description', '')
+        print(f"\n📌 {display_name or name}")
+        print(f"   名称: {name}")
+        if description:
+            print(f"   说明: {description}")
+    
+    return {'models': catalog.models()}
 
 if __name__ == "__main__":
     list_models()
-
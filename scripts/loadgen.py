@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+开环压测 - 按固定到达率（泊松过程）发送请求，逐级升高 RPS 找到饱和拐点
+
+闭环压测（发一个、等返回、再发下一个）在被测系统变慢时会自动少发请求，
+慢的那段时间里本该发出的请求根本没有被测量（coordinated omission），尾延迟被严重低估。
+这里按预先排好的到达时间发送请求，与响应快慢无关：
+- 校正延迟 = 完成时间 - 计划发送时间，包含请求因为工作线程占满而被推迟的时间
+- 服务延迟 = 完成时间 - 实际发送时间，即闭环压测看到的数字，两者的差距就是被掩盖的排队
+- 每级结束后仍未发出的请求记为丢弃，按「已经等待的时间」计入校正延迟（下界）
+
+每级判定是否饱和：达成吞吐低于实际到达率的 (1 - --tolerance)、有丢弃、错误率超过 --max-error-rate，
+或校正 p99 超过第一级的 --knee-factor 倍；第一个饱和级别之前的一级就是拐点。
+
+可压测的调用路径（--target）：
+- client：content_pipeline 的共享客户端（凭证池 > 服务账号 > GEMINI_API_KEY）
+- call_gemini / call_gemini_with_rest_api / call_gemini_api_with_service_account / list_models：
+  与 bench_suite.py 相同的示例调用路径
+- gateway：本地生成网关的 POST /generate（--url）
+
+默认在进程内启动本地模拟服务器作为上游；--api-base 指向独立运行的模拟服务器（避免与压测进程争抢 GIL）。
+
+使用方法：
+    python scripts/loadgen.py --rps 20:200:20 --step-duration 10
+    python scripts/loadgen.py --target gateway --url http://127.0.0.1:8787 --rps 50,100,200
+    python scripts/loadgen.py --rps 100 --csv steps.csv --percentiles-csv percentiles.csv
+"""
+
+import io
+import os
+import csv
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, List
+
+from latency_histogram import LatencyHistogram, DEFAULT_PERCENTILES
+from model_router import DEFAULT_MODEL
+
+DEFAULT_MAX_WORKERS = 256
+DEFAULT_DRAIN_TIMEOUT = 10.0
+WORKER_PREFIX = 'loadgen'
+CALL_PATHS = ('call_gemini', 'call_gemini_with_rest_api', 'call_gemini_api_with_service_account', 'list_models')
+TARGETS = ('client',) + CALL_PATHS + ('gateway',)
+
+
+def parse_rps(spec: str) -> List[float]:
+    """
+    解析 RPS 级别：单个值、逗号分隔的列表或 起始:结束:步长
+
+    Raises:
+        ValueError: 格式不正确
+    """
+    if ':' in spec:
+        start, stop, step = (float(x) for x in spec.split(':'))
+        if start <= 0 or step <= 0 or stop < start:
+            raise ValueError(f"无效的 RPS 范围: {spec}")
+        levels, value = [], start
+        while value <= stop + 1e-9:
+            levels.append(round(value, 6))
+            value += step
+        return levels
+    levels = [float(x) for x in spec.split(',') if x.strip()]
+    if not levels or any(level <= 0 for level in levels):
+        raise ValueError(f"无效的 RPS: {spec}")
+    return levels
+
+
+def build_target(name: str, model: str, url: str, max_workers: int) -> Callable[[int], None]:
+    """
+    构造压测的调用：fn(序号)，失败时抛出异常
+
+    client 和 gateway 的提示带上序号，避免被请求合并或响应缓存吸收。
+    """
+    if name == 'gateway':
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        session.mount('http://', HTTPAdapter(pool_maxsize=max_workers))
+        session.mount('https://', HTTPAdapter(pool_maxsize=max_workers))
+        endpoint = f"{url.rstrip('/')}/generate"
+
+        def call(sequence: int):
+            response = session.post(
+                endpoint, json={"prompt": f"压测请求 {sequence}", "model": model, "tag": "loadgen"}, timeout=60
+            )
+            response.raise_for_status()
+        return call
+
+    if name == 'client':
+        from content_pipeline import Generator, resolve_auth
+        from gemini_http import build_payload
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            generator = Generator(model, tag='loadgen', **resolve_auth())
+        return lambda sequence: generator.generate(build_payload(f"压测请求 {sequence}"))
+
+    from bench_suite import load_call_paths
+
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        paths = load_call_paths()
+    fn = paths[name]
+    # 示例调用路径会打印提示信息；redirect_stdout 替换的是全局 sys.stdout，多线程下不能逐次使用
+    sys.stdout = QuietWorkers(sys.stdout)
+
+    def call(sequence: int):
+        if fn() is None and name != 'list_models':
+            raise RuntimeError("调用路径返回了 None")
+    return call
+
+
+class QuietWorkers:
+    """包装 sys.stdout：丢弃压测工作线程的输出，其他线程照常输出"""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text: str) -> int:
+        if threading.current_thread().name.startswith(WORKER_PREFIX):
+            return len(text)
+        return self._stream.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def run_step(fn: Callable[[int], None], rps: float, duration: float, max_workers: int,
+             drain_timeout: float, rng: random.Random) -> dict:
+    """
+    以平均 rps 的泊松到达发送 duration 秒的请求
+
+    Returns:
+        dict: 计数、达成吞吐和三个直方图（校正延迟、服务延迟、发送滞后）
+    """
+    corrected = LatencyHistogram()
+    service = LatencyHistogram()
+    lag = LatencyHistogram()
+    counts = {'ok': 0, 'errors': 0}
+    lock = threading.Lock()
+    last_finish = [0.0]
+
+    def call(intended: float, sequence: int):
+        started = time.perf_counter()
+        try:
+            fn(sequence)
+            outcome = 'ok'
+        except Exception:
+            outcome = 'errors'
+        finished = time.perf_counter()
+        corrected.record(finished - intended)
+        service.record(finished - started)
+        with lock:
+            counts[outcome] += 1
+            last_finish[0] = max(last_finish[0], finished)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=WORKER_PREFIX)
+    scheduled = []
+    start = time.perf_counter()
+    end = start + duration
+    intended = start
+    sequence = 0
+    while True:
+        intended += rng.expovariate(rps)
+        if intended >= end:
+            break
+        delay = intended - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        # 发送端自己跟不上计划时不补偿，滞后计入校正延迟，同时单独记录便于判断瓶颈在哪一侧
+        lag.record(time.perf_counter() - intended)
+        scheduled.append((executor.submit(call, intended, sequence), intended))
+        sequence += 1
+
+    wait([future for future, _ in scheduled], timeout=drain_timeout)
+    dropped = 0
+    now = time.perf_counter()
+    for future, planned in scheduled:
+        # 排队超过 drain_timeout 仍未开始的请求不再发送
+        if future.cancel():
+            dropped += 1
+            corrected.record(now - planned)
+    executor.shutdown(wait=True)
+
+    elapsed = max(duration, last_finish[0] - start)
+    return {
+        'target_rps': rps,
+        # 泊松到达的实际请求数围绕目标波动，饱和判定与实际发出的到达率比较
+        'offered_rps': len(scheduled) / duration,
+        'achieved_rps': counts['ok'] / elapsed,
+        'sent': len(scheduled) - dropped,
+        'ok': counts['ok'],
+        'errors': counts['errors'],
+        'dropped': dropped,
+        'corrected': corrected,
+        'service': service,
+        'lag': lag,
+    }
+
+
+def is_saturated(step: dict, baseline_p99: float, tolerance: float, max_error_rate: float,
+                 knee_factor: float) -> str:
+    """
+    判断这一级是否已经饱和
+
+    Returns:
+        str: 饱和原因，未饱和时返回空字符串
+    """
+    scheduled = step['sent'] + step['dropped']
+    if step['dropped']:
+        return f"丢弃 {step['dropped']}"
+    if scheduled and step['errors'] / scheduled > max_error_rate:
+        return f"错误率 {step['errors'] / scheduled * 100:.1f}%"
+    if step['achieved_rps'] < step['offered_rps'] * (1 - tolerance):
+        return f"吞吐 {step['achieved_rps']:.1f}/s 低于到达率 {step['offered_rps']:.1f}/s"
+    p99 = step['corrected'].value_at_percentile(99)
+    if baseline_p99 and p99 > baseline_p99 * knee_factor:
+        return f"p99 {p99 * 1000:.0f}ms 超过基线 {knee_factor:g} 倍"
+    return ''
+
+
+def summary_row(step: dict) -> dict:
+    """CSV 中每一级的汇总行（延迟为毫秒）"""
+    corrected = step['corrected']
+    p50, p90, p99, p999 = corrected.values_at_percentiles([50, 90, 99, 99.9])
+    return {
+        'target_rps': step['target_rps'],
+        'offered_rps': round(step['offered_rps'], 2),
+        'achieved_rps': round(step['achieved_rps'], 2),
+        'sent': step['sent'],
+        'ok': step['ok'],
+        'errors': step['errors'],
+        'dropped': step['dropped'],
+        'mean_ms': round(corrected.mean * 1000, 3),
+        'p50_ms': round(p50 * 1000, 3),
+        'p90_ms': round(p90 * 1000, 3),
+        'p99_ms': round(p99 * 1000, 3),
+        'p999_ms': round(p999 * 1000, 3),
+        'max_ms': round(corrected.max * 1000, 3),
+        'uncorrected_p99_ms': round(step['service'].value_at_percentile(99) * 1000, 3),
+        'dispatch_lag_p99_ms': round(step['lag'].value_at_percentile(99) * 1000, 3),
+        'saturated': step['saturated'],
+    }
+
+
+def write_summary_csv(path: str, steps: List[dict]):
+    rows = [summary_row(step) for step in steps]
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_percentiles_csv(path: str, steps: List[dict], percentiles=DEFAULT_PERCENTILES):
+    """每一级的完整百分位分布：校正延迟与服务延迟并列"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['target_rps', 'percentile', 'corrected_ms', 'uncorrected_ms', 'count'])
+        for step in steps:
+            service = step['service'].values_at_percentiles(percentiles)
+            for (p, value, count), uncorrected in zip(step['corrected'].percentile_table(percentiles), service):
+                writer.writerow([step['target_rps'], p, round(value * 1000, 3), round(uncorrected * 1000, 3), count])
+
+
+def setup_upstream(args) -> Dict[str, str]:
+    """准备上游：默认启动进程内的模拟服务器，并像 bench_suite 一样隔离会影响测量的环境变量"""
+    if args.target == 'gateway':
+        return {'upstream': '由网关配置'}
+    if args.api_base:
+        os.environ['GEMINI_API_BASE'] = args.api_base
+        return {'upstream': args.api_base}
+
+    from bench_suite import ISOLATED_ENV
+    from mock_gemini_server import MockConfig, start_mock_server, make_fake_service_account
+
+    _, base_url = start_mock_server(config=MockConfig(
+        latency=args.latency, latency_dist=args.latency_dist, error_rate=args.error_rate
+    ))
+    for name in ISOLATED_ENV:
+        os.environ.pop(name, None)
+    os.environ['GEMINI_API_BASE'] = base_url
+    os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = make_fake_service_account(
+        tempfile.mkdtemp(prefix='mock-gemini-'), base_url
+    )
+    for name in ('GEMINI_CREDENTIAL_FILES', 'GEMINI_API_KEYS'):
+        os.environ.pop(name, None)
+    os.environ['GEMINI_RATE_LIMIT_RPM'] = '0'
+    os.environ['GEMINI_SINGLE_FLIGHT'] = '0'
+    os.environ['GEMINI_HTTP_POOL_SIZE'] = str(args.max_workers)
+    return {'upstream': f"{base_url}（进程内模拟服务器，延迟 {args.latency_dist or f'{args.latency * 1000:.0f}ms'}）"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="开环压测（泊松到达，校正 coordinated omission）")
+    parser.add_argument('--target', choices=TARGETS, default='client', help="压测的调用路径")
+    parser.add_argument('--rps', default='10:100:10', help="RPS 级别：50、10,20,40 或 起始:结束:步长")
+    parser.add_argument('--step-duration', type=float, default=10.0, help="每一级的持续秒数")
+    parser.add_argument('--model', default=DEFAULT_MODEL, help="模型名称（client / gateway）")
+    parser.add_argument('--url', default='http://127.0.0.1:8787', help="网关地址（--target gateway）")
+    parser.add_argument('--max-workers', type=int, default=DEFAULT_MAX_WORKERS, help="发送请求的线程数上限")
+    parser.add_argument('--drain-timeout', type=float, default=DEFAULT_DRAIN_TIMEOUT, help="每级结束后等待在途请求的秒数")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="达成吞吐低于实际到达率多少比例视为饱和")
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help="错误率超过多少视为饱和")
+    parser.add_argument('--knee-factor', type=float, default=3.0, help="校正 p99 超过第一级多少倍视为饱和")
+    parser.add_argument('--keep-going', action='store_true', help="饱和后继续跑完剩余级别")
+    parser.add_argument('--api-base', help="上游地址（默认启动进程内的模拟服务器）")
+    parser.add_argument('--latency', type=float, default=0.05, help="模拟服务器固定延迟（秒）")
+    parser.add_argument('--latency-dist', help="模拟服务器延迟分布，例如 lognormal:0.05,0.5")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="模拟服务器返回 503 的比例")
+    parser.add_argument('--seed', type=int, help="到达时间的随机种子")
+    parser.add_argument('--csv', help="每级汇总 CSV")
+    parser.add_argument('--percentiles-csv', help="每级完整百分位分布 CSV")
+    args = parser.parse_args()
+
+    try:
+        levels = parse_rps(args.rps)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    upstream = setup_upstream(args)
+    fn = build_target(args.target, args.model, args.url, args.max_workers)
+    rng = random.Random(args.seed)
+
+    print("=" * 78)
+    print("📈 开环压测")
+    print("=" * 78)
+    print(f"调用路径: {args.target}  上游: {upstream['upstream']}")
+    print(f"RPS 级别: {', '.join(f'{level:g}' for level in levels)}  每级 {args.step_duration:g}s  "
+          f"线程上限 {args.max_workers}")
+
+    # 预热：建立连接、取得令牌，避免第一级的 p99 基线被冷启动拉高
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn(-1)
+    except Exception as e:
+        print(f"❌ 预热请求失败: {type(e).__name__}: {e}")
+        sys.exit(1)
+
+    steps, baseline_p99, knee, saturated_at = [], 0.0, None, None
+    print(f"\n{'目标/s':>8}{'达成/s':>9}{'成功':>8}{'错误':>6}{'丢弃':>6}"
+          f"{'p50':>9}{'p99':>9}{'p99.9':>9}{'max':>9}{'未校正p99':>11}  (ms)")
+    for level in levels:
+        step = run_step(fn, level, args.step_duration, args.max_workers, args.drain_timeout, rng)
+        if not steps:
+            baseline_p99 = step['corrected'].value_at_percentile(99)
+        step['saturated'] = is_saturated(step, baseline_p99, args.tolerance, args.max_error_rate, args.knee_factor)
+        steps.append(step)
+        row = summary_row(step)
+        flag = f"  ⚠️ {step['saturated']}" if step['saturated'] else ""
+        print(f"{level:>8g}{row['achieved_rps']:>9.1f}{row['ok']:>8}{row['errors']:>6}{row['dropped']:>6}"
+              f"{row['p50_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['p999_ms']:>9.1f}{row['max_ms']:>9.1f}"
+              f"{row['uncorrected_p99_ms']:>11.1f}{flag}", flush=True)
+        if step['saturated']:
+            if knee is None:
+                knee = steps[-2]['target_rps'] if len(steps) > 1 else 0.0
+                saturated_at = level
+            if not args.keep_going:
+                break
+
+    print("\n📋 校正延迟百分位（ms）")
+    print(f"{'百分位':>8}" + "".join(f"{step['target_rps']:>10g}" for step in steps))
+    tables = [step['corrected'].percentile_table() for step in steps]
+    for row_index, p in enumerate(DEFAULT_PERCENTILES):
+        print(f"{p:>8g}" + "".join(f"{table[row_index][1] * 1000:>10.1f}" for table in tables))
+
+    if args.csv:
+        write_summary_csv(args.csv, steps)
+    if args.percentiles_csv:
+        write_percentiles_csv(args.percentiles_csv, steps)
+
+    lag_p99 = max(step['lag'].value_at_percentile(99) for step in steps)
+    print("\n" + "=" * 78)
+    if knee is None:
+        print(f"✅ 所有级别都未饱和（最高 {steps[-1]['target_rps']:g}/s）")
+    elif knee == 0:
+        print(f"⚠️  第一级 {steps[0]['target_rps']:g}/s 已经饱和，请降低起始 RPS")
+    else:
+        print(f"✅ 饱和拐点: {knee:g}/s（{saturated_at:g}/s 起饱和）")
+    print("=" * 78)
+    print(f"发送滞后 p99: {lag_p99 * 1000:.1f}ms" + (
+        "（较大，发送端可能成为瓶颈，可用 --api-base 把模拟服务器放到独立进程）" if lag_p99 > 0.005 else ""
+    ))
+    if args.csv:
+        print(f"汇总: {args.csv}")
+    if args.percentiles_csv:
+        print(f"百分位分布: {args.percentiles_csv}")
+
+
+if __name__ == "__main__":
+    main()
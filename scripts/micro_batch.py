@@ -0,0 +1,286 @@
+"""
+微批处理 - 把短提示攒成一个结构化输出请求
+
+一句话的短提示，大部分耗时花在每个请求固定的开销上（连接、排队、首 token）。
+MicroBatcher 在一个很短的窗口内（--max-wait，或攒够 max_items 条）收集提示，
+合并成一个请求，用 responseSchema 要求模型返回一个字符串数组，再把第 i 个元素交还给第 i 个调用方：
+
+- 只有一条提示、或提示超过 max_prompt_chars 时不合并，直接单独请求
+- 返回的 JSON 无法解析或元素个数不对时，这一批全部退回单独请求；
+  个别元素为空或不是字符串时只有这几条退回单独请求
+- 合并请求本身失败（HTTP 错误、超时）时错误交给这一批的所有调用方，不会放大成 N 个请求
+- stats() 报告上游请求数的减少比例和在窗口中等待的时间
+
+使用方法：
+    from content_pipeline import Generator
+    from micro_batch import MicroBatcher
+
+    with MicroBatcher(Generator("gemini-2.5-flash"), max_items=8, max_wait=0.02) as batcher:
+        futures = [batcher.submit(prompt) for prompt in prompts]
+        texts = [future.result() for future in futures]
+    print(batcher.stats())
+"""
+
+import json
+import time
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+from gemini_http import build_payload
+from latency_histogram import LatencyHistogram
+
+DEFAULT_MAX_ITEMS = 8
+DEFAULT_MAX_WAIT = 0.02
+DEFAULT_MAX_PROMPT_CHARS = 400
+DEFAULT_CONCURRENCY = 4
+
+PACK_TEMPLATE = """下面有 {count} 个彼此独立的请求，请逐个完成，回答之间互不引用。
+返回一个 JSON 字符串数组，长度为 {count}，第 i 个元素是第 i 个请求的完整回答。
+
+{items}"""
+
+_CLOSE = object()
+
+
+class _Item:
+    __slots__ = ('prompt', 'future', 'enqueued')
+
+    def __init__(self, prompt: str):
+        self.prompt = prompt
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+def build_packed_payload(prompts: List[str], generation_config: Optional[dict] = None) -> dict:
+    """
+    把多条提示合并成一个要求返回字符串数组的请求
+
+    generationConfig 中的 maxOutputTokens 视为每条的上限，按条数放大。
+    """
+    config = dict(generation_config or {})
+    if 'maxOutputTokens' in config:
+        config['maxOutputTokens'] = config['maxOutputTokens'] * len(prompts)
+    config['responseMimeType'] = 'application/json'
+    config['responseSchema'] = {
+        "type": "ARRAY",
+        "items": {"type": "STRING"},
+        "minItems": len(prompts),
+        "maxItems": len(prompts),
+    }
+    items = '\n\n'.join(f"【请求 {index}】\n{prompt}" for index, prompt in enumerate(prompts, 1))
+    return build_payload(PACK_TEMPLATE.format(count=len(prompts), items=items), config)
+
+
+def parse_answers(text: str, count: int) -> Optional[List[Optional[str]]]:
+    """
+    解析合并请求的回答
+
+    Returns:
+        list: 每条提示的回答，个别无效的元素为 None；整体无法解析或长度不对时返回 None
+    """
+    try:
+        answers = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(answers, list) or len(answers) != count:
+        return None
+    return [answer if isinstance(answer, str) and answer.strip() else None for answer in answers]
+
+
+class MicroBatcher:
+    """
+    收集短提示并合并请求（线程安全）
+
+    Args:
+        generator: content_pipeline.Generator，决定模型、凭证和用量标签
+        max_items: 每个合并请求最多包含的提示数
+        max_wait: 第一条提示进入窗口后最多等待的秒数
+        max_prompt_chars: 超过该长度的提示不合并
+        concurrency: 同时进行的上游请求数（合并请求和单独请求共用）
+        generation_config: 每条提示的生成参数
+    """
+
+    def __init__(
+        self,
+        generator,
+        max_items: int = DEFAULT_MAX_ITEMS,
+        max_wait: float = DEFAULT_MAX_WAIT,
+        max_prompt_chars: int = DEFAULT_MAX_PROMPT_CHARS,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        generation_config: Optional[dict] = None
+    ):
+        if max_items < 1:
+            raise ValueError("max_items 至少为 1")
+        self.generator = generator
+        self.max_items = max_items
+        self.max_wait = max_wait
+        self.max_prompt_chars = max_prompt_chars
+        self.generation_config = generation_config
+
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='micro-batch')
+        self._dispatcher: Optional[threading.Thread] = None
+        self._lock = threading.RLock()
+        # 已提交但还没结束的任务数；合并请求解析失败时会再提交单独请求，close() 要等它们全部结束
+        self._pending = 0
+        self._idle = threading.Condition(self._lock)
+        self._closed = False
+        self._queue_delay = LatencyHistogram()
+        self._stats = {
+            'items': 0, 'packed_items': 0, 'direct_items': 0, 'fallback_items': 0,
+            'packed_requests': 0, 'direct_requests': 0, 'parse_failures': 0,
+        }
+
+    def submit(self, prompt: str) -> Future:
+        """
+        提交一条提示
+
+        Returns:
+            Future: 结果为回答文本；请求失败时为对应的异常
+
+        Raises:
+            RuntimeError: 已经 close()
+        """
+        item = _Item(prompt)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("MicroBatcher 已关闭")
+            self._stats['items'] += 1
+            if len(prompt) > self.max_prompt_chars or self.max_items == 1:
+                self._stats['direct_items'] += 1
+                self._queue_delay.record(0.0)
+                self._submit(self._run_direct, item)
+                return item.future
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name='micro-batch-dispatch', daemon=True)
+                self._dispatcher.start()
+        self._queue.put(item)
+        return item.future
+
+    def generate(self, prompt: str) -> str:
+        """同步生成一条（在窗口内与其他调用方的提示合并）"""
+        return self.submit(prompt).result()
+
+    def close(self):
+        """发出窗口中剩余的提示并等待全部完成"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            dispatcher = self._dispatcher
+        if dispatcher is not None:
+            self._queue.put(_CLOSE)
+            dispatcher.join()
+        with self._idle:
+            self._idle.wait_for(lambda: self._pending == 0)
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: 计数、上游请求数、请求减少比例、平均批大小和窗口等待时间（毫秒）
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        upstream = stats['packed_requests'] + stats['direct_requests']
+        stats['upstream_requests'] = upstream
+        stats['request_reduction'] = 1 - upstream / stats['items'] if stats['items'] else 0.0
+        stats['mean_batch_size'] = (
+            stats['packed_items'] / stats['packed_requests'] if stats['packed_requests'] else 0.0
+        )
+        p50, p99 = self._queue_delay.values_at_percentiles([50, 99])
+        stats['queue_delay_ms'] = {
+            'mean': round(self._queue_delay.mean * 1000, 3),
+            'p50': round(p50 * 1000, 3),
+            'p99': round(p99 * 1000, 3),
+            'max': round(self._queue_delay.max * 1000, 3),
+        }
+        return stats
+
+    def _dispatch(self):
+        """收集窗口内的提示：攒够 max_items 条或第一条等满 max_wait 时发出"""
+        closing = False
+        while not closing:
+            first = self._queue.get()
+            if first is _CLOSE:
+                break
+            batch = [first]
+            deadline = first.enqueued + self.max_wait
+            while len(batch) < self.max_items:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _CLOSE:
+                    closing = True
+                    break
+                batch.append(item)
+            now = time.monotonic()
+            for item in batch:
+                self._queue_delay.record(now - item.enqueued)
+            if len(batch) == 1:
+                with self._lock:
+                    self._stats['direct_items'] += 1
+                self._submit(self._run_direct, batch[0])
+            else:
+                self._submit(self._run_packed, batch)
+
+    def _submit(self, fn, arg):
+        with self._lock:
+            self._pending += 1
+            self._executor.submit(self._tracked, fn, arg)
+
+    def _tracked(self, fn, arg):
+        try:
+            fn(arg)
+        finally:
+            with self._idle:
+                self._pending -= 1
+                if not self._pending:
+                    self._idle.notify_all()
+
+    def _run_direct(self, item: _Item):
+        with self._lock:
+            self._stats['direct_requests'] += 1
+        try:
+            payload = build_payload(item.prompt, self.generation_config)
+            item.future.set_result(self.generator.generate(payload))
+        except BaseException as e:
+            item.future.set_exception(e)
+
+    def _run_packed(self, batch: List[_Item]):
+        with self._lock:
+            self._stats['packed_requests'] += 1
+            self._stats['packed_items'] += len(batch)
+        try:
+            text = self.generator.generate(
+                build_packed_payload([item.prompt for item in batch], self.generation_config)
+            )
+        except BaseException as e:
+            for item in batch:
+                item.future.set_exception(e)
+            return
+
+        answers = parse_answers(text, len(batch))
+        if answers is None:
+            with self._lock:
+                self._stats['parse_failures'] += 1
+            answers = [None] * len(batch)
+        for item, answer in zip(batch, answers):
+            if answer is not None:
+                item.future.set_result(answer)
+                continue
+            with self._lock:
+                self._stats['fallback_items'] += 1
+            self._submit(self._run_direct, item)
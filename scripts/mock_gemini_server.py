@@ -0,0 +1,819 @@
+#!/usr/bin/env python3
+"""
+本地 Gemini 模拟服务器 - 用于离线基准测试
+
+模拟 generativelanguage.googleapis.com 的以下端点：
+- GET  /v1beta/models（支持 pageSize / pageToken 分页和 If-None-Match）
+- POST /v1beta/models/{model}:generateContent（带 responseSchema 时返回符合结构的 JSON）
+- POST /v1beta/models/{model}:streamGenerateContent?alt=sse
+- POST /v1beta/models/{model}:batchGenerateContent、GET /v1beta/batches/{id}、POST /v1beta/batches/{id}:cancel
+- POST /upload/v1beta/files（可续传上传）、GET /download/v1beta/files/{id}:download
+- POST /token（假的 OAuth2 令牌端点，配合 make_fake_service_account 使用）
+
+延迟可以是固定值，也可以是分布（见 parse_latency），
+还可以注入慢响应、503 错误，并把响应文本填充到指定大小。
+
+使用方法：
+    python scripts/mock_gemini_server.py --port 8808 --latency 0.05
+    python scripts/mock_gemini_server.py --port 8808 --latency-dist lognormal:0.05,0.5 --error-rate 0.01
+    python scripts/mock_gemini_server.py --port 8808 --tls   # HTTPS，自动生成自签名证书
+
+然后把调用路径指向它：
+    export GEMINI_API_BASE=http://127.0.0.1:8808
+    export GOOGLE_APPLICATION_CREDENTIALS=/tmp/mock-gemini-xxx/service-account.json  # 启动时打印
+"""
+
+import os
+import sys
+import ssl
+import json
+import socket
+import time
+import math
+import random
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from typing import Callable, Dict, Optional, Tuple
+
+MOCK_MODELS = [
+    {
+        "name": "models/gemini-2.5-flash",
+        "displayName": "Gemini 2.5 Flash",
+        "supportedGenerationMethods": ["generateContent", "countTokens"]
+    },
+    {
+        "name": "models/gemini-2.5-pro",
+        "displayName": "Gemini 2.5 Pro",
+        "supportedGenerationMethods": ["generateContent", "countTokens"]
+    },
+    {
+        "name": "models/gemini-1.5-pro",
+        "displayName": "Gemini 1.5 Pro",
+        "supportedGenerationMethods": ["generateContent", "countTokens"]
+    },
+    {
+        "name": "models/text-embedding-004",
+        "displayName": "Text Embedding 004",
+        "supportedGenerationMethods": ["embedContent"]
+    },
+]
+EMBEDDING_DIM = 256
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    解析延迟分布描述，返回采样函数（秒，不小于 0）
+
+    支持的格式：
+    - 0.05                  固定 50ms
+    - uniform:0.02,0.08     均匀分布
+    - normal:0.05,0.01      正态分布（均值, 标准差）
+    - lognormal:0.05,0.5    对数正态分布（中位数, sigma），最接近真实服务的长尾
+    - exp:0.05              指数分布（均值）
+
+    Raises:
+        ValueError: 格式无法识别
+    """
+    kind, _, args = spec.partition(':')
+    if not args:
+        value = float(kind)
+        return lambda: value
+    params = [float(x) for x in args.split(',')]
+    if kind == 'uniform':
+        low, high = params
+        return lambda: random.uniform(low, high)
+    if kind == 'normal':
+        mean, std = params
+        return lambda: max(0.0, random.gauss(mean, std))
+    if kind == 'lognormal':
+        median, sigma = params
+        mu = math.log(median)
+        return lambda: random.lognormvariate(mu, sigma)
+    if kind == 'exp':
+        mean, = params
+        return lambda: random.expovariate(1 / mean)
+    raise ValueError(f"无法识别的延迟分布: {spec}")
+
+
+def fake_from_schema(schema: dict, label: str):
+    """
+    按 responseSchema（OpenAPI 子集）构造一个符合结构的值
+
+    字符串取值为「标签 + 字段路径」，不同请求、不同字段的值互不相同；
+    数组的长度取 minItems（默认 1）。
+    """
+    kind = str(schema.get('type', 'STRING')).upper()
+    if kind == 'OBJECT':
+        return {
+            name: fake_from_schema(sub, f"{label}.{name}")
+            for name, sub in schema.get('properties', {}).items()
+        }
+    if kind == 'ARRAY':
+        count = int(schema.get('minItems', 1))
+        return [fake_from_schema(schema.get('items', {}), f"{label}[{i}]") for i in range(count)]
+    if kind in ('INTEGER', 'NUMBER'):
+        return 0
+    if kind == 'BOOLEAN':
+        return True
+    if schema.get('enum'):
+        return schema['enum'][0]
+    return label
+
+
+def generate_response(model: str, body: dict, response_bytes: int = 0) -> dict:
+    """
+    模拟的 generateContent 响应：回显提示文本；带 responseSchema 时返回符合结构的 JSON
+
+    Args:
+        model: 模型名称
+        body: 请求体
+        response_bytes: 大于 0 时把响应文本填充到至少该字节数
+    """
+    prompt = ''
+    for content in body.get('contents', []):
+        for part in content.get('parts', []):
+            prompt += part.get('text', '')
+    config = body.get('generationConfig') or {}
+    if config.get('responseMimeType') == 'application/json' and config.get('responseSchema'):
+        # 结构化输出：按 responseSchema 构造一个合法的 JSON 实例
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:8]
+        text = json.dumps(fake_from_schema(config['responseSchema'], f"[{model}] {digest}"), ensure_ascii=False)
+    else:
+        text = f"[{model}] {prompt}"
+    padding = response_bytes - len(text.encode('utf-8'))
+    if padding > 0:
+        text += ' ' + 'x' * (padding - 1)
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": text}]},
+            "finishReason": "STOP"
+        }],
+        "usageMetadata": fake_usage(prompt, text),
+        "modelVersion": model
+    }
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM) -> list:
+    """按字符 1~3-gram 哈希得到的确定性向量：字面相近的文本向量也相近"""
+    text = ''.join(text.lower().split())
+    values = [0.0] * dim
+    for n in (1, 2, 3):
+        for start in range(len(text) - n + 1):
+            digest = int.from_bytes(hashlib.md5(text[start:start + n].encode('utf-8')).digest()[:4], 'big')
+            values[digest % dim] += 1.0 if digest & 0x80000000 else -1.0
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return [round(v / norm, 6) for v in values]
+
+
+def fake_usage(prompt: str, text: str) -> dict:
+    """按每 4 个 UTF-8 字节一个 token 估算的 usageMetadata"""
+    prompt_tokens = max(1, len(prompt.encode('utf-8')) // 4)
+    candidates_tokens = max(1, len(text.encode('utf-8')) // 4)
+    return {
+        "promptTokenCount": prompt_tokens,
+        "candidatesTokenCount": candidates_tokens,
+        "totalTokenCount": prompt_tokens + candidates_tokens
+    }
+
+
+class MockConfig:
+    """
+    模拟服务器的行为配置
+
+    Args:
+        latency: 每个请求的固定延迟（秒）
+        latency_dist: 延迟分布描述（见 parse_latency），设置后代替 latency
+        slow_fraction: 慢响应的比例（0-1）
+        slow_latency: 慢响应的延迟（秒）
+        error_rate: generateContent 返回 503 的比例（0-1）
+        response_bytes: 大于 0 时把响应文本填充到至少该字节数
+        token_latency: 令牌端点的固定延迟（秒）
+        token_lifetime: 令牌端点签发的令牌有效期（秒）
+        extra_models: 在 MOCK_MODELS 之外再生成的模型数（用于测试分页）
+        stream_chunks: 流式响应拆成的事件数
+        stream_interval: 流式事件之间的间隔（秒）
+        stream_split_bytes: 大于 0 时按该字节数切分写出，模拟跨事件 / 跨 UTF-8 字符的网络分块
+        stream_error_after: 发送该数量的事件后发送一个错误事件
+        stream_drop_after: 发送该数量的事件后直接断开连接
+        quota_requests: 每个调用方（API Key 或访问令牌）每个模型在 quota_window 秒内允许的请求数，
+            超出返回 429（None 表示不限）
+        quota_window: 配额窗口（秒）
+        batch_pending: 批处理任务在 PENDING 状态停留的秒数
+        batch_item_latency: 批处理任务中每个请求的处理时间（秒）
+        model_latency: 按模型覆盖延迟，例如 {"gemini-2.5-pro": 2.0}（运行中修改可模拟某个模型变慢）
+        model_error_rate: 按模型覆盖 503 比例，例如 {"gemini-2.5-flash": 1.0}
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        latency_dist: Optional[str] = None,
+        slow_fraction: float = 0.0,
+        slow_latency: float = 1.0,
+        error_rate: float = 0.0,
+        response_bytes: int = 0,
+        token_latency: float = 0.0,
+        token_lifetime: int = 3600,
+        extra_models: int = 0,
+        stream_chunks: int = 4,
+        stream_interval: float = 0.0,
+        stream_split_bytes: int = 0,
+        stream_error_after: Optional[int] = None,
+        stream_drop_after: Optional[int] = None,
+        quota_requests: Optional[int] = None,
+        quota_window: float = 60.0,
+        batch_pending: float = 0.0,
+        batch_item_latency: float = 0.0,
+        model_latency: Optional[Dict[str, float]] = None,
+        model_error_rate: Optional[Dict[str, float]] = None
+    ):
+        self.latency = latency
+        self.latency_dist = latency_dist
+        self.sample_latency = parse_latency(latency_dist) if latency_dist else None
+        self.slow_fraction = slow_fraction
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.response_bytes = response_bytes
+        self.token_latency = token_latency
+        self.token_lifetime = token_lifetime
+        self.extra_models = extra_models
+        self.stream_chunks = stream_chunks
+        self.stream_interval = stream_interval
+        self.stream_split_bytes = stream_split_bytes
+        self.stream_error_after = stream_error_after
+        self.stream_drop_after = stream_drop_after
+        self.quota_requests = quota_requests
+        self.quota_window = quota_window
+        self.batch_pending = batch_pending
+        self.batch_item_latency = batch_item_latency
+        self.model_latency = dict(model_latency or {})
+        self.model_error_rate = dict(model_error_rate or {})
+
+
+class MockGeminiHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 才能保持 keep-alive 连接
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # 头部和正文分两次写出，关闭 Nagle 避免与延迟 ACK 叠加出 40ms 延迟
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self) -> MockConfig:
+        return self.server.config
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/v1beta/models':
+            self._delay()
+            self._list_models()
+        elif path.startswith('/v1beta/batches/'):
+            self._get_batch(path[len('/v1beta/'):])
+        elif path.startswith('/download/v1beta/files/') and path.endswith(':download'):
+            self._download(path[len('/download/v1beta/'):-len(':download')])
+        else:
+            self._send_error(404, f"未知路径: {path}")
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/upload/v1beta/files':
+            # 上传的是任意大小的文件，不能按 JSON 一次读入
+            self._upload()
+            return
+        body = self._read_body()
+        if path.startswith('/v1beta/batches/') and path.endswith(':cancel'):
+            self._cancel_batch(path[len('/v1beta/'):-len(':cancel')])
+            return
+        if path == '/token':
+            self._issue_token()
+            return
+        if path.startswith('/v1beta/models/') and not self._check_quota(path):
+            return
+        if path.startswith('/v1beta/models/') and not self._model_exists(path):
+            self._delay()
+            model = path[len('/v1beta/models/'):].split(':', 1)[0]
+            self._send_error(404, f"models/{model} is not found for API version v1beta, "
+                                  f"or is not supported for generateContent.")
+            return
+        model = path[len('/v1beta/models/'):].split(':', 1)[0] if path.startswith('/v1beta/models/') else None
+        if model and random.random() < self.config.model_error_rate.get(model, self.config.error_rate):
+            self._delay(model)
+            self._send_error(503, "The model is overloaded. Please try again later.")
+            return
+        if path.startswith('/v1beta/models/') and path.endswith(':generateContent'):
+            self._delay(model)
+            self._send_json(200, self._generate(path, body))
+        elif path.startswith('/v1beta/models/') and path.endswith(':streamGenerateContent'):
+            self._delay(model)
+            self._stream(path, body)
+        elif path.startswith('/v1beta/models/') and path.endswith(':batchEmbedContents'):
+            self._delay()
+            self._send_json(200, {"embeddings": [
+                {"values": fake_embedding(''.join(
+                    part.get('text', '') for part in request.get('content', {}).get('parts', [])
+                ))}
+                for request in body.get('requests', [])
+            ]})
+        elif path.startswith('/v1beta/models/') and path.endswith(':batchGenerateContent'):
+            self._delay()
+            self._create_batch(path, body)
+        else:
+            self._send_error(404, f"未知路径: {path}")
+
+    def _model_exists(self, path: str) -> bool:
+        model = path[len('/v1beta/models/'):].split(':', 1)[0]
+        return f"models/{model}" in self.server.model_names
+
+    def _list_models(self):
+        """分页返回模型列表；If-None-Match 与当前 ETag 相同时返回 304"""
+        with self.server.lock:
+            self.server.counters['model_pages'] += 1
+        if self.headers.get('If-None-Match') == self.server.models_etag:
+            self.send_response(304)
+            self.send_header('ETag', self.server.models_etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        query = parse_qs(urlsplit(self.path).query)
+        page_size = min(1000, int(query.get('pageSize', ['50'])[0]))
+        offset = int(query.get('pageToken', ['0'])[0] or 0)
+        models = self.server.models
+        data = {"models": models[offset:offset + page_size]}
+        if offset + page_size < len(models):
+            data['nextPageToken'] = str(offset + page_size)
+        self._send_json(200, data, {'ETag': self.server.models_etag})
+
+    def _issue_token(self):
+        """模拟 oauth2.googleapis.com/token：不校验 JWT，直接签发一个新令牌"""
+        if self.config.token_latency > 0:
+            time.sleep(self.config.token_latency)
+        with self.server.lock:
+            self.server.counters['tokens'] += 1
+            serial = self.server.counters['tokens']
+        self._send_json(200, {
+            "access_token": f"mock-access-token-{serial}",
+            "expires_in": self.config.token_lifetime,
+            "token_type": "Bearer"
+        })
+
+    def _generate(self, path: str, body: dict) -> dict:
+        model = path[len('/v1beta/models/'):].split(':', 1)[0]
+        return generate_response(model, body, self.config.response_bytes)
+
+    def _stream(self, path: str, body: dict):
+        """以 SSE + chunked 编码分多个事件返回 _generate 的文本"""
+        config = self.config
+        result = self._generate(path, body)
+        text = result['candidates'][0]['content']['parts'][0]['text']
+        size = max(1, -(-len(text) // max(1, config.stream_chunks)))
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        for index, piece in enumerate(pieces):
+            if config.stream_drop_after is not None and index >= config.stream_drop_after:
+                # 不发送结束块直接断开，客户端会看到不完整的 chunked 响应
+                self.close_connection = True
+                return
+            if config.stream_error_after is not None and index >= config.stream_error_after:
+                event = {"error": {"code": 500, "message": "模拟的流式中途错误", "status": "INTERNAL"}}
+                self._write_event(event)
+                break
+            event = {"candidates": [{"content": {"role": "model", "parts": [{"text": piece}]}}]}
+            if index == len(pieces) - 1:
+                event['candidates'][0]['finishReason'] = 'STOP'
+                event['usageMetadata'] = result['usageMetadata']
+            self._write_event(event)
+            if config.stream_interval > 0:
+                time.sleep(config.stream_interval)
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_event(self, event: dict):
+        data = f"data: {json.dumps(event, ensure_ascii=False)}\r\n\r\n".encode('utf-8')
+        step = self.config.stream_split_bytes or len(data)
+        for start in range(0, len(data), step):
+            piece = data[start:start + step]
+            self.wfile.write(f"{len(piece):x}\r\n".encode('ascii') + piece + b'\r\n')
+
+    def _upload(self):
+        """
+        Files API 的可续传上传：start 分配上传地址，upload, finalize 写入文件内容
+
+        文件内容按块写入磁盘，不在内存中保存整个文件。
+        """
+        server = self.server
+        command = self.headers.get('X-Goog-Upload-Command', '')
+        query = parse_qs(urlsplit(self.path).query)
+        if 'start' in command:
+            body = self._read_body()
+            with server.lock:
+                server.counters['uploads'] += 1
+                upload_id = str(server.counters['uploads'])
+                server.uploads[upload_id] = (body.get('file') or {}).get('display_name', '')
+            self._send_json(200, {}, {'X-Goog-Upload-URL': f"/upload/v1beta/files?upload_id={upload_id}"})
+            return
+        upload_id = (query.get('upload_id') or [''])[0]
+        if upload_id not in server.uploads or 'upload' not in command:
+            self._send_error(400, "无效的上传请求")
+            return
+        remaining = int(self.headers.get('Content-Length') or 0)
+        name = f"files/upload-{upload_id}"
+        path = os.path.join(server.batch_dir(), f"upload-{upload_id}.jsonl")
+        with open(path, 'wb') as f:
+            while remaining > 0:
+                chunk = self.rfile.read(min(remaining, 1 << 16))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+        with server.lock:
+            server.files[name] = path
+            display_name = server.uploads.pop(upload_id)
+        self._send_json(200, {"file": {
+            "name": name,
+            "displayName": display_name,
+            "sizeBytes": str(os.path.getsize(path)),
+            "state": "ACTIVE"
+        }})
+
+    def _create_batch(self, path: str, body: dict):
+        """创建批处理任务，在后台线程中按 PENDING -> RUNNING -> SUCCEEDED 推进"""
+        server = self.server
+        model = path[len('/v1beta/models/'):].split(':', 1)[0]
+        batch = body.get('batch') or {}
+        file_name = (batch.get('input_config') or batch.get('inputConfig') or {}).get('file_name')
+        with server.lock:
+            input_path = server.files.get(file_name)
+        if input_path is None:
+            self._send_error(400, f"输入文件不存在: {file_name}")
+            return
+        with server.lock:
+            server.counters['batches'] += 1
+            name = f"batches/batch-{server.counters['batches']}"
+            job = {
+                "name": name,
+                "metadata": {
+                    "model": f"models/{model}",
+                    "displayName": batch.get('display_name', ''),
+                    "state": "BATCH_STATE_PENDING",
+                    "createTime": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                    "batchStats": {"requestCount": "0", "successfulRequestCount": "0", "failedRequestCount": "0"},
+                },
+                "done": False,
+            }
+            server.batches[name] = job
+        threading.Thread(
+            target=server.run_batch, args=(name, model, input_path), name='mock-batch', daemon=True
+        ).start()
+        self._send_json(200, job)
+
+    def _get_batch(self, name: str):
+        with self.server.lock:
+            job = self.server.batches.get(name)
+            job = json.loads(json.dumps(job)) if job is not None else None
+        if job is None:
+            self._send_error(404, f"{name} 不存在")
+        else:
+            self._send_json(200, job)
+
+    def _cancel_batch(self, name: str):
+        with self.server.lock:
+            job = self.server.batches.get(name)
+            if job is not None and not job['done']:
+                job['metadata']['state'] = 'BATCH_STATE_CANCELLED'
+                job['done'] = True
+        if job is None:
+            self._send_error(404, f"{name} 不存在")
+        else:
+            self._send_json(200, {})
+
+    def _download(self, name: str):
+        """按块返回文件内容（Content-Length 已知，不整体读入内存）"""
+        with self.server.lock:
+            path = self.server.files.get(name)
+        if path is None:
+            self._send_error(404, f"{name} 不存在")
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(1 << 16)
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+
+    def _check_quota(self, path: str) -> bool:
+        """按 (调用方, 模型) 的固定窗口配额，超出时返回 429 + Retry-After（模拟每个项目各自的配额）"""
+        config = self.config
+        if config.quota_requests is None:
+            return True
+        model = path[len('/v1beta/models/'):].split(':', 1)[0]
+        query = parse_qs(urlsplit(self.path).query)
+        caller = (query.get('key') or [None])[0] or self.headers.get('Authorization', '')
+        key = (caller, model)
+        now = time.monotonic()
+        with self.server.lock:
+            window_start, count = self.server.quota.get(key, (now, 0))
+            if now - window_start >= config.quota_window:
+                window_start, count = now, 0
+            count += 1
+            self.server.quota[key] = (window_start, count)
+            self.server.counters['requests'] += 1
+            if count <= config.quota_requests:
+                return True
+            self.server.counters['throttled'] += 1
+            retry_after = max(1, int(window_start + config.quota_window - now + 0.999))
+        self._send_error(429, "Resource has been exhausted (e.g. check quota).",
+                         {'Retry-After': str(retry_after)})
+        return False
+
+    def _delay(self, model: Optional[str] = None):
+        with self.server.lock:
+            self.server.counters['handled'] += 1
+        if model in self.config.model_latency:
+            time.sleep(self.config.model_latency[model])
+        elif self.config.slow_fraction and random.random() < self.config.slow_fraction:
+            time.sleep(self.config.slow_latency)
+        elif self.config.sample_latency is not None:
+            time.sleep(self.config.sample_latency())
+        elif self.config.latency > 0:
+            time.sleep(self.config.latency)
+
+    def _read_body(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def _send_json(self, status: int, data: dict, headers: Optional[dict] = None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str, headers: Optional[dict] = None):
+        self._send_json(status, {"error": {"code": status, "message": message}}, headers)
+
+
+class MockGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 默认的 listen backlog 只有 5，并发连接多于此时 SYN 被丢弃，客户端要等 1 秒重传，压测结果随之失真
+    request_queue_size = 256
+
+    def __init__(self, address, config: MockConfig):
+        super().__init__(address, MockGeminiHandler)
+        self.config = config
+        self.lock = threading.Lock()
+        self.quota = {}
+        self.counters = {
+            'requests': 0, 'throttled': 0, 'handled': 0, 'tokens': 0, 'model_pages': 0,
+            'uploads': 0, 'batches': 0, 'batch_requests': 0,
+        }
+        self.uploads = {}
+        self.files = {}
+        self.batches = {}
+        self._batch_dir: Optional[str] = None
+        self.models = MOCK_MODELS + [
+            {
+                "name": f"models/mock-model-{index:03d}",
+                "displayName": f"Mock Model {index}",
+                "supportedGenerationMethods": ["generateContent"] if index % 2 else ["embedContent"]
+            }
+            for index in range(config.extra_models)
+        ]
+        self.model_names = {model['name'] for model in self.models}
+        digest = hashlib.sha256(json.dumps(self.models, sort_keys=True).encode('utf-8')).hexdigest()
+        self.models_etag = f'"{digest[:16]}"'
+
+    def batch_dir(self) -> str:
+        """上传文件和批处理结果的临时目录（第一次使用时创建）"""
+        with self.lock:
+            if self._batch_dir is None:
+                self._batch_dir = tempfile.mkdtemp(prefix='mock-gemini-batch-')
+            return self._batch_dir
+
+    def run_batch(self, name: str, model: str, input_path: str):
+        """逐行处理批处理任务的输入文件，结果逐行写入输出文件"""
+        config = self.config
+        time.sleep(config.batch_pending)
+        with open(input_path, 'rb') as f:
+            total = sum(1 for line in f if line.strip())
+        with self.lock:
+            job = self.batches[name]
+            if job['done']:
+                return
+            job['metadata']['state'] = 'BATCH_STATE_RUNNING'
+            stats = job['metadata']['batchStats']
+            stats['requestCount'] = str(total)
+
+        output_name = f"files/{name.split('/', 1)[1]}-results"
+        output_path = os.path.join(self.batch_dir(), f"{name.split('/', 1)[1]}-results.jsonl")
+        ok = failed = 0
+        with open(input_path, 'r', encoding='utf-8') as src, open(output_path, 'w', encoding='utf-8') as dst:
+            for line in src:
+                if not line.strip():
+                    continue
+                with self.lock:
+                    if job['done']:
+                        return
+                try:
+                    entry = json.loads(line)
+                    record = {"key": entry.get('key'), "response": generate_response(
+                        model, entry['request'], config.response_bytes
+                    )}
+                    ok += 1
+                except (ValueError, KeyError, TypeError) as e:
+                    record = {"key": None, "error": {"code": 400, "message": f"无效的请求行: {e}"}}
+                    failed += 1
+                dst.write(json.dumps(record, ensure_ascii=False) + '\n')
+                if config.batch_item_latency > 0:
+                    time.sleep(config.batch_item_latency)
+                with self.lock:
+                    self.counters['batch_requests'] += 1
+                    stats.update(
+                        successfulRequestCount=str(ok),
+                        failedRequestCount=str(failed)
+                    )
+
+        with self.lock:
+            if job['done']:
+                return
+            self.files[output_name] = output_path
+            job['metadata']['state'] = 'BATCH_STATE_SUCCEEDED'
+            job['metadata']['output'] = {'responsesFile': output_name}
+            job['response'] = {'responsesFile': output_name}
+            job['done'] = True
+
+    def handle_error(self, request, client_address):
+        # 客户端提前断开（例如被中断的批量任务）是正常情况，不打印堆栈
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+def make_self_signed_cert(directory: str) -> Tuple[str, str]:
+    """
+    使用 openssl 为 127.0.0.1 生成自签名证书
+
+    Returns:
+        (证书路径, 私钥路径)
+    """
+    cert_path = os.path.join(directory, 'mock-cert.pem')
+    key_path = os.path.join(directory, 'mock-key.pem')
+    subprocess.run(
+        [
+            'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+            '-keyout', key_path, '-out', cert_path, '-days', '1',
+            '-subj', '/CN=127.0.0.1',
+            '-addext', 'subjectAltName=IP:127.0.0.1,DNS:localhost'
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    return cert_path, key_path
+
+
+def make_fake_service_account(directory: str, base_url: str) -> str:
+    """
+    生成一个指向模拟令牌端点的服务账号 JSON（私钥由 openssl 临时生成）
+
+    google-auth 会照常签名 JWT 并向 token_uri 换取令牌，
+    这样凭证加载、令牌签发和 API 调用整条链路都在本地完成。
+
+    Args:
+        directory: 输出目录
+        base_url: 模拟服务器根地址
+
+    Returns:
+        str: 服务账号 JSON 文件路径
+    """
+    key_path = os.path.join(directory, 'service-account-key.pem')
+    subprocess.run(
+        ['openssl', 'genpkey', '-algorithm', 'RSA', '-pkeyopt', 'rsa_keygen_bits:2048', '-out', key_path],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    with open(key_path, 'r', encoding='utf-8') as f:
+        private_key = f.read()
+    os.remove(key_path)
+
+    info = {
+        "type": "service_account",
+        "project_id": "mock-project",
+        "private_key_id": "mock-key-id",
+        "private_key": private_key,
+        "client_email": "mock-bench@mock-project.iam.gserviceaccount.com",
+        "client_id": "000000000000000000000",
+        "token_uri": f"{base_url}/token"
+    }
+    path = os.path.join(directory, 'service-account.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=2)
+    os.chmod(path, 0o600)
+    return path
+
+
+def start_mock_server(
+    host: str = '127.0.0.1',
+    port: int = 0,
+    config: Optional[MockConfig] = None,
+    tls: bool = False
+) -> Tuple[MockGeminiServer, str]:
+    """
+    在后台线程中启动模拟服务器
+
+    Args:
+        host: 监听地址
+        port: 端口，0 表示随机可用端口
+        config: 行为配置
+        tls: 是否启用 HTTPS（自签名证书，路径保存在 server.cert_path）
+
+    Returns:
+        (服务器对象, 根地址)
+    """
+    server = MockGeminiServer((host, port), config or MockConfig())
+    server.cert_path = None
+    scheme = 'http'
+    if tls:
+        cert_path, key_path = make_self_signed_cert(tempfile.mkdtemp(prefix='mock-gemini-'))
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path, key_path)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        server.cert_path = cert_path
+        scheme = 'https'
+
+    thread = threading.Thread(target=server.serve_forever, name='mock-gemini', daemon=True)
+    thread.start()
+    return server, f"{scheme}://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 Gemini 模拟服务器")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8808)
+    parser.add_argument('--latency', type=float, default=0.0, help="每个请求的固定延迟（秒）")
+    parser.add_argument('--latency-dist', help="延迟分布，例如 lognormal:0.05,0.5 或 uniform:0.02,0.08")
+    parser.add_argument('--slow-fraction', type=float, default=0.0, help="慢响应比例")
+    parser.add_argument('--slow-latency', type=float, default=1.0, help="慢响应延迟（秒）")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="返回 503 的比例")
+    parser.add_argument('--response-bytes', type=int, default=0, help="把响应文本填充到该字节数")
+    parser.add_argument('--batch-pending', type=float, default=0.0, help="批处理任务在 PENDING 状态停留的秒数")
+    parser.add_argument('--batch-item-latency', type=float, default=0.0, help="批处理任务中每个请求的处理时间（秒）")
+    parser.add_argument('--tls', action='store_true', help="启用 HTTPS（自签名证书）")
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(
+        args.host,
+        args.port,
+        MockConfig(
+            latency=args.latency,
+            latency_dist=args.latency_dist,
+            slow_fraction=args.slow_fraction,
+            slow_latency=args.slow_latency,
+            error_rate=args.error_rate,
+            response_bytes=args.response_bytes,
+            batch_pending=args.batch_pending,
+            batch_item_latency=args.batch_item_latency
+        ),
+        tls=args.tls
+    )
+    key_file = make_fake_service_account(tempfile.mkdtemp(prefix='mock-gemini-'), base_url)
+    print(f"✓ 模拟服务器已启动: {base_url}")
+    if server.cert_path:
+        print(f"  自签名证书: {server.cert_path}")
+        print(f"  export GEMINI_CA_BUNDLE={server.cert_path}")
+    print(f"  export GEMINI_API_BASE={base_url}")
+    print(f"  export GOOGLE_APPLICATION_CREDENTIALS={key_file}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+模型目录 - 带分页、本地缓存和后台刷新的 v1beta/models 索引
+
+list_models 原先每次运行都重新下载模型列表，忽略 nextPageToken，
+并在下载完成后用 Python 循环过滤 supportedGenerationMethods。
+ModelCatalog 把目录缓存下来并建立内存索引：
+1. 跟随 nextPageToken 拉取全部分页
+2. 按模型名和生成方法建立索引，查询是字典查找
+3. 超过 TTL 后继续使用旧目录，同时在后台刷新；带 If-None-Match，未变化时服务端返回 304
+4. 可选持久化到本地 JSON 文件，短时运行的 CLI 在有效期内直接使用，过期后用保存的 ETag 做条件请求
+
+共享客户端在发请求前用它检查模型名，拼错的模型名直接抛出 UnknownModelError（附带相近的名称），
+不必等服务端返回 404。目录还没加载时不阻塞请求，只在后台拉取。
+
+使用方法：
+    from model_catalog import ModelCatalog
+    catalog = ModelCatalog(cache_file="~/.cache/gemini/models.json")
+    catalog.ensure_fresh(access_token=token)  # 文件中的目录未过期时不发请求
+
+    catalog.names("generateContent")         # 支持 generateContent 的模型
+    catalog.has_model("gemini-2.5-flash")    # True / False
+    catalog.check_model("gemini-2.5-flsh")   # UnknownModelError: ... 是否想用 gemini-2.5-flash？
+"""
+
+import os
+import json
+import time
+import threading
+from typing import List, Optional
+
+import tracing
+
+DEFAULT_TTL = 3600
+DEFAULT_PAGE_SIZE = 1000
+
+
+class UnknownModelError(ValueError):
+    """模型不在目录中，或不支持请求的方法"""
+
+
+def _short_name(name: str) -> str:
+    return name[len('models/'):] if name.startswith('models/') else name
+
+
+class ModelCatalog:
+    """
+    线程安全的模型目录
+
+    Args:
+        client: GeminiHttpClient，默认使用共享客户端
+        ttl: 目录的有效期（秒），过期后后台刷新
+        max_stale: 超过该秒数的旧目录不再用于校验
+        cache_file: 可选的持久化文件路径
+        page_size: 每页请求的模型数
+    """
+
+    def __init__(
+        self,
+        client=None,
+        ttl: float = DEFAULT_TTL,
+        max_stale: float = 7 * 24 * 3600,
+        cache_file: Optional[str] = None,
+        page_size: int = DEFAULT_PAGE_SIZE
+    ):
+        self._client = client
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.cache_file = os.path.expanduser(cache_file) if cache_file else None
+        self.page_size = page_size
+
+        self._lock = threading.Lock()
+        self._background: Optional[threading.Thread] = None
+        self._models: List[dict] = []
+        self._by_name = {}
+        self._by_method = {}
+        self._fetched_at = 0.0
+        self._etag: Optional[str] = None
+        self._file_checked = False
+        self._stats = {
+            'refreshes': 0,
+            'not_modified': 0,
+            'pages': 0,
+            'background_refreshes': 0,
+            'file_loads': 0,
+            'errors': 0,
+            'rejected': 0,
+        }
+
+    @property
+    def client(self):
+        if self._client is None:
+            from gemini_http import get_default_client
+            self._client = get_default_client()
+        return self._client
+
+    def refresh(self, access_token: Optional[str] = None, api_key: Optional[str] = None, force: bool = False) -> bool:
+        """
+        同步拉取完整目录（跟随所有分页）
+
+        Args:
+            access_token: 服务账号访问令牌
+            api_key: API Key（与 access_token 二选一）
+            force: 为 True 时不带 If-None-Match
+
+        Returns:
+            bool: 目录有变化返回 True，服务端返回 304 时返回 False
+
+        Raises:
+            requests.exceptions.HTTPError: 非 2xx 响应
+        """
+        from gemini_http import API_VERSION, auth_headers
+
+        # 先读持久化文件，拿到上次的 ETag
+        self._load_from_file_once()
+        # 网络往返期间不持锁，并发的同步刷新各自发条件请求（通常都是 304）；
+        # 后台刷新由 _refresh_in_background 保证同一时间只有一个
+        with tracing.span('model_catalog.refresh') as span:
+            models, page_token, etag = [], None, None
+            pages = 0
+            while True:
+                params = {'pageSize': self.page_size}
+                if page_token:
+                    params['pageToken'] = page_token
+                if api_key:
+                    params['key'] = api_key
+                headers = auth_headers(access_token)
+                # 只对第一页做条件请求，目录没变时一次往返就结束
+                if not page_token and self._etag and not force:
+                    headers['If-None-Match'] = self._etag
+
+                response = self.client.get(f"{API_VERSION}/models", headers=headers, params=params)
+                pages += 1
+                if response.status_code == 304:
+                    with self._lock:
+                        self._fetched_at = time.time()
+                        self._stats['not_modified'] += 1
+                        self._stats['pages'] += pages
+                    span.set_attribute('not_modified', True)
+                    self._save_to_file()
+                    return False
+                response.raise_for_status()
+                if not page_token:
+                    etag = response.headers.get('ETag')
+                data = response.json()
+                models.extend(data.get('models', []))
+                page_token = data.get('nextPageToken')
+                if not page_token:
+                    break
+
+            with self._lock:
+                self._set_models_locked(models, time.time(), etag)
+                self._stats['refreshes'] += 1
+                self._stats['pages'] += pages
+            span.set_attribute('models', len(models))
+            span.set_attribute('pages', pages)
+        self._save_to_file()
+        return True
+
+    def ensure_fresh(self, access_token: Optional[str] = None, api_key: Optional[str] = None) -> bool:
+        """
+        目录（包括持久化文件中的）在有效期内时直接使用，否则同步刷新（带 If-None-Match）
+
+        Returns:
+            bool: 拉取到了新目录返回 True；使用缓存或服务端返回 304 时返回 False
+
+        Raises:
+            requests.exceptions.HTTPError: 非 2xx 响应
+        """
+        self._load_from_file_once()
+        if self.age() < self.ttl:
+            return False
+        return self.refresh(access_token, api_key)
+
+    def models(self, method: Optional[str] = None) -> List[dict]:
+        """目录中的模型（可按生成方法过滤）"""
+        with self._lock:
+            if method is None:
+                return list(self._models)
+            return [self._by_name[name] for name in self._by_method.get(method, ())]
+
+    def names(self, method: Optional[str] = None) -> List[str]:
+        """模型短名称列表，例如 gemini-2.5-flash"""
+        return [_short_name(model['name']) for model in self.models(method)]
+
+    def get(self, name: str) -> Optional[dict]:
+        """按名称查找模型（接受 gemini-2.5-flash 或 models/gemini-2.5-flash）"""
+        with self._lock:
+            return self._by_name.get(_short_name(name))
+
+    def has_model(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def supports(self, name: str, method: str) -> bool:
+        model = self.get(name)
+        return model is not None and method in model.get('supportedGenerationMethods', [])
+
+    @property
+    def loaded(self) -> bool:
+        with self._lock:
+            return bool(self._models)
+
+    def age(self) -> float:
+        """目录的年龄（秒），未加载时为无穷大"""
+        with self._lock:
+            return time.time() - self._fetched_at if self._models else float('inf')
+
+    def check_model(
+        self,
+        name: str,
+        method: str = 'generateContent',
+        access_token: Optional[str] = None,
+        api_key: Optional[str] = None,
+        blocking: bool = False
+    ):
+        """
+        发请求前检查模型名
+
+        目录过期时在后台刷新；目录还没加载时，blocking=False 直接放行（同时在后台拉取），
+        blocking=True 同步拉取后再检查。
+
+        Raises:
+            UnknownModelError: 模型不存在或不支持 method
+        """
+        self._load_from_file_once()
+        age = self.age()
+        if age == float('inf') and blocking:
+            self.refresh(access_token, api_key)
+            age = 0.0
+        if age >= self.ttl:
+            self._refresh_in_background(access_token, api_key)
+        if age >= self.max_stale:
+            return
+
+        model = self.get(name)
+        if model is None:
+            with self._lock:
+                self._stats['rejected'] += 1
+            import difflib
+            suggestions = difflib.get_close_matches(_short_name(name), self.names(), n=3)
+            hint = f"，是否想用 {' / '.join(suggestions)}？" if suggestions else ""
+            raise UnknownModelError(f"模型 {name} 不存在{hint}")
+        if method not in model.get('supportedGenerationMethods', []):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise UnknownModelError(f"模型 {name} 不支持 {method}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['models'] = len(self._models)
+            stats['age'] = round(time.time() - self._fetched_at, 1) if self._models else None
+        return stats
+
+    def _set_models_locked(self, models: List[dict], fetched_at: float, etag: Optional[str]):
+        self._models = models
+        self._by_name = {_short_name(model['name']): model for model in models if 'name' in model}
+        by_method = {}
+        for short_name, model in self._by_name.items():
+            for method in model.get('supportedGenerationMethods', []):
+                by_method.setdefault(method, []).append(short_name)
+        self._by_method = by_method
+        self._fetched_at = fetched_at
+        self._etag = etag
+
+    def _refresh_in_background(self, access_token: Optional[str], api_key: Optional[str]):
+        with self._lock:
+            if self._background is not None and self._background.is_alive():
+                return
+            self._background = threading.Thread(
+                target=self._background_refresh,
+                args=(access_token, api_key),
+                name='model-catalog-refresh',
+                daemon=True
+            )
+            self._background.start()
+
+    def _background_refresh(self, access_token: Optional[str], api_key: Optional[str]):
+        try:
+            self.refresh(access_token, api_key)
+            with self._lock:
+                self._stats['background_refreshes'] += 1
+        except Exception:
+            # 拉取失败时继续使用旧目录（或不做校验），不影响请求本身
+            with self._lock:
+                self._stats['errors'] += 1
+
+    def _load_from_file_once(self):
+        if self._file_checked or not self.cache_file:
+            return
+        with self._lock:
+            if self._file_checked:
+                return
+            self._file_checked = True
+            if self._models:
+                return
+            try:
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                return
+            # 不同 API 根地址（例如本地模拟服务器）的目录不能混用
+            if data.get('base_url') != self.client.base_url:
+                return
+            self._set_models_locked(data.get('models', []), float(data.get('fetched_at', 0)), data.get('etag'))
+            self._stats['file_loads'] += 1
+
+    def _save_to_file(self):
+        """写入持久化文件（原子替换）"""
+        if not self.cache_file:
+            return
+        with self._lock:
+            data = {
+                'base_url': self.client.base_url,
+                'fetched_at': self._fetched_at,
+                'etag': self._etag,
+                'models': self._models,
+            }
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_file)), exist_ok=True)
+            tmp_path = f"{self.cache_file}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_file)
+        except OSError:
+            with self._lock:
+                self._stats['errors'] += 1
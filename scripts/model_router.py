@@ -0,0 +1,311 @@
+"""
+模型路由 - 按延迟、错误率、提示长度和调用方优先级在快速模型与高质量模型之间选择
+
+各个脚本原先各自写死模型名（有的是 gemini-1.5-pro，有的是 gemini-2.5-flash）。
+现在默认模型统一为 DEFAULT_MODEL（环境变量 GEMINI_MODEL，默认 gemini-2.5-flash）；
+设为 auto 时由共享客户端上的 ModelRouter 为每个请求选择模型：
+
+- 每个模型维护延迟和错误率的 EWMA（指数加权移动平均），所有经过共享客户端的调用都会更新
+- 连续失败达到阈值、或错误率 EWMA 超过上限时，模型被标记为降级，冷却期内不再被选中；
+  冷却结束后重新参与路由，第一个请求起探测作用
+- 首选模型：high 优先级用高质量模型，low 优先级用快速模型，
+  普通优先级下提示超过 long_prompt_tokens 用高质量模型，否则用快速模型
+- 首选模型降级或延迟 EWMA 超过 SLO 时改用下一个健康且满足 SLO 的模型；
+  超过冷却时间没有新样本的延迟视为未知，模型会重新得到请求，不会因为一次慢而一直被绕开
+- 请求在首选模型上以 429 / 5xx / 超时失败（重试之后）时，同一个请求再交给下一个健康的模型一次
+- 每次决策按 (模型, 原因) 计数，stats() / to_prometheus() 导出
+
+使用方法：
+    from gemini_http import get_default_client
+
+    client = get_default_client()
+    result = client.generate_content("auto", payload, access_token, priority="high")
+    print(client.model_router.stats())
+
+环境变量：
+    GEMINI_MODEL=auto                                    # 各脚本的默认模型，auto 表示按路由选择
+    GEMINI_ROUTER=0                                      # 关闭模型路由（auto 不可用）
+    GEMINI_ROUTER_MODELS=gemini-2.5-flash,gemini-2.5-pro # 参与路由的模型，从快到慢
+    GEMINI_ROUTER_SLO=15                                 # 延迟 SLO（秒）
+    GEMINI_ROUTER_LONG_PROMPT=2000                       # 长提示阈值（估算 token 数）
+"""
+
+import os
+import time
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from rate_limiter import estimate_tokens
+from retry_policy import RETRYABLE_STATUS
+
+AUTO_MODEL = 'auto'
+FAST_MODEL = 'gemini-2.5-flash'
+QUALITY_MODEL = 'gemini-2.5-pro'
+DEFAULT_MODEL = os.getenv('GEMINI_MODEL') or FAST_MODEL
+
+DEFAULT_LATENCY_SLO = 15.0
+DEFAULT_LONG_PROMPT_TOKENS = 2000
+DEFAULT_MAX_ERROR_RATE = 0.3
+DEFAULT_ALPHA = 0.2
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_COOLDOWN = 30.0
+# 错误率 EWMA 至少基于这么多个样本才用来判断降级
+MIN_SAMPLES = 5
+
+PRIORITIES = ('low', 'normal', 'high')
+
+
+def fixed_model(model: str) -> str:
+    """
+    auto 换成快速模型，其余原样返回
+
+    供不经过共享客户端的路径（google.generativeai SDK、Batch API）使用，这些路径无法按请求路由。
+    """
+    return FAST_MODEL if model == AUTO_MODEL else model
+
+
+def routed_model(model: str, result: dict) -> str:
+    """auto 请求实际使用的模型（取响应中的 modelVersion），其余原样返回"""
+    if model == AUTO_MODEL:
+        return result.get('modelVersion') or model
+    return model
+
+
+def is_model_failure(error: BaseException) -> bool:
+    """判断错误是否说明模型本身不健康（429 / 5xx / 超时 / 连接错误），而不是请求有问题"""
+    import requests
+
+    if isinstance(error, requests.exceptions.HTTPError):
+        response = error.response
+        return response is not None and response.status_code in RETRYABLE_STATUS
+    return isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError))
+
+
+class ModelHealth:
+    """单个模型的延迟 / 错误率 EWMA 和降级状态"""
+
+    __slots__ = (
+        'latency', 'latency_at', 'error_rate', 'samples', 'consecutive_failures', 'open_until', 'degraded_total'
+    )
+
+    def __init__(self):
+        self.latency: Optional[float] = None
+        self.latency_at = 0.0
+        self.error_rate = 0.0
+        self.samples = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.degraded_total = 0
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.open_until
+
+
+class ModelRouter:
+    """
+    按策略为每个请求选择模型（线程安全）
+
+    Args:
+        models: 参与路由的模型，从快到慢；第一个是快速模型，最后一个是高质量模型
+        latency_slo: 延迟 SLO（秒），延迟 EWMA 超过它的模型只在没有更好的选择时使用
+        long_prompt_tokens: 普通优先级下超过该估算 token 数的提示首选高质量模型
+        max_error_rate: 错误率 EWMA 上限，超过后模型降级
+        alpha: EWMA 的平滑系数，越大越看重最近的样本
+        failure_threshold: 连续失败多少次后降级
+        cooldown: 降级后的冷却秒数
+    """
+
+    def __init__(
+        self,
+        models: Sequence[str] = (FAST_MODEL, QUALITY_MODEL),
+        latency_slo: float = DEFAULT_LATENCY_SLO,
+        long_prompt_tokens: int = DEFAULT_LONG_PROMPT_TOKENS,
+        max_error_rate: float = DEFAULT_MAX_ERROR_RATE,
+        alpha: float = DEFAULT_ALPHA,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        cooldown: float = DEFAULT_COOLDOWN
+    ):
+        if not models:
+            raise ValueError("至少需要一个参与路由的模型")
+        self.models = list(models)
+        self.latency_slo = latency_slo
+        self.long_prompt_tokens = long_prompt_tokens
+        self.max_error_rate = max_error_rate
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self._lock = threading.Lock()
+        self._health: Dict[str, ModelHealth] = {model: ModelHealth() for model in self.models}
+        self._decisions: Dict[Tuple[str, str], int] = {}
+        self._failovers: Dict[Tuple[str, str], int] = {}
+
+    def route(self, payload: dict, priority: Optional[str] = None) -> Tuple[List[str], str]:
+        """
+        为一个请求选择模型
+
+        Args:
+            payload: generateContent 请求体（用于估算提示长度）
+            priority: low / normal / high，默认 normal
+
+        Returns:
+            (模型列表, 原因)：第一个是选中的模型，其余是请求失败时依次改用的健康模型
+
+        Raises:
+            ValueError: 未知的优先级
+        """
+        priority = priority or 'normal'
+        if priority not in PRIORITIES:
+            raise ValueError(f"未知的优先级: {priority!r}（可选 {', '.join(PRIORITIES)}）")
+
+        fast, quality = self.models[0], self.models[-1]
+        if priority == 'high':
+            preferred, reason = quality, 'priority_high'
+        elif priority == 'low':
+            preferred, reason = fast, 'priority_low'
+        elif estimate_tokens(payload) > self.long_prompt_tokens:
+            preferred, reason = quality, 'long_prompt'
+        else:
+            preferred, reason = fast, 'default'
+        order = [preferred] + [model for model in self.models if model != preferred]
+
+        now = time.monotonic()
+        with self._lock:
+            healthy = [model for model in order if self._health[model].healthy(now)]
+            within_slo = [model for model in healthy if self._within_slo(model, now)]
+            if within_slo:
+                chosen = within_slo[0]
+                if chosen != preferred:
+                    reason = 'slo_exceeded' if preferred in healthy else 'failover_degraded'
+            elif healthy:
+                # 都超过 SLO：选延迟最低的
+                chosen = min(healthy, key=lambda model: self._health[model].latency)
+                reason = 'all_over_slo'
+            else:
+                # 都在冷却中：选最早结束冷却的，不让请求无处可去
+                chosen = min(order, key=lambda model: self._health[model].open_until)
+                reason = 'all_degraded'
+            key = (chosen, reason)
+            self._decisions[key] = self._decisions.get(key, 0) + 1
+        return [chosen] + [model for model in healthy if model != chosen], reason
+
+    def _within_slo(self, model: str, now: float) -> bool:
+        health = self._health[model]
+        if health.latency is None or now - health.latency_at > self.cooldown:
+            return True
+        return health.latency <= self.latency_slo
+
+    def record(self, model: str, latency: Optional[float], ok: bool):
+        """
+        记录一次上游调用的结果
+
+        Args:
+            model: 模型名称（不在路由表中的模型也会统计）
+            latency: 耗时（秒），None 表示不计入延迟（失败或流式调用）
+            ok: 是否成功
+        """
+        with self._lock:
+            health = self._health.get(model)
+            if health is None:
+                health = self._health[model] = ModelHealth()
+            if latency is not None:
+                health.latency = latency if health.latency is None else (
+                    self.alpha * latency + (1 - self.alpha) * health.latency
+                )
+                health.latency_at = time.monotonic()
+            health.error_rate = self.alpha * (0.0 if ok else 1.0) + (1 - self.alpha) * health.error_rate
+            health.samples += 1
+            if ok:
+                health.consecutive_failures = 0
+                return
+            health.consecutive_failures += 1
+            degraded = (
+                health.consecutive_failures >= self.failure_threshold
+                or (health.samples >= MIN_SAMPLES and health.error_rate > self.max_error_rate)
+            )
+            now = time.monotonic()
+            if degraded and health.healthy(now):
+                health.open_until = now + self.cooldown
+                health.degraded_total += 1
+
+    def record_failover(self, from_model: str, to_model: str):
+        """记录一次请求内的改用（from_model 失败后交给 to_model）"""
+        with self._lock:
+            key = (from_model, to_model)
+            self._failovers[key] = self._failovers.get(key, 0) + 1
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: 每个模型的健康状态，以及按 "模型/原因" 统计的决策次数和按 "原模型->新模型" 统计的改用次数
+        """
+        now = time.monotonic()
+        with self._lock:
+            models = {
+                model: {
+                    'healthy': health.healthy(now),
+                    'latency_ewma': round(health.latency, 4) if health.latency is not None else None,
+                    'error_rate_ewma': round(health.error_rate, 4),
+                    'samples': health.samples,
+                    'degraded_total': health.degraded_total,
+                    'cooldown_remaining': round(max(0.0, health.open_until - now), 1),
+                }
+                for model, health in self._health.items()
+            }
+            decisions = {f"{model}/{reason}": count for (model, reason), count in sorted(self._decisions.items())}
+            failovers = {f"{a}->{b}": count for (a, b), count in sorted(self._failovers.items())}
+        return {'models': models, 'decisions': decisions, 'failovers': failovers}
+
+    def to_prometheus(self, prefix: str = 'gemini') -> str:
+        """Prometheus 文本格式：路由决策与改用次数（计数器），各模型的 EWMA 和健康状态（仪表）"""
+        now = time.monotonic()
+        with self._lock:
+            decisions = sorted(self._decisions.items())
+            failovers = sorted(self._failovers.items())
+            health = sorted(
+                (model, h.latency, h.error_rate, int(h.healthy(now)), h.degraded_total)
+                for model, h in self._health.items()
+            )
+        lines = [
+            f'# HELP {prefix}_router_decisions_total 路由决策次数（按选中的模型和原因）',
+            f'# TYPE {prefix}_router_decisions_total counter',
+        ]
+        lines += [
+            f'{prefix}_router_decisions_total{{model="{model}",reason="{reason}"}} {count}'
+            for (model, reason), count in decisions
+        ]
+        lines += [
+            f'# HELP {prefix}_router_failovers_total 请求失败后改用其他模型的次数',
+            f'# TYPE {prefix}_router_failovers_total counter',
+        ]
+        lines += [
+            f'{prefix}_router_failovers_total{{from="{a}",to="{b}"}} {count}'
+            for (a, b), count in failovers
+        ]
+        gauges = (
+            ('latency_ewma_seconds', "延迟 EWMA（秒）", 1),
+            ('error_rate_ewma', "错误率 EWMA", 2),
+            ('healthy', "1 表示可被选中，0 表示降级冷却中", 3),
+        )
+        for name, help_text, field in gauges:
+            lines.append(f'# HELP {prefix}_router_{name} {help_text}')
+            lines.append(f'# TYPE {prefix}_router_{name} gauge')
+            for entry in health:
+                if entry[field] is not None:
+                    lines.append(f'{prefix}_router_{name}{{model="{entry[0]}"}} {round(entry[field], 6)}')
+        lines.append(f'# HELP {prefix}_router_degraded_total 模型被标记为降级的次数')
+        lines.append(f'# TYPE {prefix}_router_degraded_total counter')
+        lines += [f'{prefix}_router_degraded_total{{model="{entry[0]}"}} {entry[4]}' for entry in health]
+        return '\n'.join(lines) + '\n'
+
+
+def router_from_env() -> Optional[ModelRouter]:
+    """按环境变量创建路由器；GEMINI_ROUTER=0 时返回 None"""
+    if os.getenv('GEMINI_ROUTER', '1') == '0':
+        return None
+    models = [model.strip() for model in os.getenv('GEMINI_ROUTER_MODELS', '').split(',') if model.strip()]
+    return ModelRouter(
+        models=models or (FAST_MODEL, QUALITY_MODEL),
+        latency_slo=float(os.getenv('GEMINI_ROUTER_SLO', DEFAULT_LATENCY_SLO)),
+        long_prompt_tokens=int(os.getenv('GEMINI_ROUTER_LONG_PROMPT', DEFAULT_LONG_PROMPT_TOKENS))
+    )
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+离线预生成结果页文案 - 为每个模块的每一种答题路径生成个性化文本
+
+每个模块的题目和选项是固定的（content/modules.ts），答题路径 -> 原型的规则也是确定的
+（calculateArchetype），所以全部答题路径可以提前枚举：每条路径生成一段个性化文本，
+写入一个紧凑的静态 JSON，结果页直接按路径查表，不需要在线调用模型。
+
+输出文件（默认 public/precomputed/results.json）：
+    {"version": 1, "model": "gemini-2.5-flash",
+     "results": {"hesitation:h1a,h2b": {"archetype": "carrier", "text": "..."}, ...}}
+
+增量生成：
+    每条路径的请求体由模块、所选选项和原型内容构造，其哈希记录在清单
+    （默认 content/precomputed/manifest.json）中。再次运行时只重新生成哈希变化的路径，
+    例如只修改了一个原型的 core，只有落到这个原型的路径会重新生成；
+    题目或选项被删除后，对应的路径从输出文件中移除。
+
+使用方法：
+    python scripts/precompute_results.py                 # 增量生成
+    python scripts/precompute_results.py --dry-run       # 只列出需要生成的路径
+    python scripts/precompute_results.py --force         # 全部重新生成
+"""
+
+import os
+import sys
+import time
+import argparse
+import itertools
+from typing import Dict, Iterator, List, Tuple
+
+from ts_content import load_modules, load_archetypes, calculate_archetype
+from content_pipeline import (
+    DEFAULT_MODEL, DEFAULT_CONCURRENCY, Manifest, Generator,
+    input_hash, resolve_auth, read_json, write_json_atomic
+)
+from gemini_http import build_payload
+from usage_meter import format_summary
+
+ROOT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+DEFAULT_OUTPUT = os.path.join(ROOT_DIR, 'public', 'precomputed', 'results.json')
+DEFAULT_MANIFEST = os.path.join(ROOT_DIR, 'content', 'precomputed', 'manifest.json')
+
+USAGE_TAG = 'precompute_results'
+
+GENERATION_CONFIG = {"temperature": 0.7, "maxOutputTokens": 256}
+
+PROMPT_TEMPLATE = """你在为一个帮助用户理解自己情绪反应模式的产品写结果页上的一段话。
+
+用户进入的模块：{module_name}（{module_subtitle}）——{module_description}
+
+用户的回答：
+{answers}
+
+根据回答，用户的反应原型是「{archetype_name}」：
+- 识别：{identify}
+- 核心：{core}
+- 允许句：{allow}
+
+请写一段 60 到 100 字的中文，用第二人称「你」，把用户的具体回答和这个原型联系起来，
+让用户感到「被看见」，语气温和、克制，不评判、不鼓励、不给建议。
+不要重复上面的原文，不要使用以下说法：{forbidden}。
+只输出这段话本身，不要标题、引号或解释。"""
+
+
+def result_key(module_id: str, option_ids: List[str]) -> str:
+    """查表用的键，与 content/precomputed.ts 中 resultKey 一致"""
+    return f"{module_id}:{','.join(option_ids)}"
+
+
+def enumerate_paths(modules: Dict[str, dict]) -> Iterator[Tuple[str, dict, Tuple[dict, ...]]]:
+    """
+    枚举所有模块的所有答题路径
+
+    Yields:
+        (键, 模块, 每道题选中的选项)
+    """
+    for module_id, module in modules.items():
+        choices = [question['options'] for question in module['questions']]
+        for options in itertools.product(*choices):
+            yield result_key(module_id, [option['id'] for option in options]), module, options
+
+
+def build_prompt(module: dict, options: Tuple[dict, ...], archetype: dict) -> str:
+    answers = '\n'.join(
+        f"- {question['text']} → {option['text']}"
+        for question, option in zip(module['questions'], options)
+    )
+    return PROMPT_TEMPLATE.format(
+        module_name=module['name'],
+        module_subtitle=module['subtitle'],
+        module_description=module['description'],
+        answers=answers,
+        archetype_name=archetype['name'],
+        identify=archetype['identify'].replace('\n', ''),
+        core=archetype['core'].replace('\n', ''),
+        allow=archetype['allowStatement'],
+        forbidden='、'.join(f"「{phrase}」" for phrase in archetype['forbidden']) or '无',
+    )
+
+
+def build_jobs(modules: Dict[str, dict], archetypes: Dict[str, dict]) -> Dict[str, dict]:
+    """
+    为每条答题路径构造请求
+
+    Returns:
+        dict: {键: {'archetype': 原型 ID, 'payload': 请求体}}
+    """
+    jobs = {}
+    for key, module, options in enumerate_paths(modules):
+        archetype_id = calculate_archetype(module, [option['id'] for option in options])
+        archetype = archetypes.get(archetype_id)
+        if archetype is None:
+            print(f"⚠️  {key}: content/archetypes.ts 中没有原型 {archetype_id}，跳过")
+            continue
+        jobs[key] = {
+            'archetype': archetype_id,
+            'payload': build_payload(build_prompt(module, options, archetype), GENERATION_CONFIG),
+        }
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="为所有答题路径预生成结果页文案")
+    parser.add_argument('--model', default=DEFAULT_MODEL, help="模型名称")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help="并发请求数")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="前端加载的静态 JSON")
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST, help="输入哈希清单")
+    parser.add_argument('--content-dir', default=None, help="content 目录（默认仓库中的 content/）")
+    parser.add_argument('--force', action='store_true', help="忽略清单，全部重新生成")
+    parser.add_argument('--dry-run', action='store_true', help="只列出需要重新生成的路径")
+    args = parser.parse_args()
+
+    jobs = build_jobs(load_modules(args.content_dir), load_archetypes(args.content_dir))
+    manifest = Manifest.load(args.manifest)
+    previous = read_json(args.output, {}).get('results', {})
+
+    digests = {key: input_hash(args.model, job['payload']) for key, job in jobs.items()}
+    stale = [
+        key for key in jobs
+        if args.force or key not in previous or not manifest.is_current(key, digests[key])
+    ]
+    removed = manifest.prune(jobs)
+
+    print(f"📋 答题路径: {len(jobs)}  需要生成: {len(stale)}  已是最新: {len(jobs) - len(stale)}  已删除: {len(removed)}")
+    if args.dry_run:
+        for key in stale:
+            print(f"  · {key} → {jobs[key]['archetype']}")
+        return
+
+    # 沿用仍然存在的旧结果：生成失败的路径继续显示上一版文案，下次运行再重试
+    results = {key: previous[key] for key in jobs if key in previous}
+    output = {'version': 1, 'model': args.model, 'results': results}
+    failed = 0
+    start = time.perf_counter()
+
+    if stale:
+        generator = Generator(args.model, args.concurrency, tag=USAGE_TAG, **resolve_auth())
+        pending = [(key, jobs[key]['payload']) for key in stale]
+        for done, (key, text, error) in enumerate(generator.run(pending), 1):
+            if error is not None:
+                failed += 1
+                print(f"❌ {key}: {type(error).__name__}: {error}")
+                continue
+            results[key] = {'archetype': jobs[key]['archetype'], 'text': text.strip()}
+            manifest.record(key, digests[key], args.model)
+            # 定期落盘，中途退出时已生成的路径不会丢失
+            if done % 20 == 0:
+                write_json_atomic(args.output, output, compact=True)
+                manifest.save()
+            print(f"✓ [{done}/{len(stale)}] {key}")
+
+    write_json_atomic(args.output, output, compact=True)
+    manifest.save()
+
+    print("\n" + "=" * 60)
+    print("✅ 预生成完成")
+    print("=" * 60)
+    print(f"生成: {len(stale) - failed}  失败: {failed}  沿用: {len(jobs) - len(stale)}")
+    print(f"耗时: {time.perf_counter() - start:.2f}s")
+    if stale and generator.client.usage_meter is not None:
+        print(f"用量: {format_summary(generator.client.usage_meter, USAGE_TAG)}")
+    print(f"结果: {args.output}（{os.path.getsize(args.output)} 字节）")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+自适应限流器 - 按模型的令牌桶（请求/分钟 + token/分钟），根据 429/503 自动调整速率
+
+所有调用路径都通过共享的 GeminiHttpClient 发请求，客户端在发出请求前向限流器申请额度：
+- 每个模型两个令牌桶：RPM（请求数）和 TPM（估算的输入 token 数）
+- 不设上限时（默认）不限制请求，只记录最近的请求速率；第一次收到 429 / 503 时以该速率作为 RPM 上限
+- 收到 429 / 503 时速率乘性下降，并在 Retry-After 指定的时间内暂停该模型的所有请求
+- 连续成功时速率按固定步长缓慢回升（AIMD），不会一次恢复到上限
+
+这样长时间的批量任务会稳定在配额之下，而不是在突发和失败之间来回摆动。
+
+使用方法：
+    from rate_limiter import AdaptiveRateLimiter
+    limiter = AdaptiveRateLimiter()                        # 没有静态上限，上限从 429 中得出
+    limiter = AdaptiveRateLimiter(requests_per_minute=60, tokens_per_minute=250000)
+
+    limiter.acquire("gemini-2.5-flash", tokens=120)       # 阻塞直到有额度
+    limiter.on_response("gemini-2.5-flash", 429, "30")     # 反馈响应状态
+"""
+
+import time
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+# 触发降速的状态码
+THROTTLE_STATUS = (429, 503)
+
+
+def estimate_tokens(payload: dict) -> int:
+    """
+    粗略估算请求的输入 token 数（中文约 1-2 字符一个 token，这里按 2 字符保守估计）
+
+    Args:
+        payload: generateContent 请求体
+
+    Returns:
+        int: 估算的 token 数，至少为 1
+    """
+    chars = 0
+    for content in payload.get('contents', []):
+        for part in content.get('parts', []):
+            chars += len(part.get('text', ''))
+    return max(1, (chars + 1) // 2)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    解析 Retry-After 头（秒数或 HTTP 日期）
+
+    Returns:
+        float: 需要等待的秒数；无法解析时返回 None
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_quota_error(error: BaseException) -> bool:
+    """判断异常（或其 __cause__）是否是 429 配额错误"""
+    while error is not None:
+        response = getattr(error, 'response', None)
+        if response is not None and getattr(response, 'status_code', None) == 429:
+            return True
+        error = error.__cause__
+    return False
+
+
+class TokenBucket:
+    """
+    令牌桶：按 rate 每秒补充，最多积累 capacity 个
+
+    允许一次取出超过 capacity 的数量（桶满时放行并记为欠账），
+    这样单个大请求不会永远等不到额度。
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """还需要等待多少秒才能取出 amount"""
+        self.refill(now)
+        needed = min(amount, self.capacity) - self.tokens
+        return 0.0 if needed <= 0 else needed / self.rate
+
+    def take(self, amount: float):
+        self.tokens -= amount
+
+    def set_rate(self, rate: float, capacity: float):
+        self.refill(time.monotonic())
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = min(self.tokens, capacity)
+
+
+class _ModelState:
+    """单个模型的限流状态（rpm / tpm 为 None 表示没有该项上限，对应的令牌桶也为 None）"""
+
+    def __init__(self, rpm: Optional[float], tpm: Optional[float], burst_seconds: float):
+        self.max_rpm = rpm
+        self.max_tpm = tpm
+        self.rpm = rpm
+        self.tpm = tpm
+        self.burst_seconds = burst_seconds
+        self.requests = TokenBucket(rpm / 60, max(1.0, rpm / 60 * burst_seconds)) if rpm else None
+        self.tokens = TokenBucket(tpm / 60, max(1.0, tpm / 60 * burst_seconds)) if tpm else None
+        # 没有 RPM 上限时按分钟窗口统计请求速率，第一次被限流时据此确定上限
+        self.window_started = time.monotonic()
+        self.window_requests = 0
+        self.last_window_rpm = 0.0
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+        self.last_increase = 0.0
+        self.stats = {
+            'requests': 0,
+            'throttled': 0,
+            'waited_seconds': 0.0,
+            'decreases': 0,
+            'increases': 0,
+        }
+
+    def apply_rates(self):
+        if self.requests is not None:
+            self.requests.set_rate(self.rpm / 60, max(1.0, self.rpm / 60 * self.burst_seconds))
+        if self.tokens is not None:
+            self.tokens.set_rate(self.tpm / 60, max(1.0, self.tpm / 60 * self.burst_seconds))
+
+    def count_request(self, now: float):
+        elapsed = now - self.window_started
+        if elapsed >= 60:
+            self.last_window_rpm = self.window_requests / elapsed * 60
+            self.window_started = now
+            self.window_requests = 0
+        self.window_requests += 1
+
+    def observed_rpm(self, now: float) -> float:
+        """最近的请求速率（每分钟）；当前窗口太短时参考上一个窗口"""
+        elapsed = now - self.window_started
+        rpm = self.window_requests / max(elapsed, 1.0) * 60
+        return rpm if elapsed >= 10 else max(rpm, self.last_window_rpm)
+
+    def learn_limit(self, now: float):
+        """第一次被限流：以此前的请求速率作为 RPM 上限"""
+        self.max_rpm = self.rpm = max(1.0, self.observed_rpm(now))
+        self.requests = TokenBucket(self.rpm / 60, max(1.0, self.rpm / 60 * self.burst_seconds))
+        self.requests.tokens = 0.0
+
+
+class AdaptiveRateLimiter:
+    """
+    按模型的自适应限流器，线程安全
+
+    Args:
+        requests_per_minute: 默认 RPM 上限；None 表示没有静态上限，第一次被限流时按当时的请求速率确定
+        tokens_per_minute: 默认 TPM 上限；None 表示不限制 token 数
+        limits: 按模型覆盖上限 {模型名: (rpm, tpm)}
+        burst_seconds: 令牌桶容量相当于多少秒的额度（越小越平滑）
+        decrease_factor: 收到 429/503 时速率乘以该系数
+        increase_fraction: 每次回升的步长（上限的比例）
+        increase_interval: 两次回升之间至少间隔的秒数
+        min_fraction: 速率下限（上限的比例）
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        burst_seconds: float = 1.0,
+        decrease_factor: float = 0.5,
+        increase_fraction: float = 0.05,
+        increase_interval: float = 2.0,
+        min_fraction: float = 0.02
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.limits = dict(limits or {})
+        self.burst_seconds = burst_seconds
+        self.decrease_factor = decrease_factor
+        self.increase_fraction = increase_fraction
+        self.increase_interval = increase_interval
+        self.min_fraction = min_fraction
+
+        self._lock = threading.Lock()
+        self._models: Dict[str, _ModelState] = {}
+
+    def _state(self, model: str) -> _ModelState:
+        state = self._models.get(model)
+        if state is None:
+            # 凭证池的分组键是 "凭证|模型"，按模型覆盖的上限同样适用
+            rpm, tpm = self.limits.get(
+                model.rsplit('|', 1)[-1], (self.requests_per_minute, self.tokens_per_minute)
+            )
+            state = _ModelState(rpm, tpm, self.burst_seconds)
+            self._models[model] = state
+        return state
+
+    def acquire(self, model: str, tokens: int = 1, timeout: Optional[float] = None) -> float:
+        """
+        申请一次请求的额度，必要时阻塞等待
+
+        Args:
+            model: 模型名称
+            tokens: 估算的 token 数
+            timeout: 最长等待秒数，超时抛出 TimeoutError
+
+        Returns:
+            float: 实际等待的秒数
+        """
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                state = self._state(model)
+                now = time.monotonic()
+                wait = max(
+                    state.blocked_until - now,
+                    state.requests.wait_time(1, now) if state.requests is not None else 0.0,
+                    state.tokens.wait_time(tokens, now) if state.tokens is not None else 0.0
+                )
+                if wait <= 0:
+                    if state.requests is not None:
+                        state.requests.take(1)
+                    else:
+                        state.count_request(now)
+                    if state.tokens is not None:
+                        state.tokens.take(tokens)
+                    waited = now - started
+                    state.stats['requests'] += 1
+                    state.stats['waited_seconds'] += waited
+                    return waited
+            if timeout is not None and now - started + wait > timeout:
+                raise TimeoutError(f"模型 {model} 限流等待超过 {timeout}s")
+            time.sleep(min(wait, 0.5))
+
+    def on_response(
+        self,
+        model: str,
+        status_code: int,
+        retry_after: Optional[str] = None,
+        tokens_used: Optional[int] = None,
+        tokens_estimated: Optional[int] = None
+    ):
+        """
+        反馈响应结果，调整速率
+
+        Args:
+            model: 模型名称
+            status_code: HTTP 状态码
+            retry_after: Retry-After 响应头
+            tokens_used: 实际消耗的 token 数（来自 usageMetadata）
+            tokens_estimated: acquire 时使用的估算值，与 tokens_used 一起用于修正 TPM 桶
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(model)
+            if tokens_used is not None and tokens_estimated is not None and state.tokens is not None:
+                state.tokens.take(tokens_used - tokens_estimated)
+
+            if status_code in THROTTLE_STATUS:
+                state.stats['throttled'] += 1
+                delay = parse_retry_after(retry_after)
+                if delay:
+                    state.blocked_until = max(state.blocked_until, now + delay)
+                if state.requests is None:
+                    state.learn_limit(now)
+                # 同一波并发请求同时收到 429 时只降一次
+                if now - state.last_decrease >= self.burst_seconds:
+                    state.last_decrease = now
+                    state.last_increase = now
+                    state.rpm = max(state.max_rpm * self.min_fraction, state.rpm * self.decrease_factor)
+                    if state.tokens is not None:
+                        state.tpm = max(state.max_tpm * self.min_fraction, state.tpm * self.decrease_factor)
+                    state.apply_rates()
+                    state.stats['decreases'] += 1
+            elif status_code < 400:
+                if (state.requests is not None and state.rpm < state.max_rpm
+                        and now - state.last_increase >= self.increase_interval):
+                    state.last_increase = now
+                    state.rpm = min(state.max_rpm, state.rpm + state.max_rpm * self.increase_fraction)
+                    if state.tokens is not None:
+                        state.tpm = min(state.max_tpm, state.tpm + state.max_tpm * self.increase_fraction)
+                    state.apply_rates()
+                    state.stats['increases'] += 1
+
+    def stats(self) -> dict:
+        """返回每个模型的当前速率与统计"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                model: dict(
+                    state.stats,
+                    rpm=round(state.rpm, 2) if state.rpm is not None else None,
+                    tpm=round(state.tpm, 2) if state.tpm is not None else None,
+                    max_rpm=state.max_rpm,
+                    max_tpm=state.max_tpm,
+                    blocked_for=round(max(0.0, state.blocked_until - now), 3)
+                )
+                for model, state in self._models.items()
+            }
@@ -0,0 +1,268 @@
+"""
+响应缓存 - generateContent 前的两级缓存
+
+缓存键是「模型名 + 完整请求体」的 SHA-256，生成参数（generationConfig 等）
+都在请求体里，参数不同的请求不会互相命中。
+
+两级结构：
+1. 内存 LRU：按条数和字节数限制大小
+2. SQLite 磁盘缓存：带 TTL，超过容量时淘汰最久未访问的条目
+
+磁盘命中的条目会回填到内存层。
+
+使用方法：
+    from response_cache import ResponseCache
+    from gemini_http import get_default_client
+
+    client = get_default_client()
+    client.response_cache = ResponseCache(sqlite_path="~/.cache/gemini/responses.sqlite")
+
+也可以设置环境变量 GEMINI_RESPONSE_CACHE 指向 SQLite 文件，默认客户端会自动启用。
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+DEFAULT_MEMORY_MAX_ITEMS = 1024
+DEFAULT_MEMORY_MAX_BYTES = 32 * 1024 * 1024
+DEFAULT_DISK_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_TTL = 7 * 24 * 3600
+
+
+def make_key(model: str, payload: dict) -> str:
+    """
+    生成缓存键：模型名 + 规范化 JSON 请求体的 SHA-256
+
+    Args:
+        model: 模型名称
+        payload: 完整请求体（包含 generationConfig 等生成参数）
+
+    Returns:
+        str: 十六进制摘要
+    """
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    digest = hashlib.sha256()
+    digest.update(model.encode('utf-8'))
+    digest.update(b'\n')
+    digest.update(canonical.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    内存 LRU + SQLite 两级响应缓存，线程安全
+
+    Args:
+        memory_max_items: 内存层最大条目数
+        memory_max_bytes: 内存层最大字节数
+        sqlite_path: SQLite 文件路径，为 None 时只使用内存层
+        ttl: 磁盘条目的有效期（秒）
+        disk_max_bytes: 磁盘层最大字节数
+    """
+
+    def __init__(
+        self,
+        memory_max_items: int = DEFAULT_MEMORY_MAX_ITEMS,
+        memory_max_bytes: int = DEFAULT_MEMORY_MAX_BYTES,
+        sqlite_path: Optional[str] = None,
+        ttl: float = DEFAULT_TTL,
+        disk_max_bytes: int = DEFAULT_DISK_MAX_BYTES
+    ):
+        self.memory_max_items = memory_max_items
+        self.memory_max_bytes = memory_max_bytes
+        self.ttl = ttl
+        self.disk_max_bytes = disk_max_bytes
+
+        self._lock = threading.Lock()
+        # key -> (写入时间, 序列化后的响应)
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'puts': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+            'expired': 0,
+            'bytes_served': 0,
+        }
+
+        self._db = None
+        if sqlite_path:
+            sqlite_path = os.path.expanduser(sqlite_path)
+            os.makedirs(os.path.dirname(os.path.abspath(sqlite_path)), exist_ok=True)
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT,"
+                " value BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self._db.commit()
+            with self._lock:
+                self._purge_expired_locked()
+                row = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+                self._disk_bytes = row[0]
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        查询缓存
+
+        Returns:
+            dict: 缓存的响应（每次返回新对象）；未命中返回 None
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created < self.ttl:
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    self._stats['bytes_served'] += len(value)
+                    return json.loads(value)
+                self._drop_memory_locked(key)
+                self._stats['expired'] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created = row
+                    if now - created < self.ttl:
+                        self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        self._put_memory_locked(key, created, value)
+                        self._stats['disk_hits'] += 1
+                        self._stats['bytes_served'] += len(value)
+                        return json.loads(value)
+                    self._delete_disk_locked(key)
+                    self._stats['expired'] += 1
+
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, key: str, response: dict, model: Optional[str] = None):
+        """
+        写入缓存（两级都写）
+
+        Args:
+            key: make_key 生成的缓存键
+            response: generateContent 的 JSON 响应
+            model: 模型名称（仅用于磁盘层排查）
+        """
+        value = json.dumps(response, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        now = time.time()
+        with self._lock:
+            self._stats['puts'] += 1
+            self._put_memory_locked(key, now, value)
+            if self._db is not None:
+                self._delete_disk_locked(key)
+                self._db.execute(
+                    "INSERT INTO responses (key, model, value, size, created, accessed)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model, value, len(value), now, now)
+                )
+                self._disk_bytes += len(value)
+                self._evict_disk_locked()
+                self._db.commit()
+
+    def delete(self, key: str) -> bool:
+        """
+        删除一条缓存（两级都删），例如调用方拒绝了这次响应
+
+        Returns:
+            bool: 是否删除了条目
+        """
+        with self._lock:
+            found = key in self._memory
+            self._drop_memory_locked(key)
+            if self._db is not None:
+                disk_bytes = self._disk_bytes
+                self._delete_disk_locked(key)
+                self._db.commit()
+                found = found or self._disk_bytes != disk_bytes
+        return found
+
+    def stats(self) -> dict:
+        """返回命中率与各层字节数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_items'] = len(self._memory)
+            stats['memory_bytes'] = self._memory_bytes
+            stats['disk_bytes'] = self._disk_bytes
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        """清空两级缓存"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+                self._disk_bytes = 0
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+                self._db = None
+
+    def _put_memory_locked(self, key: str, created: float, value: bytes):
+        if len(value) > self.memory_max_bytes:
+            return
+        self._drop_memory_locked(key)
+        self._memory[key] = (created, value)
+        self._memory_bytes += len(value)
+        while len(self._memory) > self.memory_max_items or self._memory_bytes > self.memory_max_bytes:
+            _, (_, evicted) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._stats['memory_evictions'] += 1
+
+    def _drop_memory_locked(self, key: str):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry[1])
+
+    def _delete_disk_locked(self, key: str):
+        row = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._disk_bytes -= row[0]
+
+    def _evict_disk_locked(self):
+        """超过容量时按最久未访问的顺序淘汰"""
+        while self._disk_bytes > self.disk_max_bytes:
+            rows = self._db.execute(
+                "SELECT key, size FROM responses ORDER BY accessed LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._disk_bytes -= size
+                self._stats['disk_evictions'] += 1
+                if self._disk_bytes <= self.disk_max_bytes:
+                    break
+
+    def _purge_expired_locked(self):
+        cursor = self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        self._stats['expired'] += cursor.rowcount
+        self._db.commit()
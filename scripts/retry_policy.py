@@ -0,0 +1,242 @@
+"""
+重试与对冲请求 - 降低偶发错误和长尾延迟的影响
+
+RetryPolicy：
+- 每次尝试都有独立的 (连接, 读取) 超时，一个卡住的连接不会永远占住工作线程
+- 指数退避 + 完全随机抖动（full jitter），服务端给出 Retry-After 时至少等待该时长
+- 区分可重试错误（超时、连接错误、408/429/5xx）和不可重试错误（400/401/403/404 等）
+
+HedgePolicy：
+- 记录最近请求的延迟，请求耗时超过 p95 仍未返回时，再发一份相同的请求
+- 哪个先成功就用哪个，另一个的结果被丢弃
+
+使用方法：
+    from retry_policy import RetryPolicy, HedgePolicy
+    from gemini_http import get_default_client
+
+    client = get_default_client()
+    client.retry_policy = RetryPolicy(max_attempts=4)
+    client.hedge_policy = HedgePolicy(percentile=95)
+"""
+
+import copy
+import time
+import random
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Optional
+
+from rate_limiter import parse_retry_after
+
+RETRYABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+
+
+def percentile(values, p: float) -> float:
+    """计算百分位数（最近秩法）"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class RetryPolicy:
+    """
+    重试策略
+
+    Args:
+        max_attempts: 最多尝试次数（包括第一次）
+        base_delay: 退避基数（秒），第 n 次重试前最多等待 base_delay * 2^n
+        max_delay: 单次退避上限（秒）
+        attempt_timeout: 每次尝试的 (连接, 读取) 超时
+        deadline: 所有尝试加起来的总时限（秒），None 表示不限
+        retry_status: 可重试的 HTTP 状态码
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        attempt_timeout=(5.0, 60.0),
+        deadline: Optional[float] = None,
+        retry_status=RETRYABLE_STATUS
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.retry_status = frozenset(retry_status)
+
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'attempts': 0, 'retries': 0, 'gave_up': 0}
+
+    def without_status(self, status) -> 'RetryPolicy':
+        """
+        返回不再重试 status 中状态码的同一策略（浅拷贝，统计与原策略共用）
+
+        调用方自己会处理这些状态码时使用，例如凭证池遇到 429 直接换下一个凭证。
+        """
+        policy = copy.copy(self)
+        policy.retry_status = self.retry_status - frozenset(status)
+        return policy
+
+    def is_retryable(self, error: BaseException) -> bool:
+        """判断错误是否值得重试"""
+        import requests
+
+        if isinstance(error, requests.exceptions.HTTPError):
+            response = error.response
+            return response is not None and response.status_code in self.retry_status
+        return isinstance(error, (
+            requests.exceptions.Timeout,
+            requests.exceptions.ConnectionError,
+            requests.exceptions.ChunkedEncodingError,
+        ))
+
+    def backoff(self, retry: int, error: Optional[BaseException] = None) -> float:
+        """
+        第 retry 次重试前的等待时间（完全随机抖动），不少于 Retry-After
+
+        Args:
+            retry: 重试序号，从 0 开始
+            error: 上一次尝试的错误
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** retry)))
+        response = getattr(error, 'response', None)
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after:
+                delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def call(self, attempt: Callable, *args, **kwargs):
+        """
+        按策略执行 attempt(timeout, *args, **kwargs)
+
+        Args:
+            attempt: 第一个参数是本次尝试的超时
+
+        Returns:
+            attempt 的返回值
+
+        Raises:
+            最后一次尝试的异常（或不可重试的异常）
+        """
+        started = time.monotonic()
+        with self._lock:
+            self._stats['calls'] += 1
+        for index in range(self.max_attempts):
+            timeout = self.attempt_timeout
+            if self.deadline is not None:
+                remaining = self.deadline - (time.monotonic() - started)
+                if remaining <= 0:
+                    break
+                timeout = (min(timeout[0], remaining), min(timeout[1], remaining))
+            with self._lock:
+                self._stats['attempts'] += 1
+            try:
+                return attempt(timeout, *args, **kwargs)
+            except Exception as error:
+                if not self.is_retryable(error):
+                    raise
+                delay = self.backoff(index, error)
+                out_of_time = (
+                    self.deadline is not None
+                    and time.monotonic() - started + delay >= self.deadline
+                )
+                if index == self.max_attempts - 1 or out_of_time:
+                    with self._lock:
+                        self._stats['gave_up'] += 1
+                    raise
+                with self._lock:
+                    self._stats['retries'] += 1
+                time.sleep(delay)
+        raise TimeoutError(f"重试总时限 {self.deadline}s 已用完")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+
+class HedgePolicy:
+    """
+    对冲请求策略：请求超过最近延迟的 percentile 分位仍未返回时，再发一份
+
+    Args:
+        percentile: 触发对冲的延迟分位
+        min_samples: 样本数达到该值之前不对冲
+        window: 统计延迟的最近样本数
+        max_workers: 执行请求的线程池大小
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        min_samples: int = 20,
+        window: int = 500,
+        max_workers: int = 32
+    ):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gemini-hedge')
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'hedged': 0, 'hedge_wins': 0}
+
+    def hedge_delay(self) -> Optional[float]:
+        """当前的对冲阈值（秒），样本不足时返回 None"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            return percentile(self._latencies, self.percentile)
+
+    def _timed(self, fn: Callable):
+        started = time.perf_counter()
+        result = fn()
+        with self._lock:
+            self._latencies.append(time.perf_counter() - started)
+        return result
+
+    def run(self, fn: Callable):
+        """
+        执行 fn()，必要时发出对冲请求，返回第一个成功的结果
+
+        两份请求都失败时抛出最先完成那份的异常。
+        """
+        with self._lock:
+            self._stats['calls'] += 1
+        delay = self.hedge_delay()
+        # 在调用方的上下文中执行，追踪 span 能挂到正确的父节点下
+        context = contextvars.copy_context()
+        primary = self._executor.submit(context.run, self._timed, fn)
+        if delay is None:
+            return primary.result()
+
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        with self._lock:
+            self._stats['hedged'] += 1
+        hedge = self._executor.submit(contextvars.copy_context().run, self._timed, fn)
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self._stats['hedge_wins'] += 1
+                    return future.result()
+                first_error = first_error or future.exception()
+        raise first_error
+
+    def stats(self) -> dict:
+        delay = self.hedge_delay()
+        with self._lock:
+            stats = dict(self._stats)
+        stats['hedge_delay'] = round(delay, 4) if delay is not None else None
+        return stats
@@ -0,0 +1,432 @@
+"""
+语义缓存 - 按提示的向量相似度复用已有的生成结果
+
+响应缓存（response_cache.py）只在请求体完全相同时命中，换个说法的同一个问题都会错过。
+SemanticCache 把提示文本转成向量，查询时与已缓存的提示比较余弦相似度，
+超过阈值就直接返回对应的响应：
+
+- 向量存放在一个连续的 float32 NumPy 矩阵中（已归一化），查询是一次矩阵-向量乘法加 argpartition 取 top-k
+- 只在「作用域」相同的条目之间比较：模型、generationConfig、systemInstruction 等除提示文本以外的部分都相同
+- 达到条数上限时淘汰最久未命中的条目（LRU），被淘汰的行原地复用，矩阵保持连续
+- save() 把矩阵写成 .npy、条目写成 .json；加载时矩阵用内存映射打开，启动不需要把整个索引读进内存，
+  第一次写入时才复制成可写的内存矩阵
+
+嵌入方式：
+- GeminiEmbedder：batchEmbedContents 批量嵌入
+- HashingEmbedder：本地字符 n-gram 特征哈希，不调用网络，用于测试和离线环境
+
+使用方法：
+    from semantic_cache import SemanticCache, GeminiEmbedder
+    from gemini_http import get_default_client
+
+    client = get_default_client()
+    client.semantic_cache = SemanticCache(GeminiEmbedder(client), threshold=0.92, path="~/.cache/gemini/semantic")
+
+也可以设置环境变量 GEMINI_SEMANTIC_CACHE 指向索引路径（不含扩展名），默认客户端会自动启用：
+- GEMINI_SEMANTIC_THRESHOLD: 相似度阈值，默认 0.92
+- GEMINI_SEMANTIC_MAX_ENTRIES: 条数上限，默认 10000
+- GEMINI_EMBED_MODEL: 嵌入模型，默认 text-embedding-004；设为 hashing 使用本地特征哈希
+
+需要 numpy（pip install numpy），只在创建语义缓存时导入。
+"""
+
+import os
+import copy
+import json
+import zlib
+import threading
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple
+
+from response_cache import make_key
+
+if TYPE_CHECKING:
+    import numpy
+
+DEFAULT_THRESHOLD = 0.92
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_EMBED_MODEL = "text-embedding-004"
+DEFAULT_HASHING_DIM = 512
+# batchEmbedContents 每次最多 100 条
+EMBED_BATCH_SIZE = 100
+INDEX_VERSION = 1
+
+
+def _np():
+    """按需导入 numpy（约 100ms），不启用语义缓存的脚本不付这个代价"""
+    import numpy
+    return numpy
+
+
+def split_prompt(model: str, payload: dict) -> Optional[Tuple[str, str]]:
+    """
+    把请求拆成「参与相似度比较的提示文本」和「必须完全相同的作用域」
+
+    Returns:
+        (提示文本, 作用域键)；请求中有非文本内容（图片、文件等）时返回 None
+    """
+    texts, roles = [], []
+    for content in payload.get('contents') or []:
+        parts = content.get('parts') or []
+        if any(set(part) != {'text'} for part in parts):
+            return None
+        roles.append(content.get('role', 'user'))
+        texts.append('\n'.join(part['text'] for part in parts))
+    text = '\n\n'.join(texts).strip()
+    if not text:
+        return None
+    rest = {key: value for key, value in payload.items() if key != 'contents'}
+    rest['roles'] = roles
+    return text, make_key(model, rest)
+
+
+class HashingEmbedder:
+    """
+    本地特征哈希嵌入：字符 1~3-gram 计数哈希到固定维度后归一化
+
+    不理解语义，只反映字面重合度；改写幅度小的近似提示相似度较高。
+    用于测试和离线环境，阈值通常需要比真实嵌入模型低（0.8 左右）。
+
+    Args:
+        dim: 向量维度
+    """
+
+    def __init__(self, dim: int = DEFAULT_HASHING_DIM):
+        self.dim = dim
+        self.name = f"hashing:{dim}"
+
+    def embed(self, texts: Sequence[str], access_token: Optional[str] = None,
+              api_key: Optional[str] = None) -> 'numpy.ndarray':
+        np = _np()
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            text = ''.join(text.lower().split())
+            for n in (1, 2, 3):
+                for start in range(len(text) - n + 1):
+                    digest = zlib.crc32(text[start:start + n].encode('utf-8'))
+                    # 用最高位决定符号，减少哈希冲突带来的偏差
+                    vectors[row, digest % self.dim] += 1.0 if digest & 0x80000000 else -1.0
+        return vectors
+
+
+class GeminiEmbedder:
+    """
+    通过 batchEmbedContents 批量嵌入
+
+    Args:
+        client: GeminiHttpClient
+        model: 嵌入模型名称
+        task_type: 嵌入任务类型
+    """
+
+    def __init__(self, client, model: str = DEFAULT_EMBED_MODEL, task_type: str = "SEMANTIC_SIMILARITY"):
+        self.client = client
+        self.model = model
+        self.task_type = task_type
+        self.name = f"gemini:{model}"
+
+    def embed(self, texts: Sequence[str], access_token: Optional[str] = None,
+              api_key: Optional[str] = None) -> 'numpy.ndarray':
+        """
+        Raises:
+            requests.exceptions.HTTPError: 非 2xx 响应
+        """
+        from gemini_http import API_VERSION, auth_headers
+
+        np = _np()
+        rows = []
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            body = {"requests": [
+                {
+                    "model": f"models/{self.model}",
+                    "content": {"parts": [{"text": text}]},
+                    "taskType": self.task_type,
+                }
+                for text in texts[start:start + EMBED_BATCH_SIZE]
+            ]}
+            response = self.client.post(
+                f"{API_VERSION}/models/{self.model}:batchEmbedContents",
+                headers=auth_headers(access_token),
+                params={'key': api_key} if api_key else None,
+                json=body
+            )
+            response.raise_for_status()
+            rows += [embedding['values'] for embedding in response.json()['embeddings']]
+        return np.asarray(rows, dtype=np.float32)
+
+
+class SemanticCache:
+    """
+    向量相似度缓存，线程安全
+
+    Args:
+        embedder: 提供 embed(texts, access_token, api_key) 和 name 的嵌入器
+        threshold: 余弦相似度阈值，不低于该值才算命中
+        max_entries: 条数上限，超过时淘汰最久未命中的条目
+        path: 索引路径（不含扩展名），存在时加载，save() 写回
+    """
+
+    def __init__(
+        self,
+        embedder,
+        threshold: float = DEFAULT_THRESHOLD,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        path: Optional[str] = None
+    ):
+        np = _np()
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.path = os.path.expanduser(path) if path else None
+
+        self._lock = threading.Lock()
+        self._dim: Optional[int] = None
+        self._size = 0
+        # 前 _size 行有效；从磁盘加载时是只读的内存映射，第一次写入时复制
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._scope_ids = np.zeros(0, dtype=np.int32)
+        self._last_used = np.zeros(0, dtype=np.int64)
+        self._clock = 0
+        self._scopes = {}
+        self._entries: List[dict] = []
+        self._rows_by_key = {}
+        self._stats = {'hits': 0, 'misses': 0, 'skipped': 0, 'puts': 0, 'evictions': 0, 'invalidations': 0, 'embed_errors': 0}
+
+        if self.path and os.path.exists(self.path + '.json'):
+            self._load()
+
+    def lookup(self, model: str, payload: dict, access_token: Optional[str] = None,
+               api_key: Optional[str] = None) -> Tuple[Optional[dict], Optional['numpy.ndarray']]:
+        """
+        查找相似的已缓存请求
+
+        嵌入失败不影响调用，按未命中处理。
+
+        Returns:
+            (缓存的响应或 None, 提示的向量)：向量可以传给 put()，未命中时写入不必再嵌入一次
+        """
+        split = split_prompt(model, payload)
+        if split is None:
+            with self._lock:
+                self._stats['skipped'] += 1
+            return None, None
+        text, scope = split
+        vector = self._embed(text, access_token, api_key)
+        if vector is None:
+            return None, None
+        with self._lock:
+            scope_id = self._scopes.get(scope)
+            matches = self._search_locked(vector, 1, scope_id) if scope_id is not None else []
+            if matches and matches[0][1] >= self.threshold:
+                row = matches[0][0]
+                self._touch_locked(row)
+                self._stats['hits'] += 1
+                return copy.deepcopy(self._entries[row]['result']), vector
+            self._stats['misses'] += 1
+        return None, vector
+
+    def put(self, model: str, payload: dict, result: dict, vector: Optional['numpy.ndarray'] = None,
+            access_token: Optional[str] = None, api_key: Optional[str] = None):
+        """
+        写入一条响应
+
+        Args:
+            model: 模型名称
+            payload: 请求体
+            result: generateContent 的 JSON 响应
+            vector: lookup() 返回的向量，为 None 时重新嵌入
+        """
+        split = split_prompt(model, payload)
+        if split is None:
+            return
+        text, scope = split
+        if vector is None:
+            vector = self._embed(text, access_token, api_key)
+            if vector is None:
+                return
+        key = make_key(model, payload)
+        entry = {'key': key, 'scope': scope, 'prompt': text, 'result': copy.deepcopy(result)}
+        with self._lock:
+            self._ensure_writable_locked(len(vector))
+            row = self._rows_by_key.get(key)
+            if row is None:
+                row = self._allocate_row_locked()
+            self._vectors[row] = vector
+            self._scope_ids[row] = self._scopes.setdefault(scope, len(self._scopes))
+            self._entries[row] = entry
+            self._rows_by_key[key] = row
+            self._touch_locked(row)
+            self._stats['puts'] += 1
+
+    def invalidate(self, model: str, payload: dict) -> bool:
+        """
+        删除与该请求完全相同的条目（调用方拒绝了缓存的响应时使用），相似的其他条目不受影响
+
+        Returns:
+            bool: 是否删除了条目
+        """
+        key = make_key(model, payload)
+        with self._lock:
+            row = self._rows_by_key.pop(key, None)
+            if row is None:
+                return False
+            self._ensure_writable_locked(self._dim)
+            # 用最后一行填补空位，前 _size 行保持连续
+            last = self._size - 1
+            if row != last:
+                self._vectors[row] = self._vectors[last]
+                self._scope_ids[row] = self._scope_ids[last]
+                self._last_used[row] = self._last_used[last]
+                self._entries[row] = self._entries[last]
+                self._rows_by_key[self._entries[row]['key']] = row
+            self._entries.pop()
+            self._size = last
+            self._stats['invalidations'] += 1
+        return True
+
+    def search(self, text: str, k: int = 5, access_token: Optional[str] = None,
+               api_key: Optional[str] = None) -> List[Tuple[float, dict]]:
+        """
+        不区分作用域地列出与 text 最相似的 k 个条目（用于排查阈值）
+
+        Returns:
+            list: [(相似度, 条目), ...]，按相似度从高到低
+        """
+        vector = self._embed(text, access_token, api_key)
+        if vector is None:
+            return []
+        with self._lock:
+            return [(similarity, self._entries[row]) for row, similarity in self._search_locked(vector, k, None)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats, entries=self._size, dim=self._dim or 0, embedder=self.embedder.name)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        np = _np()
+        with self._lock:
+            self._size = 0
+            self._vectors = np.zeros((0, self._dim or 0), dtype=np.float32)
+            self._scope_ids = np.zeros(0, dtype=np.int32)
+            self._last_used = np.zeros(0, dtype=np.int64)
+            self._scopes.clear()
+            self._entries = []
+            self._rows_by_key.clear()
+
+    def save(self, path: Optional[str] = None):
+        """
+        把索引写到 path.npy（向量矩阵）和 path.json（条目），先写临时文件再替换
+
+        Args:
+            path: 索引路径（不含扩展名），默认构造时的 path
+        """
+        np = _np()
+        path = os.path.expanduser(path) if path else self.path
+        if not path:
+            raise ValueError("没有指定语义缓存的保存路径")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            size = self._size
+            vectors = np.ascontiguousarray(self._vectors[:size])
+            meta = {
+                'version': INDEX_VERSION,
+                'embedder': self.embedder.name,
+                'dim': self._dim,
+                'scopes': sorted(self._scopes, key=self._scopes.get),
+                'entries': [
+                    dict(self._entries[row], scope_id=int(self._scope_ids[row]), last_used=int(self._last_used[row]))
+                    for row in range(size)
+                ],
+            }
+            # 先写到临时文件再替换：已经映射了旧文件的进程仍然读到完整的旧内容
+            with open(path + '.npy.tmp', 'wb') as f:
+                np.save(f, vectors)
+            with open(path + '.json.tmp', 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(path + '.npy.tmp', path + '.npy')
+            os.replace(path + '.json.tmp', path + '.json')
+
+    def close(self):
+        """有保存路径时写回索引"""
+        if self.path:
+            self.save()
+
+    def _load(self):
+        np = _np()
+        with open(self.path + '.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        # 嵌入方式不同的向量之间没有可比性，旧索引作废
+        if meta.get('version') != INDEX_VERSION or meta.get('embedder') != self.embedder.name:
+            return
+        vectors = np.load(self.path + '.npy', mmap_mode='r')
+        entries = meta['entries']
+        if vectors.shape[0] != len(entries):
+            return
+        self._dim = meta['dim']
+        self._vectors = vectors
+        self._size = len(entries)
+        self._scopes = {scope: index for index, scope in enumerate(meta['scopes'])}
+        self._scope_ids = np.array([entry.pop('scope_id') for entry in entries], dtype=np.int32)
+        self._last_used = np.array([entry.pop('last_used') for entry in entries], dtype=np.int64)
+        self._clock = int(self._last_used.max()) if len(entries) else 0
+        self._entries = entries
+        self._rows_by_key = {entry['key']: row for row, entry in enumerate(entries)}
+
+    def _embed(self, text: str, access_token: Optional[str], api_key: Optional[str]) -> Optional['numpy.ndarray']:
+        np = _np()
+        try:
+            vector = self.embedder.embed([text], access_token, api_key)[0]
+        except Exception:
+            with self._lock:
+                self._stats['embed_errors'] += 1
+            return None
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else None
+
+    def _search_locked(self, vector: 'numpy.ndarray', k: int, scope_id: Optional[int]) -> List[Tuple[int, float]]:
+        np = _np()
+        if not self._size or len(vector) != self._dim:
+            return []
+        similarities = self._vectors[:self._size] @ vector
+        if scope_id is not None:
+            similarities = np.where(self._scope_ids[:self._size] == scope_id, similarities, -np.inf)
+        k = min(k, self._size)
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return [(int(row), float(similarities[row])) for row in top if similarities[row] > -np.inf]
+
+    def _touch_locked(self, row: int):
+        self._clock += 1
+        self._last_used[row] = self._clock
+
+    def _ensure_writable_locked(self, dim: int):
+        """第一次写入时确定维度；从磁盘加载的只读映射复制成可写矩阵"""
+        np = _np()
+        if self._dim is None:
+            self._dim = dim
+            self._vectors = np.zeros((0, dim), dtype=np.float32)
+        if dim != self._dim:
+            raise ValueError(f"向量维度 {dim} 与索引的维度 {self._dim} 不一致")
+        if not self._vectors.flags.writeable:
+            self._vectors = np.array(self._vectors[:self._size], dtype=np.float32)
+
+    def _allocate_row_locked(self) -> int:
+        """分配一行：容量不足时按倍数扩容，达到上限时复用最久未命中的行"""
+        np = _np()
+        if self._size >= self.max_entries:
+            row = int(np.argmin(self._last_used[:self._size]))
+            del self._rows_by_key[self._entries[row]['key']]
+            self._stats['evictions'] += 1
+            return row
+        if self._size == len(self._vectors):
+            capacity = min(self.max_entries, max(64, self._size * 2))
+            vectors = np.zeros((capacity, self._dim), dtype=np.float32)
+            vectors[:self._size] = self._vectors[:self._size]
+            self._vectors = vectors
+            self._scope_ids = np.resize(self._scope_ids, capacity)
+            self._last_used = np.resize(self._last_used, capacity)
+        self._entries.append(None)
+        self._size += 1
+        return self._size - 1
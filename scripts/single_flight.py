@@ -0,0 +1,144 @@
+"""
+请求合并（single-flight）- 相同的请求同时在途时只发一次上游调用
+
+多个 worker 同时请求同一段文本时，每个 worker 都会发出一模一样的 generateContent。
+SingleFlight 让第一个调用方（leader）真正执行，同一时刻到达的相同请求（follower）
+等待 leader 的结果，成功时拿到同一个结果，失败时收到同一个异常。
+调用完成后立即移除，之后的请求会重新发起（持久复用交给 response_cache）。
+
+- SingleFlight：线程版，共享客户端在 generateContent 路径中使用
+- AsyncSingleFlight：asyncio 版，AsyncGeminiClient 在占用线程池之前先合并
+
+使用方法：
+    from single_flight import SingleFlight
+    flight = SingleFlight()
+    result, shared = flight.do(key, lambda: client.post(...))
+    flight.stats()    # {'calls': 10, 'upstream': 1, 'coalesced': 9}
+"""
+
+import threading
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+if TYPE_CHECKING:
+    import asyncio
+
+
+class _Call:
+    """一次在途的上游调用"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    线程安全的请求合并
+
+    stats() 中 upstream 是实际执行的次数，coalesced 是节省下来的上游调用次数。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._stats = {'calls': 0, 'upstream': 0, 'coalesced': 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        执行 fn()，相同 key 的调用已在途时等待它的结果
+
+        Args:
+            key: 请求的唯一标识（例如 response_cache.make_key 的返回值）
+            fn: 实际的上游调用
+
+        Returns:
+            (结果, 是否为共享的结果)；共享结果与 leader 是同一个对象
+
+        Raises:
+            fn() 抛出的异常（follower 收到与 leader 相同的异常）
+        """
+        with self._lock:
+            self._stats['calls'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._stats['upstream'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
+
+
+class AsyncSingleFlight:
+    """
+    asyncio 版请求合并，可以同时在多个事件循环中使用
+
+    上游调用在独立的任务中执行，某个调用方被取消不会影响其他等待者。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Tuple['asyncio.AbstractEventLoop', Hashable], 'asyncio.Task'] = {}
+        self._stats = {'calls': 0, 'upstream': 0, 'coalesced': 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        执行 await fn()，相同 key 的调用已在途时等待它的结果
+
+        Args:
+            key: 请求的唯一标识
+            fn: 返回协程的上游调用
+
+        Returns:
+            (结果, 是否为共享的结果)
+        """
+        # asyncio 导入约 30ms，线程版的调用方（共享客户端）不需要它
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        entry = (loop, key)
+        with self._lock:
+            self._stats['calls'] += 1
+            task = self._calls.get(entry)
+            shared = task is not None
+            if shared:
+                self._stats['coalesced'] += 1
+            else:
+                task = loop.create_task(fn())
+                self._calls[entry] = task
+                self._stats['upstream'] += 1
+                task.add_done_callback(lambda done: self._finish(entry, done))
+        return await asyncio.shield(task), shared
+
+    def _finish(self, entry, task: 'asyncio.Task'):
+        with self._lock:
+            self._calls.pop(entry, None)
+        # 所有等待者都被取消时没有人读取异常，这里读取一次避免 "never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
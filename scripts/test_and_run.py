@@ -68,49 +68,33 @@ def test_gemini():
     print("=" * 60)
     
     try:
-        from google.oauth2 import service_account
-        import google.auth.transport.requests
-        import requests
-        
-        key_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
+        import credentials_provider
+        from token_cache import get_token_cache
+        from gemini_http import get_default_client, API_VERSION, build_payload, extract_text
+        from model_router import DEFAULT_MODEL, fixed_model
         
         print("\n1. 加载服务账号凭证...")
-        credentials = service_account.Credentials.from_service_account_file(
-            key_path,
-            scopes=['https://www.googleapis.com/auth/generative-language']
-        )
-        print("   ✓ 凭证加载成功")
+        credentials = credentials_provider.get_credentials()
+        print(f"   ✓ 凭证加载成功（{credentials_provider.credentials_source()}）")
         
         print("\n2. 获取访问令牌...")
-        request = google.auth.transport.requests.Request()
-        credentials.refresh(request)
-        access_token = credentials.token
+        access_token = get_token_cache(credentials).get_token()
         print("   ✓ 令牌获取成功")
         
         print("\n3. 调用 Gemini API...")
-        # 使用正确的模型名称（从可用模型列表中选择）
-        url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
-        
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
+        # 环境测试固定调用一个具体模型（GEMINI_MODEL=auto 时用快速模型）
+        client = get_default_client()
+        model = fixed_model(DEFAULT_MODEL)
+        url = client.url(f"{API_VERSION}/models/{model}:generateContent")
         
         print(f"   使用端点: {url}")
         project_id = credentials.project_id if hasattr(credentials, 'project_id') else None
         if project_id:
             print(f"   项目ID: {project_id}")
-        payload = {
-            "contents": [{
-                "parts": [{"text": "请用一句话说'你好'并介绍一下你自己"}]
-            }]
-        }
-        
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
+        payload = build_payload("请用一句话说'你好'并介绍一下你自己")
         
-        result = response.json()
-        reply = result['candidates'][0]['content']['parts'][0]['text']
+        result = client.generate_content(model, payload, access_token, timeout=30)
+        reply = extract_text(result)
         
         print("   ✓ API 调用成功！\n")
         print("-" * 60)
@@ -0,0 +1,323 @@
+"""
+访问令牌缓存 - 在所有服务账号调用路径之间共享 OAuth 令牌
+
+每次调用都执行 credentials.refresh() 会多一次到令牌端点的往返。
+这个模块把令牌缓存到临近过期为止：
+1. 令牌有效期内直接复用（命中）
+2. 进入提前刷新窗口后，在后台线程中刷新，调用方继续使用旧令牌
+3. 已过期或不存在时才同步刷新（未命中），并发调用只会触发一次刷新
+4. 可选持久化到本地文件，短时运行的 CLI 可以跳过令牌签发
+
+使用方法：
+    from token_cache import get_access_token
+    token = get_access_token(credentials)
+
+持久化文件可以通过参数或环境变量 GEMINI_TOKEN_CACHE_FILE 指定。
+"""
+
+import os
+import json
+import time
+import threading
+import weakref
+from datetime import timezone
+from typing import Optional
+
+import tracing
+
+# 距离过期不足该秒数时视为不可用，必须同步刷新
+DEFAULT_REFRESH_MARGIN = 60
+# 距离过期不足该秒数时在后台提前刷新
+DEFAULT_REFRESH_AHEAD = 300
+# 凭证没有给出过期时间时的假定有效期
+DEFAULT_TOKEN_LIFETIME = 3600
+
+
+def _credentials_key(credentials) -> Optional[str]:
+    """
+    生成凭证的缓存键（服务账号邮箱 + scopes），同一账号的不同凭证对象共享令牌
+
+    没有服务账号邮箱的凭证没有稳定标识，返回 None
+    """
+    email = getattr(credentials, 'service_account_email', None)
+    if not email:
+        return None
+    scopes = getattr(credentials, 'scopes', None) or []
+    return f"{email}|{' '.join(sorted(scopes))}"
+
+
+def _expiry_timestamp(credentials) -> float:
+    """把凭证的 expiry（UTC naive datetime）转换为时间戳"""
+    expiry = getattr(credentials, 'expiry', None)
+    if expiry is None:
+        return time.time() + DEFAULT_TOKEN_LIFETIME
+    if expiry.tzinfo is None:
+        expiry = expiry.replace(tzinfo=timezone.utc)
+    return expiry.timestamp()
+
+
+class TokenCache:
+    """
+    线程安全的访问令牌缓存
+
+    Args:
+        credentials: google-auth 凭证对象
+        refresh_margin: 距离过期不足该秒数时同步刷新
+        refresh_ahead: 距离过期不足该秒数时后台提前刷新
+        cache_file: 可选的持久化文件路径
+    """
+
+    def __init__(
+        self,
+        credentials,
+        refresh_margin: float = DEFAULT_REFRESH_MARGIN,
+        refresh_ahead: float = DEFAULT_REFRESH_AHEAD,
+        cache_file: Optional[str] = None
+    ):
+        self.credentials = credentials
+        self.refresh_margin = refresh_margin
+        self.refresh_ahead = max(refresh_ahead, refresh_margin)
+        key = _credentials_key(credentials)
+        # 没有稳定标识的凭证只在本进程内缓存，不写入持久化文件
+        self.key = key or f"{credentials.__class__.__name__}@{id(self):x}"
+        self.cache_file = cache_file if key else None
+
+        self._lock = threading.Lock()
+        # 保证同一时刻只有一个线程在签发令牌
+        self._refresh_lock = threading.Lock()
+        self._token: Optional[str] = None
+        self._expiry = 0.0
+        self._lifetime = float(DEFAULT_TOKEN_LIFETIME)
+        self._file_checked = False
+        self._background: Optional[threading.Thread] = None
+
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'background_refreshes': 0,
+            'file_hits': 0,
+            'errors': 0,
+        }
+
+    def get_token(self) -> str:
+        """
+        获取访问令牌
+
+        Returns:
+            str: 有效的访问令牌
+        """
+        with tracing.span('get_access_token') as span:
+            with self._lock:
+                if self._is_fresh(time.time()):
+                    self._stats['hits'] += 1
+                    self._maybe_refresh_in_background()
+                    span.set_attribute('token.cache', 'hit')
+                    return self._token
+                self._stats['misses'] += 1
+            span.set_attribute('token.cache', 'miss')
+            return self._get_token_slow()
+
+    def _get_token_slow(self) -> str:
+        """未命中时的路径：读持久化文件或签发新令牌"""
+
+        with self._refresh_lock:
+            # 等待锁期间其他线程可能已经刷新完毕
+            with self._lock:
+                if self._is_fresh(time.time()):
+                    return self._token
+                if not self._file_checked:
+                    self._file_checked = True
+                    if self._load_from_file() and self._is_fresh(time.time()):
+                        self._stats['file_hits'] += 1
+                        return self._token
+            self._refresh()
+            with self._lock:
+                return self._token
+
+    def invalidate(self):
+        """丢弃当前令牌（例如服务端返回 401 时），下次调用会重新签发"""
+        with self._lock:
+            self._token = None
+            self._expiry = 0.0
+
+    def stats(self) -> dict:
+        """返回命中 / 未命中 / 刷新次数统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['expires_in'] = max(0.0, self._expiry - time.time()) if self._token else 0.0
+        return stats
+
+    def _is_fresh(self, now: float) -> bool:
+        return self._token is not None and now < self._expiry - self.refresh_margin
+
+    def _ahead_window(self) -> float:
+        """提前刷新窗口，不超过令牌有效期的一半，避免短期令牌每次命中都触发刷新"""
+        return min(self.refresh_ahead, max(self.refresh_margin, self._lifetime / 2))
+
+    def _maybe_refresh_in_background(self):
+        """令牌进入提前刷新窗口时启动后台刷新（调用方需持有 self._lock）"""
+        if time.time() < self._expiry - self._ahead_window():
+            return
+        if self._background is not None and self._background.is_alive():
+            return
+        self._background = threading.Thread(
+            target=self._background_refresh,
+            name='token-cache-refresh',
+            daemon=True
+        )
+        self._background.start()
+
+    def _background_refresh(self):
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                if time.time() < self._expiry - self._ahead_window():
+                    return
+            self._refresh(background=True)
+        except Exception:
+            # 旧令牌仍然有效，失败时保留旧令牌，等下次同步刷新
+            pass
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh(self, background: bool = False):
+        """签发新令牌（调用方需持有 self._refresh_lock）"""
+        try:
+            with tracing.span('token.refresh', background=background):
+                # google.auth 的 HTTP 传输依赖 requests，只在真正签发令牌时导入
+                import google.auth.transport.requests
+
+                request = google.auth.transport.requests.Request()
+                self.credentials.refresh(request)
+        except Exception:
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+
+        with self._lock:
+            self._token = self.credentials.token
+            self._expiry = _expiry_timestamp(self.credentials)
+            self._lifetime = max(0.0, self._expiry - time.time())
+            self._stats['refreshes'] += 1
+            if background:
+                self._stats['background_refreshes'] += 1
+        self._save_to_file()
+
+    def _load_from_file(self) -> bool:
+        """从持久化文件读取令牌（调用方需持有 self._lock）"""
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return False
+        try:
+            with open(self.cache_file, 'r') as f:
+                entry = json.load(f).get(self.key)
+        except (OSError, ValueError):
+            return False
+        if not entry:
+            return False
+        self._token = entry['token']
+        self._expiry = float(entry['expiry'])
+        return True
+
+    def _save_to_file(self):
+        """把令牌写入持久化文件（原子替换，权限 600）"""
+        if not self.cache_file:
+            return
+        with self._lock:
+            token, expiry = self._token, self._expiry
+        try:
+            data = {}
+            if os.path.exists(self.cache_file):
+                with open(self.cache_file, 'r') as f:
+                    data = json.load(f)
+            data[self.key] = {'token': token, 'expiry': expiry}
+
+            directory = os.path.dirname(os.path.abspath(self.cache_file))
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.cache_file}.{os.getpid()}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.cache_file)
+        except (OSError, ValueError):
+            # 持久化只是优化，失败不影响调用
+            with self._lock:
+                self._stats['errors'] += 1
+
+
+_caches = {}
+# 没有稳定标识的凭证按对象本身缓存，凭证对象被回收后条目随之消失
+_object_caches = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+
+def get_token_cache(credentials, cache_file: Optional[str] = None, **kwargs) -> TokenCache:
+    """
+    获取凭证对应的共享令牌缓存（按服务账号复用同一个缓存）
+
+    Args:
+        credentials: google-auth 凭证对象
+        cache_file: 持久化文件路径，默认读取 GEMINI_TOKEN_CACHE_FILE 环境变量
+        **kwargs: 传给 TokenCache 的其他参数
+
+    Returns:
+        TokenCache: 共享的令牌缓存
+    """
+    key = _credentials_key(credentials)
+    with _caches_lock:
+        if key is None:
+            cache = _object_caches.get(credentials)
+            if cache is None:
+                # 缓存只持有凭证的弱代理，否则条目会让凭证对象永远无法回收
+                cache = TokenCache(weakref.proxy(credentials), **kwargs)
+                _object_caches[credentials] = cache
+            return cache
+        cache = _caches.get(key)
+        if cache is None:
+            cache = TokenCache(
+                credentials,
+                cache_file=cache_file or os.getenv('GEMINI_TOKEN_CACHE_FILE'),
+                **kwargs
+            )
+            _caches[key] = cache
+        return cache
+
+
+def get_access_token(credentials) -> str:
+    """
+    从共享缓存中获取访问令牌
+
+    Args:
+        credentials: google-auth 凭证对象
+
+    Returns:
+        str: 访问令牌
+    """
+    return get_token_cache(credentials).get_token()
+
+
+def token_cache_stats() -> dict:
+    """返回所有令牌缓存的统计信息，按缓存键分组"""
+    with _caches_lock:
+        caches = list(_caches.values()) + list(_object_caches.values())
+    return {cache.key: cache.stats() for cache in caches}
+
+
+def discard_token_cache(credentials):
+    """丢弃某个凭证的共享令牌缓存（例如密钥文件被替换后）"""
+    key = _credentials_key(credentials)
+    with _caches_lock:
+        if key is None:
+            _object_caches.pop(credentials, None)
+            return
+        cache = _caches.get(key)
+        if cache is not None and cache.credentials is credentials:
+            del _caches[cache.key]
+
+
+def reset_token_caches():
+    """丢弃所有共享令牌缓存（不删除持久化文件），下次调用会重新签发令牌"""
+    with _caches_lock:
+        _caches.clear()
+        _object_caches.clear()
@@ -0,0 +1,354 @@
+"""
+调用链路追踪 - 为每次调用的各个阶段记录 span
+
+每条调用路径都被拆成以下阶段：
+- load_credentials：读取并解析密钥文件
+- get_access_token：从令牌缓存取令牌（必要时签发，子 span token.refresh）
+- rate_limit.acquire：等待限流额度
+- http.request：HTTP 往返
+- parse_response：解析 JSON 响应
+
+默认不安装导出器，span() 返回一个共享的空对象，开销只是一次函数调用。
+设置导出器后，span 结束时交给导出器：
+- JsonLinesExporter：每行一个 span 的 JSON
+- OtlpExporter：OpenTelemetry OTLP/JSON 格式，写入文件或发到 OTLP/HTTP 端点（如 collector 的 4318 端口）
+
+使用方法：
+    import tracing
+    tracing.set_exporter(tracing.JsonLinesExporter("traces.jsonl"))
+
+    with tracing.span("my_stage", model="gemini-2.5-flash") as s:
+        ...
+        s.set_attribute("http.status_code", 200)
+
+也可以通过环境变量启用：
+    GEMINI_TRACE_FILE=traces.jsonl        # 写入文件
+    GEMINI_TRACE_FORMAT=otlp              # 文件格式：jsonl（默认）或 otlp
+    GEMINI_OTLP_ENDPOINT=http://127.0.0.1:4318/v1/traces   # 直接发到 OTLP/HTTP 端点
+"""
+
+import os
+import json
+import time
+import atexit
+import random
+import threading
+import functools
+import contextvars
+from typing import Callable, List, Optional
+
+SERVICE_NAME = "gemini-scripts"
+
+_current_span = contextvars.ContextVar('gemini_current_span', default=None)
+
+
+class Span:
+    """
+    一个已开始的 span，作为上下文管理器使用，退出时结束并导出
+
+    Args:
+        name: 阶段名称
+        attributes: 初始属性
+    """
+
+    def __init__(self, name: str, attributes: Optional[dict] = None):
+        parent = _current_span.get()
+        self.name = name
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.status = 'ok'
+        self.error: Optional[str] = None
+        self.start_ns = 0
+        self.duration_ns = 0
+        self._perf_start = 0
+        self._token = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.start_ns = time.time_ns()
+        self._perf_start = time.perf_counter_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration_ns = time.perf_counter_ns() - self._perf_start
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.status = 'error'
+            self.error = f"{exc_type.__name__}: {exc}"
+        exporter = _exporter
+        if exporter is not None:
+            exporter.export(self)
+        return False
+
+    @property
+    def duration(self) -> float:
+        """耗时（秒）"""
+        return self.duration_ns / 1e9
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start_ns': self.start_ns,
+            'duration_ms': round(self.duration_ns / 1e6, 3),
+            'status': self.status,
+            'error': self.error,
+            'attributes': self.attributes,
+        }
+
+
+class _NoopSpan:
+    """未启用追踪时使用的空 span"""
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **attributes):
+    """
+    开始一个 span（用作 with 语句）
+
+    Args:
+        name: 阶段名称
+        **attributes: span 属性
+
+    Returns:
+        Span: 未启用追踪时返回共享的空 span
+    """
+    if _exporter is None:
+        return _NOOP_SPAN
+    return Span(name, attributes)
+
+
+def traced(name: Optional[str] = None):
+    """
+    装饰器：把整个函数调用记录为一个 span，默认以函数名命名
+
+    使用方法：
+        @traced("load_credentials")
+        def load_credentials(): ...
+    """
+    def decorator(fn: Callable):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _exporter is None:
+                return fn(*args, **kwargs)
+            with Span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span():
+    """当前上下文中的 span（未启用追踪或不在 span 内时返回空 span）"""
+    return _current_span.get() or _NOOP_SPAN
+
+
+class InMemoryExporter:
+    """把结束的 span 保存在内存列表中（基准测试与排查用）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans: List[Span] = []
+
+    def export(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def drain(self) -> List[Span]:
+        """取出并清空已收集的 span"""
+        with self._lock:
+            spans, self.spans = self.spans, []
+        return spans
+
+    def shutdown(self):
+        pass
+
+
+class JsonLinesExporter:
+    """
+    每行一个 span 的 JSON 文件
+
+    Args:
+        path: 输出文件路径（追加写入）
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + '\n')
+
+    def shutdown(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_span(span: Span) -> dict:
+    data = {
+        'traceId': span.trace_id,
+        'spanId': span.span_id,
+        'name': span.name,
+        # SPAN_KIND_CLIENT 用于 HTTP 往返，其余为 INTERNAL
+        'kind': 3 if span.name == 'http.request' else 1,
+        'startTimeUnixNano': str(span.start_ns),
+        'endTimeUnixNano': str(span.start_ns + span.duration_ns),
+        'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in span.attributes.items()],
+        'status': {'code': 2, 'message': span.error} if span.status == 'error' else {'code': 1},
+    }
+    if span.parent_id:
+        data['parentSpanId'] = span.parent_id
+    return data
+
+
+class OtlpExporter:
+    """
+    OpenTelemetry OTLP/JSON 导出器，按批写出
+
+    文件输出与 collector 的 otlpjsonfile 接收器兼容（每行一个 ExportTraceServiceRequest）；
+    指定 endpoint 时以 OTLP/HTTP JSON 发送到 collector。
+
+    Args:
+        path: 输出文件路径（与 endpoint 二选一）
+        endpoint: OTLP/HTTP 端点，例如 http://127.0.0.1:4318/v1/traces
+        batch_size: 累积多少个 span 写出一次
+        service_name: resource 的 service.name
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        endpoint: Optional[str] = None,
+        batch_size: int = 64,
+        service_name: str = SERVICE_NAME
+    ):
+        if not path and not endpoint:
+            raise ValueError("OtlpExporter 需要 path 或 endpoint")
+        self.path = path
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.service_name = service_name
+        self._lock = threading.Lock()
+        self._buffer: List[Span] = []
+        self._session = None
+
+    def export(self, span: Span):
+        with self._lock:
+            self._buffer.append(span)
+            if len(self._buffer) < self.batch_size:
+                return
+            batch, self._buffer = self._buffer, []
+        self._write(batch)
+
+    def flush(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if batch:
+            self._write(batch)
+
+    def shutdown(self):
+        self.flush()
+        if self._session is not None:
+            self._session.close()
+
+    def _write(self, batch: List[Span]):
+        request = {
+            'resourceSpans': [{
+                'resource': {'attributes': [
+                    {'key': 'service.name', 'value': {'stringValue': self.service_name}}
+                ]},
+                'scopeSpans': [{
+                    'scope': {'name': 'gemini_scripts.tracing'},
+                    'spans': [_otlp_span(span) for span in batch],
+                }],
+            }]
+        }
+        if self.endpoint:
+            try:
+                if self._session is None:
+                    import requests
+                    self._session = requests.Session()
+                self._session.post(self.endpoint, json=request, timeout=5)
+            except Exception:
+                # 追踪数据丢失不应影响调用本身
+                pass
+        else:
+            line = json.dumps(request, ensure_ascii=False, default=str)
+            with self._lock:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+
+
+_exporter = None
+
+
+def set_exporter(exporter):
+    """
+    安装导出器（None 表示关闭追踪）
+
+    Returns:
+        旧的导出器（不会被关闭，临时替换后可以再装回去）
+    """
+    global _exporter
+    previous, _exporter = _exporter, exporter
+    return previous
+
+
+def get_exporter():
+    return _exporter
+
+
+def _exporter_from_env():
+    endpoint = os.getenv('GEMINI_OTLP_ENDPOINT')
+    if endpoint:
+        return OtlpExporter(endpoint=endpoint)
+    path = os.getenv('GEMINI_TRACE_FILE')
+    if not path:
+        return None
+    if os.getenv('GEMINI_TRACE_FORMAT', 'jsonl').lower() == 'otlp':
+        return OtlpExporter(path=path)
+    return JsonLinesExporter(path)
+
+
+def _shutdown():
+    if _exporter is not None:
+        _exporter.shutdown()
+
+
+_exporter = _exporter_from_env()
+atexit.register(_shutdown)
@@ -0,0 +1,291 @@
+"""
+读取 content/*.ts 中的数据 - 离线生成管线与前端共用同一份内容
+
+content 目录下的问题、原型和情境都是 TS 对象字面量。这里实现一个只覆盖这些文件所用语法的小解析器
+（对象 / 数组 / 字符串 / 数字 / true / false / null、单双引号和不含插值的模板字符串、注释、尾随逗号），
+把 `export const 名称 ... = 字面量` 读成 Python 的 dict / list，不需要 Node 环境。
+
+to_ts_literal 做相反的事，把生成的内容写回同样风格的 TS 字面量。
+
+同时移植了 content/modules.ts 中的 calculateArchetype，两边的规则必须保持一致。
+
+使用方法：
+    from ts_content import load_modules, load_archetypes, calculate_archetype
+    modules = load_modules()
+    archetype_id = calculate_archetype(modules["hesitation"], ["h1a", "h2b"])
+"""
+
+import os
+import re
+from typing import Dict, List, Optional, Sequence
+
+CONTENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'content')
+
+_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', 'v': '\v', '0': '\0'}
+_IDENTIFIER = re.compile(r'[A-Za-z_$][A-Za-z0-9_$]*')
+_NUMBER = re.compile(r'-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?')
+
+
+class TsParseError(ValueError):
+    """字面量不在支持的语法范围内"""
+
+
+class _Parser:
+    def __init__(self, text: str, pos: int = 0):
+        self.text = text
+        self.pos = pos
+
+    def error(self, message: str) -> TsParseError:
+        line = self.text.count('\n', 0, self.pos) + 1
+        return TsParseError(f"第 {line} 行: {message}")
+
+    def skip(self):
+        """跳过空白和注释"""
+        text = self.text
+        while self.pos < len(text):
+            ch = text[self.pos]
+            if ch.isspace():
+                self.pos += 1
+            elif text.startswith('//', self.pos):
+                end = text.find('\n', self.pos)
+                self.pos = len(text) if end < 0 else end + 1
+            elif text.startswith('/*', self.pos):
+                end = text.find('*/', self.pos + 2)
+                if end < 0:
+                    raise self.error("注释没有结束")
+                self.pos = end + 2
+            else:
+                return
+
+    def peek(self) -> str:
+        self.skip()
+        return self.text[self.pos] if self.pos < len(self.text) else ''
+
+    def expect(self, ch: str):
+        if self.peek() != ch:
+            raise self.error(f"应为 {ch!r}，实际为 {self.peek()!r}")
+        self.pos += 1
+
+    def value(self):
+        ch = self.peek()
+        if ch == '{':
+            return self.object()
+        if ch == '[':
+            return self.array()
+        if ch in '\'"`':
+            return self.string()
+        match = _NUMBER.match(self.text, self.pos)
+        if match:
+            self.pos = match.end()
+            number = match.group()
+            return float(number) if any(c in number for c in '.eE') else int(number)
+        match = _IDENTIFIER.match(self.text, self.pos)
+        if match and match.group() in ('true', 'false', 'null'):
+            self.pos = match.end()
+            return {'true': True, 'false': False, 'null': None}[match.group()]
+        raise self.error(f"不支持的表达式: {self.text[self.pos:self.pos + 20]!r}")
+
+    def object(self) -> dict:
+        self.expect('{')
+        result = {}
+        while self.peek() != '}':
+            ch = self.peek()
+            if ch in '\'"':
+                key = self.string()
+            else:
+                match = _IDENTIFIER.match(self.text, self.pos)
+                if not match:
+                    raise self.error("对象键必须是标识符或字符串")
+                key = match.group()
+                self.pos = match.end()
+            self.expect(':')
+            result[key] = self.value()
+            if self.peek() == ',':
+                self.pos += 1
+            elif self.peek() != '}':
+                raise self.error("对象成员之间缺少逗号")
+        self.pos += 1
+        return result
+
+    def array(self) -> list:
+        self.expect('[')
+        result = []
+        while self.peek() != ']':
+            result.append(self.value())
+            if self.peek() == ',':
+                self.pos += 1
+            elif self.peek() != ']':
+                raise self.error("数组元素之间缺少逗号")
+        self.pos += 1
+        return result
+
+    def string(self) -> str:
+        quote = self.text[self.pos]
+        self.pos += 1
+        chars = []
+        text = self.text
+        while True:
+            if self.pos >= len(text):
+                raise self.error("字符串没有结束")
+            ch = text[self.pos]
+            if ch == quote:
+                self.pos += 1
+                return ''.join(chars)
+            if ch == '\\':
+                escaped = text[self.pos + 1]
+                if escaped == 'u':
+                    chars.append(chr(int(text[self.pos + 2:self.pos + 6], 16)))
+                    self.pos += 6
+                    continue
+                if escaped == '\n':
+                    # 行尾的反斜杠是续行，不产生字符
+                    self.pos += 2
+                    continue
+                chars.append(_ESCAPES.get(escaped, escaped))
+                self.pos += 2
+                continue
+            if quote == '`' and text.startswith('${', self.pos):
+                raise self.error("不支持模板字符串插值")
+            if ch == '\n' and quote != '`':
+                raise self.error("字符串中出现换行")
+            chars.append(ch)
+            self.pos += 1
+
+
+def parse_ts_literal(text: str):
+    """
+    解析单个 TS 字面量
+
+    Raises:
+        TsParseError: 语法不受支持
+    """
+    parser = _Parser(text)
+    value = parser.value()
+    if parser.peek() not in ('', ';'):
+        raise parser.error("字面量之后还有多余内容")
+    return value
+
+
+def load_export(path: str, name: str):
+    """
+    读取 TS 文件中 `export const 名称 = 字面量` 的值
+
+    Args:
+        path: TS 文件路径
+        name: 导出的常量名
+
+    Returns:
+        dict / list / str ...
+
+    Raises:
+        TsParseError: 没有找到该导出，或字面量语法不受支持
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    match = re.search(rf'export\s+const\s+{re.escape(name)}\b[^=]*=', text)
+    if not match:
+        raise TsParseError(f"{path} 中没有 export const {name}")
+    return _Parser(text, match.end()).value()
+
+
+def _ts_string(text: str) -> str:
+    escaped = text.replace('\\', '\\\\').replace("'", "\\'").replace('\n', '\\n').replace('\r', '\\r')
+    return f"'{escaped}'"
+
+
+def _is_scalar(value) -> bool:
+    return value is None or isinstance(value, (str, bool, int, float))
+
+
+def to_ts_literal(value, indent: int = 0) -> str:
+    """
+    把 dict / list / 标量写成与 content/*.ts 相同风格的 TS 字面量（单引号、两空格缩进）
+
+    只含标量的数组和只有一个标量成员的对象写在一行内，例如
+    `forbidden: ['别怕', '勇敢一点']`、`{ text: '...' }`。
+
+    Args:
+        value: 要写出的值
+        indent: 当前缩进的空格数
+
+    Returns:
+        str: TS 字面量
+    """
+    if isinstance(value, str):
+        return _ts_string(value)
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return repr(value)
+
+    pad = ' ' * (indent + 2)
+    if isinstance(value, list):
+        if all(_is_scalar(item) for item in value):
+            return '[' + ', '.join(to_ts_literal(item) for item in value) + ']'
+        items = [pad + to_ts_literal(item, indent + 2) for item in value]
+        return '[\n' + ',\n'.join(items) + '\n' + ' ' * indent + ']'
+    if isinstance(value, dict):
+        members = [
+            f"{key if _IDENTIFIER.fullmatch(key) else _ts_string(key)}: {to_ts_literal(item, indent + 2)}"
+            for key, item in value.items()
+        ]
+        if len(members) == 1 and _is_scalar(next(iter(value.values()))):
+            return '{ ' + members[0] + ' }'
+        return '{\n' + ',\n'.join(pad + member for member in members) + '\n' + ' ' * indent + '}'
+    raise TypeError(f"无法写成 TS 字面量: {type(value).__name__}")
+
+
+def content_path(filename: str, content_dir: Optional[str] = None) -> str:
+    return os.path.normpath(os.path.join(content_dir or CONTENT_DIR, filename))
+
+
+def load_modules(content_dir: Optional[str] = None) -> Dict[str, dict]:
+    """content/modules.ts 中的 modules"""
+    return load_export(content_path('modules.ts', content_dir), 'modules')
+
+
+def load_archetypes(content_dir: Optional[str] = None) -> Dict[str, dict]:
+    """content/archetypes.ts 中的 archetypes（包含旧 ID 的兼容映射）"""
+    return load_export(content_path('archetypes.ts', content_dir), 'archetypes')
+
+
+def calculate_archetype(module: dict, option_ids: Sequence[str]) -> str:
+    """
+    与 content/modules.ts 中 calculateArchetype 相同的规则：
+    统计每个原型的命中次数，取最多的；平局时按模块的 tiebreaker 顺序
+
+    Args:
+        module: load_modules() 中的一个模块
+        option_ids: 每道题选中的选项 ID（按题目顺序）
+
+    Returns:
+        str: 原型 ID（可能是 carrier 等旧 ID，前端用同一个 ID 查 archetypes）
+    """
+    options = {
+        option['id']: option['archetype']
+        for question in module['questions']
+        for option in question['options']
+    }
+    # dict 保持插入顺序，与 JS 中 Object.entries 的遍历顺序一致
+    hits: Dict[str, int] = {}
+    for option_id in option_ids:
+        archetype = options.get(option_id)
+        if archetype is not None:
+            hits[archetype] = hits.get(archetype, 0) + 1
+
+    max_hits = 0
+    top: List[str] = []
+    for archetype, count in hits.items():
+        if count > max_hits:
+            max_hits, top = count, [archetype]
+        elif count == max_hits:
+            top.append(archetype)
+
+    if len(top) == 1:
+        return top[0]
+    for archetype in module['tiebreaker']:
+        if archetype in top:
+            return archetype
+    return module['tiebreaker'][0] if module['tiebreaker'] else 'carrier'
@@ -0,0 +1,364 @@
+"""
+用量统计 - 按模型和调用方标签汇总 usageMetadata 中的 token 数与估算费用
+
+调用路径原先只取 candidates[0] 的文本，响应中的 usageMetadata 被丢弃，
+看不到 token 消耗，也不知道哪类提示最贵。共享客户端在每次上游调用完成后把用量交给 UsageMeter：
+- 按 (模型, 标签) 累加请求数、promptTokenCount、candidatesTokenCount、totalTokenCount
+  （以及 cachedContentTokenCount / thoughtsTokenCount）
+- 按价格表估算费用（美元 / 百万 token，思考 token 按输出计价）
+- 导出为 JSON（snapshot）或 Prometheus 文本格式（to_prometheus）
+
+记录一次用量只是在锁内更新几个整数，开销可以忽略。
+缓存命中和合并掉的请求没有上游调用，不计入用量。
+
+标签标识调用方（例如 precompute、gateway），可以按调用传入，也可以用上下文设置：
+    with usage_tag("precompute"):
+        client.generate_content(...)
+
+可选的预算（UsageBudget）在达到 token / 费用上限后拒绝请求（BudgetExceededError），
+或者等待到下一个统计窗口。预算按已完成请求的实际用量判断，同时在途的请求可能略微超出上限。
+
+使用方法：
+    from gemini_http import get_default_client
+    meter = get_default_client().usage_meter
+    print(meter.snapshot())       # JSON
+    print(meter.to_prometheus())  # Prometheus 文本格式
+
+环境变量：
+    GEMINI_USAGE_METER=0                 # 关闭用量统计
+    GEMINI_USAGE_FILE=usage.json         # 进程退出时写出（.prom 结尾写 Prometheus 文本格式）
+    GEMINI_PRICES='{"my-model": [0.5, 1.5]}'   # 覆盖 / 补充价格表（输入, 输出）
+    GEMINI_TOKEN_BUDGET=1000000          # token 上限
+    GEMINI_COST_BUDGET=5                 # 费用上限（美元）
+    GEMINI_BUDGET_WINDOW=86400           # 统计窗口（秒），不设置时为整个进程
+    GEMINI_BUDGET_MODE=delay             # reject（默认）或 delay（等到下一个窗口，需要设置窗口）
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+DEFAULT_TAG = 'default'
+
+# 美元 / 百万 token：(输入, 输出)。价格会调整，以官方价格页为准，可用 GEMINI_PRICES 覆盖
+DEFAULT_PRICES: Dict[str, Tuple[float, float]] = {
+    'gemini-2.5-pro': (1.25, 10.0),
+    'gemini-2.5-flash': (0.30, 2.50),
+    'gemini-2.5-flash-lite': (0.10, 0.40),
+    'gemini-1.5-pro': (1.25, 5.0),
+    'gemini-1.5-flash': (0.075, 0.30),
+    'gemini-pro': (0.50, 1.50),
+}
+
+# usageMetadata 字段 -> 统计字段
+USAGE_FIELDS = (
+    ('promptTokenCount', 'prompt_tokens'),
+    ('candidatesTokenCount', 'candidates_tokens'),
+    ('totalTokenCount', 'total_tokens'),
+    ('cachedContentTokenCount', 'cached_tokens'),
+    ('thoughtsTokenCount', 'thoughts_tokens'),
+)
+
+BUDGET_MODES = ('reject', 'delay')
+
+_current_tag = contextvars.ContextVar('gemini_usage_tag', default=DEFAULT_TAG)
+
+
+@contextmanager
+def usage_tag(tag: str):
+    """在 with 块内发出的请求使用该标签（未显式传入 tag 时）"""
+    token = _current_tag.set(tag)
+    try:
+        yield
+    finally:
+        _current_tag.reset(token)
+
+
+def current_tag() -> str:
+    return _current_tag.get()
+
+
+class BudgetExceededError(Exception):
+    """已达到用量预算的上限"""
+
+
+class UsageBudget:
+    """
+    token / 费用预算
+
+    Args:
+        max_tokens: 窗口内的 totalTokenCount 上限
+        max_cost: 窗口内的估算费用上限（美元）
+        window: 统计窗口（秒），None 表示不重置
+        mode: reject 直接抛出 BudgetExceededError；delay 等到下一个窗口（需要设置 window）
+        max_delay: delay 模式下最长等待的秒数，超过后仍然抛出
+    """
+
+    def __init__(
+        self,
+        max_tokens: Optional[int] = None,
+        max_cost: Optional[float] = None,
+        window: Optional[float] = None,
+        mode: str = 'reject',
+        max_delay: float = 3600.0
+    ):
+        if mode not in BUDGET_MODES:
+            raise ValueError(f"未知的预算模式: {mode}（可选 {', '.join(BUDGET_MODES)}）")
+        if mode == 'delay' and not window:
+            raise ValueError("delay 模式需要设置统计窗口")
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.window = window
+        self.mode = mode
+        self.max_delay = max_delay
+
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._tokens = 0
+        self._cost = 0.0
+        self._stats = {'rejected': 0, 'delayed': 0, 'delay_seconds': 0.0}
+
+    def _roll(self, now: float):
+        if self.window and now - self._window_start >= self.window:
+            elapsed_windows = int((now - self._window_start) // self.window)
+            self._window_start += elapsed_windows * self.window
+            self._tokens = 0
+            self._cost = 0.0
+
+    def _exceeded(self) -> bool:
+        return (
+            (self.max_tokens is not None and self._tokens >= self.max_tokens)
+            or (self.max_cost is not None and self._cost >= self.max_cost)
+        )
+
+    def acquire(self):
+        """
+        发请求前检查预算
+
+        Raises:
+            BudgetExceededError: 已达上限（reject 模式，或 delay 模式等待超过 max_delay）
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._roll(now)
+                if not self._exceeded():
+                    if waited:
+                        self._stats['delayed'] += 1
+                        self._stats['delay_seconds'] += waited
+                    return
+                wait = self._window_start + self.window - now if self.window else None
+                if self.mode == 'reject' or wait is None or waited + wait > self.max_delay:
+                    self._stats['rejected'] += 1
+                    raise BudgetExceededError(
+                        f"已达到用量预算: {self._tokens} tokens / ${self._cost:.4f}"
+                        + (f"，{wait:.0f}s 后重置" if wait is not None else '')
+                    )
+            time.sleep(wait)
+            waited += wait
+
+    def charge(self, tokens: int, cost: float):
+        with self._lock:
+            self._roll(time.monotonic())
+            self._tokens += tokens
+            self._cost += cost
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._roll(time.monotonic())
+            return dict(
+                self._stats,
+                mode=self.mode,
+                window=self.window,
+                tokens=self._tokens,
+                cost=round(self._cost, 6),
+                max_tokens=self.max_tokens,
+                max_cost=self.max_cost,
+            )
+
+
+def _new_counters() -> dict:
+    counters = {'requests': 0, 'cost': 0.0}
+    counters.update((field, 0) for _, field in USAGE_FIELDS)
+    return counters
+
+
+class UsageMeter:
+    """
+    线程安全的用量汇总
+
+    Args:
+        prices: 价格表 {模型: (输入, 输出)}（美元 / 百万 token），默认 DEFAULT_PRICES
+        budget: 可选的 UsageBudget
+    """
+
+    def __init__(self, prices: Optional[Dict[str, Tuple[float, float]]] = None, budget: Optional[UsageBudget] = None):
+        self.prices = dict(DEFAULT_PRICES if prices is None else prices)
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._usage: Dict[Tuple[str, str], dict] = {}
+        self._started = time.time()
+
+    def price_of(self, model: str) -> Optional[Tuple[float, float]]:
+        """模型的价格；带版本后缀的模型（如 gemini-2.5-flash-001）按最长的前缀匹配"""
+        if model in self.prices:
+            return self.prices[model]
+        matches = [name for name in self.prices if model.startswith(name)]
+        return self.prices[max(matches, key=len)] if matches else None
+
+    def check(self):
+        """发请求前检查预算（没有预算时什么都不做）"""
+        if self.budget is not None:
+            self.budget.acquire()
+
+    def record(self, model: str, usage: Optional[dict], tag: Optional[str] = None) -> float:
+        """
+        记录一次上游调用的用量
+
+        Args:
+            model: 模型名称
+            usage: 响应中的 usageMetadata（没有时只计请求数）
+            tag: 调用方标签，默认取 usage_tag() 设置的标签
+
+        Returns:
+            float: 本次调用的估算费用（美元）
+        """
+        usage = usage or {}
+        values = {field: int(usage.get(key) or 0) for key, field in USAGE_FIELDS}
+        if not values['total_tokens']:
+            values['total_tokens'] = values['prompt_tokens'] + values['candidates_tokens'] + values['thoughts_tokens']
+        price = self.price_of(model)
+        cost = 0.0
+        if price is not None:
+            output = values['candidates_tokens'] + values['thoughts_tokens']
+            cost = (values['prompt_tokens'] * price[0] + output * price[1]) / 1_000_000
+
+        key = (model, tag or current_tag())
+        with self._lock:
+            counters = self._usage.get(key)
+            if counters is None:
+                counters = self._usage[key] = _new_counters()
+            counters['requests'] += 1
+            counters['cost'] += cost
+            for field, value in values.items():
+                counters[field] += value
+        if self.budget is not None:
+            self.budget.charge(values['total_tokens'], cost)
+        return cost
+
+    def snapshot(self) -> dict:
+        """
+        Returns:
+            dict: {'since': 开始时间, 'totals': {...}, 'models': {模型: {标签: {...}}}, 'budget': {...}}
+        """
+        with self._lock:
+            usage = {key: dict(counters) for key, counters in self._usage.items()}
+        totals = _new_counters()
+        models: Dict[str, Dict[str, dict]] = {}
+        for (model, tag), counters in sorted(usage.items()):
+            for field, value in counters.items():
+                totals[field] += value
+            counters['cost'] = round(counters['cost'], 6)
+            models.setdefault(model, {})[tag] = counters
+        totals['cost'] = round(totals['cost'], 6)
+        data = {'since': self._started, 'totals': totals, 'models': models}
+        if self.budget is not None:
+            data['budget'] = self.budget.stats()
+        return data
+
+    def to_prometheus(self, prefix: str = 'gemini') -> str:
+        """Prometheus 文本格式（计数器，标签为 model / tag）"""
+        with self._lock:
+            usage = sorted((key, dict(counters)) for key, counters in self._usage.items())
+        metrics = [('requests', 'requests_total', "上游 generateContent 调用次数")]
+        metrics += [(field, f"{field}_total", f"usageMetadata 中的 {key}") for key, field in USAGE_FIELDS]
+        metrics.append(('cost', 'cost_usd_total', "按价格表估算的费用（美元）"))
+
+        lines = []
+        for field, name, help_text in metrics:
+            metric = f"{prefix}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for (model, tag), counters in usage:
+                labels = f'model="{_escape_label(model)}",tag="{_escape_label(tag)}"'
+                value = counters[field]
+                lines.append(f"{metric}{{{labels}}} {round(value, 6) if isinstance(value, float) else value}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str):
+        """写出到文件：.prom 结尾为 Prometheus 文本格式，其余为 JSON"""
+        if path.endswith('.prom'):
+            text = self.to_prometheus()
+        else:
+            text = json.dumps(self.snapshot(), ensure_ascii=False, indent=2) + '\n'
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def reset(self):
+        with self._lock:
+            self._usage.clear()
+            self._started = time.time()
+
+
+def format_summary(meter: UsageMeter, tag: Optional[str] = None) -> str:
+    """
+    一行用量摘要，供 CLI 结束时打印
+
+    Args:
+        meter: UsageMeter
+        tag: 只统计该标签，None 表示全部
+    """
+    totals = _new_counters()
+    for model_usage in meter.snapshot()['models'].values():
+        for name, counters in model_usage.items():
+            if tag is None or name == tag:
+                for field, value in counters.items():
+                    totals[field] += value
+    return (
+        f"{totals['requests']} 次调用，输入 {totals['prompt_tokens']} / 输出 {totals['candidates_tokens']} / "
+        f"合计 {totals['total_tokens']} tokens，约 ${totals['cost']:.4f}"
+    )
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def meter_from_env() -> Optional[UsageMeter]:
+    """
+    按环境变量创建 UsageMeter（共享客户端使用）
+
+    Returns:
+        UsageMeter: GEMINI_USAGE_METER=0 时返回 None
+    """
+    if os.getenv('GEMINI_USAGE_METER', '1') == '0':
+        return None
+    prices = dict(DEFAULT_PRICES)
+    if os.getenv('GEMINI_PRICES'):
+        prices.update({model: tuple(price) for model, price in json.loads(os.environ['GEMINI_PRICES']).items()})
+
+    budget = None
+    max_tokens = os.getenv('GEMINI_TOKEN_BUDGET')
+    max_cost = os.getenv('GEMINI_COST_BUDGET')
+    if max_tokens or max_cost:
+        window = os.getenv('GEMINI_BUDGET_WINDOW')
+        budget = UsageBudget(
+            max_tokens=int(max_tokens) if max_tokens else None,
+            max_cost=float(max_cost) if max_cost else None,
+            window=float(window) if window else None,
+            mode=os.getenv('GEMINI_BUDGET_MODE', 'reject')
+        )
+
+    meter = UsageMeter(prices, budget)
+    usage_file = os.getenv('GEMINI_USAGE_FILE')
+    if usage_file:
+        atexit.register(meter.write, usage_file)
+    return meter